@@ -1,42 +1,16 @@
 from PyQt5.QtWidgets import QApplication
-from datetime import datetime
 import qdarkstyle
 import sys
-import os
-import logging
-import json
+import threading
 
 from src.gui import MainUi
-from src.constants import BASE_PATH
+from src.settings import load_settings, setup_logging
+from src.workers import warm_up
 
 
 def setup():
-    with open(os.path.join(BASE_PATH, "fb_config.json"), "r") as f:
-        settings = json.load(f)
-
-    logging_settings = settings["logging"]
-    logging.root.handlers = []
-    handlers = []
-
-    if logging_settings["streamToConsole"]:
-        handlers.append(logging.StreamHandler())
-    if logging_settings["saveLogs"]:
-        handlers.append(
-            logging.FileHandler(
-                os.path.join(
-                    BASE_PATH,
-                    "logs",
-                    f'log_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.txt',
-                )
-            )
-        )
-
-    logging.basicConfig(
-        level=logging_settings["level"],
-        format=logging_settings["format"],
-        handlers=handlers,
-    )
-
+    settings = load_settings()
+    setup_logging(settings)
     return settings
 
 
@@ -51,6 +25,18 @@ def main():
         lang=settings["defaultLang"],
         request_pause=settings["requestPause"],
         driver=settings["driver"],
+        fetch_backend=settings.get("fetchBackend", "selenium"),
+        http_concurrency=settings.get("httpConcurrency", 8),
+        requests_per_second=settings.get("requestsPerSecond"),
+        request_burst=settings.get("requestBurst", 1),
+        page_cache=settings.get("pageCache"),
+        driver_pool_size=settings.get("driverPoolSize", 1),
+        history_database=settings.get("historyDatabase"),
+        top_layout=settings.get("topLayout", "prepend"),
+        name_cache=settings.get("nameCache"),
+        job_journal=settings.get("jobJournal"),
+        job_orchestrator=settings.get("jobOrchestrator", "sequential"),
+        log_lines=settings.get("logLines", 1000),
     )
     theme = qdarkstyle.load_stylesheet(
         palette=qdarkstyle.dark.palette.DarkPalette
@@ -59,6 +45,8 @@ def main():
     )
     app.setStyleSheet(theme)
     ui.show()
+    # the jobs' modules load in the background while the window is up
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     app.exit(app.exec_())
 
 
@@ -0,0 +1,246 @@
+"""
+Runs the workbook jobs without the gui, ie. as a scheduled task on a server:
+
+    python app/cli.py [workbook] [--no-funds] [--no-rankings] [--no-top50]
+        [--topx 50] [--export] [--resume] [--json] [--at 21:00]
+        [--config <fb_config.json>] [--verbose]
+
+The jobs are the ones of the start button of the app (controller.start, or
+start_async with "jobOrchestrator": "async"), and their progress is written to
+stdout, as json lines with --json. The defaults come from fb_config.json.
+
+With --at, the jobs run every day at that time until the process is stopped, and
+a run that was stopped before it saved the workbook is resumed by the next one.
+Ctrl+C (or SIGTERM) stops the running jobs cleanly, their pages are kept in the
+job journal for --resume.
+
+Exit codes: 0 done, 1 the jobs failed or were stopped, 2 bad arguments,
+3 the web driver did not start, 4 there is no stopped job to resume.
+PyQt5 and qdarkstyle are not imported.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import traceback
+from datetime import datetime, timedelta
+from time import sleep
+
+from src.constants import BASE_PATH
+from src.settings import load_settings, setup_logging
+from src.workers import (
+    ConsoleProgress,
+    EastMoneyFundScraper,
+    FundNameCache,
+    HistoryDatabase,
+    JobJournal,
+    PageCache,
+    ThreadFlag,
+    WorkbookManager,
+    start,
+    start_async,
+)
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+# 2 is the exit code of argparse for bad arguments
+EXIT_DRIVER = 3
+EXIT_NOTHING_TO_RESUME = 4
+
+
+def daily_time(text: str) -> tuple:
+    """'HH:MM' -> (<hour>, <minute>)"""
+    try:
+        at = datetime.strptime(text, "%H:%M")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a time like 21:00")
+    return at.hour, at.minute
+
+
+def next_run(at: tuple, now: datetime = None) -> datetime:
+    """The next time it is at (<hour>, <minute>), today or tomorrow"""
+    now = now or datetime.now()
+    run = now.replace(hour=at[0], minute=at[1], second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    return run
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    # the config file gives the defaults of the other arguments
+    config = argparse.ArgumentParser(add_help=False)
+    config.add_argument("--config", help="the config file, app/fb_config.json")
+    known, _ = config.parse_known_args(argv)
+    settings = load_settings(known.config)
+
+    parser = argparse.ArgumentParser(
+        parents=[config],
+        description="Runs the workbook jobs without the gui.",
+        epilog="Exit codes: 0 done, 1 failed or stopped, 2 bad arguments, "
+        "3 the web driver did not start, 4 no stopped job to resume",
+    )
+    parser.add_argument("workbook", nargs="?", default=settings["defaultWorkbookName"])
+    parser.add_argument(
+        "--funds", action=argparse.BooleanOptionalAction, default=settings["runFunds"]
+    )
+    parser.add_argument(
+        "--rankings",
+        action=argparse.BooleanOptionalAction,
+        default=settings["runRankings"],
+    )
+    parser.add_argument(
+        "--top50", action=argparse.BooleanOptionalAction, default=settings["runTop50"]
+    )
+    parser.add_argument(
+        "--topx",
+        type=int,
+        default=settings["topx"],
+        help="the number of funds of the top50 sheets",
+    )
+    parser.add_argument(
+        "--export",
+        action=argparse.BooleanOptionalAction,
+        default=settings["exportDataAtEnd"],
+        help="export the scraped data at the end",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="continue the last stopped job"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="write the progress as json lines"
+    )
+    parser.add_argument(
+        "--at", type=daily_time, help="run every day at this time (HH:MM)"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="also write the log to the console"
+    )
+    args = parser.parse_args(argv)
+    args.settings = settings
+    return args
+
+
+def scraper_options(settings: dict) -> dict:
+    """The EastMoneyFundScraper arguments of the settings, the same as the gui's"""
+    return {
+        "driver": settings["driver"],
+        "driver_options_arguments": ["--headless"],
+        "request_pause": settings["requestPause"],
+        "random_pauses": False,
+        "fetch_backend": settings.get("fetchBackend", "selenium"),
+        "http_concurrency": settings.get("httpConcurrency", 8),
+        "requests_per_second": settings.get("requestsPerSecond"),
+        "request_burst": settings.get("requestBurst", 1),
+        "page_cache": PageCache.from_settings(settings.get("pageCache"), BASE_PATH),
+        "driver_pool_size": settings.get("driverPoolSize", 1),
+        "history": HistoryDatabase.from_settings(
+            settings.get("historyDatabase"), BASE_PATH
+        ),
+    }
+
+
+def run_jobs(args, progress, run_threads, resume: bool = False) -> int:
+    """Runs the jobs once and returns the exit code"""
+    settings = args.settings
+    journal = JobJournal.from_settings(settings.get("jobJournal"), BASE_PATH)
+    path = os.path.abspath(args.workbook)
+    funds, rankings, top, pn = args.funds, args.rankings, args.top50, args.topx
+
+    if resume:
+        if journal is None or not journal.load():
+            progress.emit("There is no stopped job to resume")
+            return EXIT_NOTHING_TO_RESUME
+        path = journal.workbook
+        funds, rankings, top, pn = (
+            journal.options[key] for key in ("funds", "rankings", "top", "pn")
+        )
+        progress.emit(f"Resuming the workbook jobs on {path}")
+    else:
+        progress.emit(f"Starting the workbook jobs on {path}")
+
+    scraper = EastMoneyFundScraper(**scraper_options(settings))
+    # the browsers are started here, so a missing one is exit code 3
+    if not scraper.start_driver(wait=True):
+        progress.emit("The web driver did not start")
+        return EXIT_DRIVER
+
+    try:
+        workbook_manager = WorkbookManager(
+            path,
+            backup=False,
+            top_layout=settings.get("topLayout", "prepend"),
+            name_cache=FundNameCache.from_settings(
+                settings.get("nameCache"), BASE_PATH
+            ),
+        )
+        job = start_async if settings.get("jobOrchestrator") == "async" else start
+        done = job(
+            scraper,
+            workbook_manager,
+            run_threads,
+            args.export,
+            funds,
+            rankings,
+            top,
+            pn,
+            progress_callback=progress,
+            progress_callback_num=progress.counter,
+            journal=journal,
+            resume=resume,
+        )
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        progress.emit(f"The workbook jobs failed: {e!r}")
+        return EXIT_FAILED
+    finally:
+        scraper.stop_driver()
+
+    return EXIT_OK if done else EXIT_FAILED
+
+
+def run_daily(args, progress, run_threads) -> int:
+    """Runs the jobs every day at args.at until stopped"""
+    journal = JobJournal.from_settings(args.settings.get("jobJournal"), BASE_PATH)
+    resume = args.resume
+    while run_threads.flag:
+        at = next_run(args.at)
+        progress.emit(f"Next run at {at.isoformat(sep=' ', timespec='minutes')}")
+        while run_threads.flag and datetime.now() < at:
+            sleep(min(30, max(0.1, (at - datetime.now()).total_seconds())))
+        if not run_threads.flag:
+            break
+
+        # a run that was cut short is finished by the next one
+        resume = resume or (journal is not None and journal.resumable())
+        code = run_jobs(args, progress, run_threads, resume=resume)
+        progress.emit(f"The run finished with exit code {code}")
+        resume = False
+    return EXIT_OK
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    setup_logging(args.settings, console=args.verbose)
+    progress = ConsoleProgress(json_lines=args.json)
+    run_threads = ThreadFlag()
+
+    def stop(signum, frame):
+        if not run_threads.flag:
+            raise KeyboardInterrupt
+        logging.info("Program exit")
+        progress.emit(
+            "Stopping: the jobs exit once the current page is done (again to force it)"
+        )
+        run_threads.flag = False
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    if args.at is not None:
+        return run_daily(args, progress, run_threads)
+    return run_jobs(args, progress, run_threads, resume=args.resume)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,9 +11,11 @@ class ThreadWorker(QRunnable):
     :type callback: function
     :param args: Arguments to pass to the callback function
     :param kwargs: Keywords to pass to the callback function
+    :param progress_channel: A ProgressChannel that takes the progress instead of the
+                             progress signals, so the gui can read it once per frame
     '''
 
-    def __init__(self, fn, *args, **kwargs):
+    def __init__(self, fn, *args, progress_channel=None, **kwargs):
         super(ThreadWorker, self).__init__()
         self.fn = fn
         self.args = args
@@ -23,8 +25,12 @@ class ThreadWorker(QRunnable):
         # Add the callback to our kwargs
         # These should be referenced in the function signature of the callback
         # eg. def foo(*args, progress_callback, progress_callback_num)
-        self.kwargs['progress_callback'] = self.signals.progress
-        self.kwargs['progress_callback_num'] = self.signals.progress_num
+        if progress_channel is not None:
+            self.kwargs['progress_callback'] = progress_channel
+            self.kwargs['progress_callback_num'] = progress_channel.counter
+        else:
+            self.kwargs['progress_callback'] = self.signals.progress
+            self.kwargs['progress_callback_num'] = self.signals.progress_num
 
 
     @pyqtSlot()
@@ -2,7 +2,7 @@ import logging
 import json
 import os
 from PyQt5 import QtCore
-from PyQt5.QtCore import QThreadPool
+from PyQt5.QtCore import QThreadPool, QTimer
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import (
     QCheckBox,
@@ -22,28 +22,25 @@ from PyQt5.QtWidgets import (
     QSizePolicy,
     QTabWidget,
     QSpacerItem,
+    QTableWidget,
+    QTableWidgetItem,
+    QHeaderView,
 )
+from .. import workers
 from ..workers import (
-    EastMoneyFundScraper,
-    WorkbookManager,
-    start,
-    buy_funds_from_workbook,
+    PageCache,
+    HistoryDatabase,
+    FundNameCache,
+    JobJournal,
+    ProgressChannel,
+    ThreadFlag,
+    instruments,
 )
 from ..constants import BASE_PATH
 from .ThreadWorker import ThreadWorker
 from .Translator import Translator
 
 
-class ThreadFlag:
-    """
-    Holds a boolean flag that can be used to communicate with worker
-    threads.
-    """
-
-    def __init__(self, initial_flag: bool = True):
-        self.flag = initial_flag
-
-
 class MainUi(QMainWindow):
     """
     Represents the main window for the app
@@ -76,6 +73,17 @@ class MainUi(QMainWindow):
         # Window
         self.setWindowTitle("楚枫基金管家")
         self.defaultWorkbookName = kwargs.get("defaultWorkbookName")
+        self.top_layout = kwargs.get("top_layout", "prepend")
+        self.name_cache = FundNameCache.from_settings(
+            kwargs.get("name_cache"), BASE_PATH
+        )
+        # checkpoints of the running job, for the resume button
+        self.journal = JobJournal.from_settings(kwargs.get("job_journal"), BASE_PATH)
+        # "sequential" runs the jobs one after another (start), "async" runs
+        # their scrapes at the same time (start_async)
+        self.job_orchestrator = kwargs.get("job_orchestrator", "sequential")
+        # lines kept in the log box, older lines are dropped
+        self.log_lines = kwargs.get("log_lines", 1000)
         dimensions = kwargs.get("dimensions")
 
         if kwargs.get("fixed_size"):
@@ -95,15 +103,19 @@ class MainUi(QMainWindow):
             "options_arguments": ["--headless"],
             "request_pause": kwargs.get("request_pause"),
             "random_pauses": False,
+            "fetch_backend": kwargs.get("fetch_backend", "selenium"),
+            "http_concurrency": kwargs.get("http_concurrency", 8),
+            "requests_per_second": kwargs.get("requests_per_second"),
+            "request_burst": kwargs.get("request_burst", 1),
+            "page_cache": PageCache.from_settings(kwargs.get("page_cache"), BASE_PATH),
+            "driver_pool_size": kwargs.get("driver_pool_size", 1),
+            "history": HistoryDatabase.from_settings(
+                kwargs.get("history_database"), BASE_PATH
+            ),
         }
         if kwargs.get("startDriverOnStartup"):
-            self.scraper = EastMoneyFundScraper(
-                driver=kwargs.get("driver"),
-                driver_options_arguments=["--headless"],
-                request_pause=kwargs.get("request_pause"),
-                random_pauses=False,
-            )
-            self.scraper.start_driver()
+            # started once the window is shown, so selenium does not delay it
+            QTimer.singleShot(0, self.start_web_driver)
 
         ###########################################################################
         # Create visuals
@@ -118,11 +130,13 @@ class MainUi(QMainWindow):
         self._createInfoBox()  # lower log box
         self._createSettings()  # settings tab
         self._createBuyTab()  # buy tab
+        self._createStatsTab()  # timings of the last run
 
         self.tabs.addTab(self.display, "Tasks")
         self.tabs.addTab(self.buytab, "Buy Funds")
         # self.tabs.addTab(self.infoTextBox, "Logs")
         self.tabs.addTab(self.settingstab, "Settings")
+        self.tabs.addTab(self.statstab, "Stats")
 
         self.generalLayout.addWidget(self.tabs)
         self.generalLayout.addWidget(self.infoTextBox)
@@ -138,6 +152,14 @@ class MainUi(QMainWindow):
             f"(Init pyqt window) app is running with maximum {self.threadpool.maxThreadCount()} threads"
         )
 
+        ###########################################################################
+        # The jobs report their progress to the channel, and the ui reads it in
+        # one batch per frame instead of handling every message as a signal
+        self.progress_channel = ProgressChannel()
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self._drainProgress)
+        self.progress_timer.start(50)
+
         ###########################################################################
         # Load user settings
         self._loadPreferences()
@@ -174,6 +196,46 @@ class MainUi(QMainWindow):
 
         buy_funds.setLayout(buy_funds_layout)
 
+    def _createStatsTab(self):
+        """The p50/p95/max of every stage of the last run (see instrumentation)"""
+        self.statstab = QWidget()
+        stats_layout = QVBoxLayout()
+
+        self.stats_table = QTableWidget(0, 6, parent=self.statstab)
+        self.stats_table.setHorizontalHeaderLabels(
+            ["Stage", "Count", "p50 (s)", "p95 (s)", "Max (s)", "Total (s)"]
+        )
+        self.stats_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeToContents
+        )
+        self.stats_table.verticalHeader().setVisible(False)
+        self.stats_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        stats_layout.addWidget(self.stats_table)
+
+        self.stats_counters = QLabel(parent=self.statstab)
+        self.stats_counters.setWordWrap(True)
+        stats_layout.addWidget(self.stats_counters)
+
+        refresh = QPushButton("Refresh", parent=self.statstab)
+        refresh.clicked.connect(self._refreshStats)
+        stats_layout.addWidget(refresh)
+
+        self.statstab.setLayout(stats_layout)
+
+    def _refreshStats(self):
+        summary = instruments.summary()
+        stages = summary["stages"]
+        self.stats_table.setRowCount(len(stages))
+        for row, (stage, s) in enumerate(stages.items()):
+            for col, value in enumerate(
+                [stage, s["count"], s["p50"], s["p95"], s["max"], s["total"]]
+            ):
+                self.stats_table.setItem(row, col, QTableWidgetItem(str(value)))
+        self.stats_counters.setText(
+            f"Run started {summary['started']} | "
+            + ", ".join(f"{name}: {n}" for name, n in summary["counters"].items())
+        )
+
     def _createSettings(self):
         t = self.create_t("settings")
         self.settingstab = QWidget()
@@ -342,6 +404,15 @@ class MainUi(QMainWindow):
         self.stop_btn.clicked.connect(self.stop_workers)
         display_layout.addWidget(self.stop_btn, 1)
 
+        # Resume button, continues a job that was stopped (see JobJournal)
+        self.resume_btn = QPushButton(t("Resume"), parent=self.display)
+        self.resume_btn.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Expanding)
+        self.resume_btn.clicked.connect(self.resume_workbook_jobs)
+        self.resume_btn.setEnabled(
+            self.journal is not None and self.journal.resumable()
+        )
+        display_layout.addWidget(self.resume_btn, 1)
+
         # Buy funds
         # t = self.create_t("buy-funds")
         # buy_label = QLabel(t("Buy funds"), parent=self.display)
@@ -437,6 +508,7 @@ class MainUi(QMainWindow):
         self.infoTextBox.resize(1024, 100)
         self.infoTextBox.setFixedHeight(100)
         self.infoTextBox.setReadOnly(True)
+        self.infoTextBox.setMaximumBlockCount(self.log_lines)
         # self.generalLayout.addWidget(self.infoTextBox)
 
     def _createStatus(self):
@@ -447,9 +519,14 @@ class MainUi(QMainWindow):
         self.setStatusBar(self.status)
 
     def _workerDone(self):
+        self._drainProgress()
+        self._refreshStats()
         self.status.showMessage("thread done")
         self.infoTextBox.appendPlainText("worker thread done")
         self.threads_are_running = False
+        self.resume_btn.setEnabled(
+            self.journal is not None and self.journal.resumable()
+        )
 
     def _workerProgress(self, s):
         """
@@ -463,6 +540,23 @@ class MainUi(QMainWindow):
             self.status.showMessage(s)
             self.infoTextBox.appendPlainText(s)
 
+    def _drainProgress(self):
+        """Shows everything the workers reported to the progress channel since the last frame"""
+        batch = self.progress_channel.drain()
+        if batch is None:
+            return
+
+        if batch["label"] is not None:
+            self.plabel_current.setText(batch["label"])
+        if batch["total"] is not None:
+            self.progress_bar.setValue(0)
+            self.progress_bar.setMaximum(batch["total"])
+        if batch["steps"]:
+            self.progress_bar.setValue(self.progress_bar.value() + batch["steps"])
+        if batch["lines"]:
+            self.status.showMessage(batch["status"])
+            self.infoTextBox.appendPlainText("\n".join(batch["lines"]))
+
     def _workerProgressNum(self, n):
         # print(n)
         # print(f'progress bar current: {self.progress_bar.value()}')
@@ -552,27 +646,66 @@ class MainUi(QMainWindow):
 
     def start_workbook_jobs(self):
         """Starts all three workbook jobs (funds, ranking, top)"""
+        self._start_jobs(
+            self.file_path_chosen.text(),
+            self.setting_funds.isChecked(),
+            self.setting_rankings.isChecked(),
+            self.setting_top50.isChecked(),
+            int(self.setting_top50_number.text()),
+        )
+
+    def resume_workbook_jobs(self):
+        """Continues the last job that was stopped before it saved the workbook"""
+        if self.journal is None or not self.journal.load():
+            self.infoTextBox.appendPlainText("There is no stopped job to resume")
+            self.status.showMessage("There is no stopped job to resume")
+            return
+
+        options = self.journal.options
+        self._start_jobs(
+            self.journal.workbook,
+            options["funds"],
+            options["rankings"],
+            options["top"],
+            options["pn"],
+            resume=True,
+        )
+
+    def _start_jobs(self, path, funds, rankings, top, pn, resume=False):
         if self.threads_are_running:
             self.infoTextBox.appendPlainText("There is already a job in progress")
             self.status.showMessage("There is already a job in progress")
         elif hasattr(self, "scraper") and self.scraper.is_on:
-            self.infoTextBox.appendPlainText("Starting all workbook jobs")
+            if resume:
+                self.infoTextBox.appendPlainText(
+                    f"Resuming the workbook jobs on {path}"
+                )
+            else:
+                self.infoTextBox.appendPlainText("Starting all workbook jobs")
             self.status.showMessage("Web scraper starting")
-            self.workbook_manager = WorkbookManager(
-                self.file_path_chosen.text(), backup=False
+            self.workbook_manager = workers.WorkbookManager(
+                path,
+                backup=False,
+                top_layout=self.top_layout,
+                name_cache=self.name_cache,
             )
             self.run_threads.flag = True
 
             worker = ThreadWorker(
-                start,
+                workers.start_async
+                if self.job_orchestrator == "async"
+                else workers.start,
                 self.scraper,
                 self.workbook_manager,
                 self.run_threads,
                 self.setting_export_data.isChecked(),
-                self.setting_funds.isChecked(),
-                self.setting_rankings.isChecked(),
-                self.setting_top50.isChecked(),
-                int(self.setting_top50_number.text()),
+                funds,
+                rankings,
+                top,
+                pn,
+                journal=self.journal,
+                resume=resume,
+                progress_channel=self.progress_channel,
             )
 
             # connect the FINISHED signal
@@ -601,11 +734,18 @@ class MainUi(QMainWindow):
             self.infoTextBox.appendPlainText("The web driver is already on")
             self.status.showMessage("Error starting web driver")
         else:
-            self.scraper = EastMoneyFundScraper(
+            self.scraper = workers.EastMoneyFundScraper(
                 driver=self.scraper_settings["driver"],
                 driver_options_arguments=self.scraper_settings["options_arguments"],
                 request_pause=self.scraper_settings["request_pause"],
                 random_pauses=self.scraper_settings["random_pauses"],
+                fetch_backend=self.scraper_settings["fetch_backend"],
+                http_concurrency=self.scraper_settings["http_concurrency"],
+                requests_per_second=self.scraper_settings["requests_per_second"],
+                request_burst=self.scraper_settings["request_burst"],
+                page_cache=self.scraper_settings["page_cache"],
+                driver_pool_size=self.scraper_settings["driver_pool_size"],
+                history=self.scraper_settings["history"],
             )
             self.infoTextBox.appendPlainText("Started web driver")
             self.status.showMessage("Started web driver")
@@ -636,16 +776,23 @@ class MainUi(QMainWindow):
             self.infoTextBox.appendPlainText("There is already a job in progress")
             self.status.showMessage("Error starting buy funds")
         elif hasattr(self, "scraper") and self.scraper.is_on:
-            self.workbook_manager = WorkbookManager(
+            entries = self._buy_entries()
+            if entries is None:
+                self.infoTextBox.appendPlainText(
+                    "Give one amount and one date, or one for each fund id"
+                )
+                self.status.showMessage("Error starting buy funds")
+                return
+
+            self.workbook_manager = workers.WorkbookManager(
                 self.file_path_chosen.text(), backup=False
             )
 
             worker = ThreadWorker(
-                buy_funds_from_workbook,
+                workers.buy_funds_batch_from_workbook,
                 self.workbook_manager,
-                self.fund_id_box.text(),
-                self.amount_box.text(),
-                self.date_box.text(),
+                entries,
+                progress_channel=self.progress_channel,
             )
 
             # connect the FINISHED signal
@@ -662,6 +809,22 @@ class MainUi(QMainWindow):
             )
             self.status.showMessage("Error starting buy funds")
 
+    def _buy_entries(self):
+        """
+        The (<id>, <amount>, <date>) entries of the buy boxes. Several funds can be
+        bought at once with comma separated ids, and an amount and a date for all
+        of them or for each of them. Returns None if the counts do not match.
+        """
+        ids, amounts, dates = (
+            [a.strip() for a in box.text().split(",")]
+            for box in (self.fund_id_box, self.amount_box, self.date_box)
+        )
+        amounts = amounts * len(ids) if len(amounts) == 1 else amounts
+        dates = dates * len(ids) if len(dates) == 1 else dates
+        if not len(ids) == len(amounts) == len(dates):
+            return None
+        return list(zip(ids, amounts, dates))
+
     def closeEvent(self, event):
         """
         Override the close event to also check if the web driver is still on first.
@@ -0,0 +1,47 @@
+"""
+Loads fb_config.json and sets up the logging, for the gui (app.py) and for the
+headless runs (cli.py). Nothing here imports PyQt5.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+
+from .constants import BASE_PATH
+
+
+def load_settings(path: str = None) -> dict:
+    """The settings of fb_config.json, or of the config file at path"""
+    with open(path or os.path.join(BASE_PATH, "fb_config.json"), "r") as f:
+        return json.load(f)
+
+
+def setup_logging(settings: dict, console: bool = None):
+    """
+    Sets up the logging from the 'logging' section of the settings: to the console
+    and/or to a new log file under logs/. console overrides streamToConsole.
+    """
+    logging_settings = settings["logging"]
+    logging.root.handlers = []
+    handlers = []
+
+    if console is None:
+        console = logging_settings["streamToConsole"]
+    if console:
+        handlers.append(logging.StreamHandler())
+    if logging_settings["saveLogs"]:
+        handlers.append(
+            logging.FileHandler(
+                os.path.join(
+                    BASE_PATH,
+                    "logs",
+                    f'log_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.txt',
+                )
+            )
+        )
+
+    logging.basicConfig(
+        level=logging_settings["level"],
+        format=logging_settings["format"],
+        handlers=handlers,
+    )
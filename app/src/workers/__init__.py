@@ -1,3 +1,82 @@
-from .workbook_manager import WorkbookManager
-from .web_scraper import EastMoneyFundScraper
-from .controller import *
+"""
+The workers of the app: the web scraper, the workbook manager and the jobs.
+
+The names of the package are imported from their modules the first time they are
+used, so importing it does not load selenium, openpyxl, bs4, numpy or requests
+before the window is shown. warm_up loads the heavy modules ahead of their first
+use, ie. from a background thread once the window is up.
+"""
+import importlib
+
+# <name>: the module it is imported from
+_MODULES = {
+    "WorkbookManager": "workbook_manager",
+    "EastMoneyFundScraper": "web_scraper",
+    "PageCache": "page_cache",
+    "FundPriceStore": "price_store",
+    "HistoryDatabase": "history_db",
+    "FundNameCache": "name_cache",
+    "JobJournal": "job_journal",
+    "ConsoleProgress": "progress",
+    "ProgressChannel": "progress",
+    "ProgressEvent": "progress",
+    "Instrumentation": "instrumentation",
+    "instruments": "instrumentation",
+    "ThreadFlag": "thread_flag",
+    "JobOrchestrator": "orchestrator",
+    "start_async": "orchestrator",
+}
+_MODULES.update(
+    (name, "controller")
+    for name in [
+        "read_funds",
+        "read_rankings",
+        "scrape_funds",
+        "scrape_rankings",
+        "pipeline_funds",
+        "write_funds",
+        "write_rankings",
+        "start_funds_job",
+        "start_rankings_job",
+        "start_top_job",
+        "start_rankings_job_thread_worker",
+        "start_funds_job_thread_worker",
+        "start_top_job_thread_worker",
+        "write_stats",
+        "save",
+        "save_page_cache",
+        "TOP50_SHEETS",
+        "top_url",
+        "top_urls",
+        "plan_jobs",
+        "plan_ranking_ids",
+        "fetch_plan",
+        "write_plan",
+        "start",
+        "buy_funds_from_workbook",
+        "buy_funds_batch_from_workbook",
+    ]
+)
+
+# the modules that load the heavy dependencies (and the light ones with them)
+_HEAVY = ["controller", "orchestrator"]
+
+__all__ = sorted(_MODULES) + ["warm_up"]
+
+
+def __getattr__(name: str):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_MODULES[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
+
+
+def warm_up():
+    """Imports the heavy modules of the package, so their first use does not wait."""
+    for module in _HEAVY:
+        importlib.import_module(f".{module}", __name__)
@@ -1,7 +1,13 @@
 import logging
+import queue
+import threading
+import traceback
 from datetime import date, datetime
 from .web_scraper import EastMoneyFundScraper
 from .workbook_manager import WorkbookManager
+from .instrumentation import instruments, span, summary_path
+from .progress import ConsoleProgress
+from .thread_flag import ThreadFlag
 
 # TODO: clean up this file (old code)
 
@@ -36,6 +42,11 @@ def scrape_funds(
     progress_callback_num,
 ) -> None:
     """Perform all web scraping tasks"""
+    scraper.prefetch_pages(
+        [scraper.funds_url(funds_id) for funds_id in missing_funds.keys()],
+        run_threads=run_threads,
+        progress_callback=progress_callback,
+    )
     for funds_id in missing_funds.keys():
         scraper.parse_funding_page(
             funds_id,
@@ -57,14 +68,29 @@ def scrape_rankings(
     run_threads=None,
     progress_callback=None,
     progress_callback_num=None,
+    journal=None,
 ) -> None:
+    scraper.prefetch_pages(
+        [
+            scraper.ranking_url(str(ranking_id if top else ranking_id.value))
+            for ranking_id in ranking_ids
+        ],
+        run_threads=run_threads,
+        progress_callback=progress_callback,
+    )
     if not top:
         for ranking_id in ranking_ids:
-            scraper.parse_ranking_page(
-                str(ranking_id.value),
-                progress_callback=progress_callback,
-                progress_callback_num=progress_callback_num,
-            )
+            if (
+                scraper.parse_ranking_page(
+                    str(ranking_id.value),
+                    progress_callback=progress_callback,
+                    progress_callback_num=progress_callback_num,
+                )
+                and journal is not None
+            ):
+                journal.record_ranking(
+                    ranking_id.value, scraper.data["ranking"][str(ranking_id.value)]
+                )
             if not run_threads.flag:
                 logging.info("Stopping thread")
                 progress_callback.emit("Stopping thread")
@@ -72,11 +98,17 @@ def scrape_rankings(
             progress_callback_num.emit(-1)
     else:
         for ranking_id in ranking_ids:
-            scraper.parse_ranking_page(
-                str(ranking_id),
-                progress_callback=progress_callback,
-                progress_callback_num=progress_callback_num,
-            )
+            if (
+                scraper.parse_ranking_page(
+                    str(ranking_id),
+                    progress_callback=progress_callback,
+                    progress_callback_num=progress_callback_num,
+                )
+                and journal is not None
+            ):
+                journal.record_ranking(
+                    ranking_id, scraper.data["ranking"][str(ranking_id)]
+                )
             if not run_threads.flag:
                 logging.info("Stopping thread")
                 progress_callback.emit("Stopping thread")
@@ -84,6 +116,111 @@ def scrape_rankings(
             progress_callback_num.emit(-1)
 
 
+def pipeline_funds(
+    scraper: EastMoneyFundScraper,
+    workbook_manager: WorkbookManager,
+    to_scrape: dict,
+    run_threads,
+    progress_callback,
+    progress_callback_num,
+    queue_size: int = 16,
+    keep_data: bool = False,
+    journal=None,
+) -> int:
+    """
+    Scrapes the funds and writes each one to the workbook as soon as it is parsed.
+
+    A producer thread loads and parses the pages of to_scrape (missing_funds after
+    load_history) in batches of queue_size, and puts (<id>, <prices>) on a queue of
+    queue_size items; this thread takes them off and writes them. The funds that
+    load_history found up to date are queued first. Each fund is taken out of
+    scraper.data['funds'] when it is queued, so only the queued funds are held in
+    memory, unless keep_data is set (ie. to export the data afterwards).
+    Every parsed page is recorded in the journal, if there is one.
+    Returns the number of funds written.
+    """
+    results = queue.Queue(maxsize=queue_size)
+    writer_done = threading.Event()
+
+    def put(item) -> bool:
+        # a full queue waits for the writer, unless the writer has stopped
+        while not writer_done.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            ids = list(workbook_manager.missing_funds or {})
+            for id in ids:
+                if id not in to_scrape and not put((id, scraper.data["funds"].pop(id))):
+                    return
+
+            ids = [id for id in ids if id in to_scrape]
+            for i in range(0, len(ids), queue_size):
+                batch = ids[i : i + queue_size]
+                scraper.prefetch_pages(
+                    [scraper.funds_url(id) for id in batch],
+                    run_threads=run_threads,
+                    progress_callback=progress_callback,
+                )
+                for id in batch:
+                    if not run_threads.flag:
+                        logging.info("Stopping thread")
+                        progress_callback.emit("Stopping thread")
+                        return
+                    parsed = scraper.parse_funding_page(
+                        id,
+                        progress_callback=progress_callback,
+                        progress_callback_num=progress_callback_num,
+                    )
+                    progress_callback_num.emit(-1)
+                    prices = scraper.data["funds"].pop(id)
+                    if parsed and journal is not None:
+                        journal.record_funds(id, prices.to_dict().get(str(id), {}))
+                    if not put((id, prices)):
+                        return
+        except Exception:
+            logging.error("(Pipeline funds) Failed to scrape the funds")
+            progress_callback.emit("(Pipeline funds) Failed to scrape the funds")
+            logging.error(traceback.format_exc())
+        finally:
+            put(None)
+
+    progress_callback_num.emit(len(to_scrape))
+    progress_callback.emit("PROG:FUNDS SHEET")
+
+    producer = threading.Thread(target=produce, name="funds-producer", daemon=True)
+    producer.start()
+    written, count = 0, 0
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            id, prices = item
+            cells = workbook_manager.write_fund(
+                id, prices, progress_callback=progress_callback
+            )
+            if cells is not False:
+                written += 1
+                count += cells
+            if keep_data:
+                scraper.data["funds"].add(prices)
+    finally:
+        writer_done.set()
+        producer.join()
+
+    logging.info(f"(Pipeline funds) Done writing {count} new cells of {written} funds")
+    progress_callback.emit(
+        f"(Pipeline funds) Done writing {count} new cells of {written} funds"
+    )
+    return written
+
+
 def write_funds(
     workbook_manager: WorkbookManager,
     funds_data: dict,
@@ -123,9 +260,28 @@ def write_rankings(
         )
 
 
-def start_funds_job(excel_file_name: str = "FundsBook.xlsx", data: dict = None) -> None:
+def _console(progress_callback, progress_callback_num, run_threads):
+    """The progress callbacks and flag of a job run outside of the gui"""
+    progress_callback = progress_callback or ConsoleProgress()
+    progress_callback_num = progress_callback_num or progress_callback.counter
+    return progress_callback, progress_callback_num, run_threads or ThreadFlag()
+
+
+def start_funds_job(
+    excel_file_name: str = "FundsBook.xlsx",
+    data: dict = None,
+    progress_callback=None,
+    progress_callback_num=None,
+    run_threads=None,
+) -> None:
 
-    """Starts all tasks in order. Passes the data to the correct functions."""
+    """
+    Starts all tasks in order. Passes the data to the correct functions.
+    The progress is written to the console unless callbacks are given.
+    """
+    progress_callback, progress_callback_num, run_threads = _console(
+        progress_callback, progress_callback_num, run_threads
+    )
 
     logging.info("--- web scraper start")
 
@@ -135,16 +291,33 @@ def start_funds_job(excel_file_name: str = "FundsBook.xlsx", data: dict = None)
     scraper.start_driver()
 
     # read, send missing data to scraper, write new data
-    read_funds(workbook_manager)
+    read_funds(workbook_manager, progress_callback, progress_callback_num)
     if not data:
         scrape_funds(
-            scraper, workbook_manager.missing_funds, workbook_manager.ranking_ids
+            scraper,
+            workbook_manager.missing_funds,
+            workbook_manager.ranking_ids,
+            run_threads,
+            progress_callback,
+            progress_callback_num,
         )
 
     if not data:
-        write_funds(workbook_manager, scraper.data["funds"], scraper.data["ranking"])
+        write_funds(
+            workbook_manager,
+            scraper.data["funds"],
+            scraper.data["ranking"],
+            progress_callback,
+            progress_callback_num,
+        )
     else:
-        write_funds(workbook_manager, data["funds"], data["ranking"])
+        write_funds(
+            workbook_manager,
+            data["funds"],
+            data["ranking"],
+            progress_callback,
+            progress_callback_num,
+        )
 
     # clean up
     scraper.export_data(f"web_scraper_data_{date.today()}_funds.json")
@@ -155,10 +328,20 @@ def start_funds_job(excel_file_name: str = "FundsBook.xlsx", data: dict = None)
 
 
 def start_rankings_job(
-    excel_file_name: str = "FundsBook.xlsx", data: dict = None
+    excel_file_name: str = "FundsBook.xlsx",
+    data: dict = None,
+    progress_callback=None,
+    progress_callback_num=None,
+    run_threads=None,
 ) -> None:
 
-    """Starts all tasks in order. Passes the data to the correct functions."""
+    """
+    Starts all tasks in order. Passes the data to the correct functions.
+    The progress is written to the console unless callbacks are given.
+    """
+    progress_callback, progress_callback_num, run_threads = _console(
+        progress_callback, progress_callback_num, run_threads
+    )
 
     logging.info("--- web scraper start")
 
@@ -168,17 +351,34 @@ def start_rankings_job(
     scraper.start_driver()
 
     # read, send missing data to scraper, write new data
-    read_rankings(workbook_manager)
+    read_rankings(workbook_manager, progress_callback, progress_callback_num)
 
     if not data:
         scrape_rankings(
-            scraper, workbook_manager.missing_funds, workbook_manager.ranking_ids
+            scraper,
+            workbook_manager.missing_funds,
+            workbook_manager.ranking_ids,
+            run_threads=run_threads,
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
         )
 
     if not data:
-        write_rankings(workbook_manager, scraper.data["funds"], scraper.data["ranking"])
+        write_rankings(
+            workbook_manager,
+            scraper.data["funds"],
+            scraper.data["ranking"],
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
+        )
     else:
-        write_rankings(workbook_manager, data["funds"], data["ranking"])
+        write_rankings(
+            workbook_manager,
+            data["funds"],
+            data["ranking"],
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
+        )
 
     # clean up
     if not data:
@@ -197,24 +397,39 @@ def start_top_job(
     hash: str = "tall",
     date_low: str = "20200721",
     date_high: str = "20210721",
+    progress_callback=None,
+    progress_callback_num=None,
+    run_threads=None,
 ) -> None:
 
-    """Starts all tasks in order. Passes the data to the correct functions."""
+    """
+    Starts all tasks in order. Passes the data to the correct functions.
+    The progress is written to the console unless callbacks are given.
+    """
+    progress_callback, progress_callback_num, run_threads = _console(
+        progress_callback, progress_callback_num, run_threads
+    )
 
     logging.info("--- web scraper start")
 
     # init classes
     workbook_manager = WorkbookManager(excel_file_name)
-    scraper = EastMoneyFundScraper(["--headless"])
+    # the top50 pages are loaded more slowly, the http fetcher shares the limiter
+    scraper = EastMoneyFundScraper(["--headless"], requests_per_second=1 / 7)
     scraper.start_driver()
-    scraper.request_pause = 7
 
     # write new data
-    url = f"http://fund.eastmoney.com/data/fundranking.html#{hash};c0;r;sjnzf;pn{pn};ddesc;qsd{date_low};qed{date_high};qdii;zq;gg;gzbd;gzfs;bbzt;sfbb"
+    url = top_url(pn, hash, date_low, date_high)
     if not data:
-        scraper.parse_top(url)
+        scraper.parse_top(url, progress_callback, progress_callback_num)
         scrape_rankings(
-            scraper, {}, ranking_ids=[a[0] for a in scraper.data["top"]], top=True
+            scraper,
+            {},
+            ranking_ids=[a[0] for a in scraper.data["top"]],
+            top=True,
+            run_threads=run_threads,
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
         )
 
     if not data:
@@ -224,10 +439,18 @@ def start_top_job(
             scraper.data["ranking"],
             sheet_name,
             scraper.data["top"],
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
         )
     else:
         write_rankings(
-            workbook_manager, data["funds"], data["ranking"], sheet_name, data["top"]
+            workbook_manager,
+            data["funds"],
+            data["ranking"],
+            sheet_name,
+            data["top"],
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
         )
 
     # clean up
@@ -295,20 +518,14 @@ def start_funds_job_thread_worker(
         progress_callback=progress_callback,
         progress_callback_num=progress_callback_num,
     )
-    scrape_funds(
+    # the funds are written while the next ones are scraped
+    pipeline_funds(
         scraper,
-        workbook_manager.missing_funds,
-        workbook_manager.ranking_ids,
-        run_threads=run_threads,
-        progress_callback=progress_callback,
-        progress_callback_num=progress_callback_num,
-    )
-    if not run_threads.flag:
-        return
-    write_funds(
         workbook_manager,
-        scraper.data["funds"],
-        scraper.data["ranking"],
+        scraper.load_history(
+            workbook_manager.missing_funds, progress_callback=progress_callback
+        ),
+        run_threads=run_threads,
         progress_callback=progress_callback,
         progress_callback_num=progress_callback_num,
     )
@@ -335,7 +552,7 @@ def start_top_job_thread_worker(
     progress_callback.emit("--- web scraper start top")
 
     # write new data
-    url = f"http://fund.eastmoney.com/data/fundranking.html#{hash};c0;r;sjnzf;pn{pn};ddesc;qsd{date_low};qed{date_high};qdii;zq;gg;gzbd;gzfs;bbzt;sfbb"
+    url = top_url(pn, hash, date_low, date_high)
     scraper.parse_top(
         url,
         progress_callback=progress_callback,
@@ -368,78 +585,350 @@ def start_top_job_thread_worker(
     progress_callback.emit("--- web scraper done top")
 
 
+def write_stats(progress_callback) -> dict:
+    """
+    Writes the timings of the run next to the log files (see instrumentation)
+    and shows the slowest stages. Returns the summary.
+    """
+    summary = instruments.write_summary(summary_path(instruments.started))
+    stages = sorted(
+        summary["stages"].items(), key=lambda item: item[1]["total"], reverse=True
+    )
+    for stage, s in stages[:5]:
+        progress_callback.emit(
+            f"[stats] {stage}: {s['count']} x p50 {s['p50']}s p95 {s['p95']}s max {s['max']}s (total {s['total']}s)"
+        )
+    return summary
+
+
+def save_page_cache(scraper):
+    """The page cache writes its index in batches, this writes the rest of the run."""
+    if scraper.page_cache is not None:
+        scraper.page_cache.save()
+
+
 def save(scraper, workbook_manager, progress_callback):
     scraper.export_data(f"web_scraper_data_{date.today()}_all.json")
     progress_callback.emit("saved web scraper data")
 
 
-def start(
+# sheet name and hash tag of the fundranking page for each top50 sheet
+TOP50_SHEETS = [
+    ("top50混合", "thh"),
+    ("top50股票", "tgp"),
+    ("top50指数", "tzs"),
+    ("top50债券", "tzq"),
+    ("top50QDII", "tqdii"),
+]
+
+
+def top_url(pn: int, hash: str, date_low: str, date_high: str) -> str:
+    return f"http://fund.eastmoney.com/data/fundranking.html#{hash};c0;r;sjnzf;pn{pn};ddesc;qsd{date_low};qed{date_high};qdii;zq;gg;gzbd;gzfs;bbzt;sfbb"
+
+
+def top_urls(pn: int) -> dict:
+    """The url of the top pn funds of the past year, for each top50 sheet"""
+    today = datetime.now()
+    one_year_ago = today.replace(year=today.year - 1)
+    return {
+        sheet_name: top_url(
+            pn, hash, one_year_ago.strftime("%Y%m%d"), today.strftime("%Y%m%d")
+        )
+        for sheet_name, hash in TOP50_SHEETS
+    }
+
+
+def plan_jobs(
     scraper,
     workbook_manager,
     run_threads,
-    save_data,
     funds,
     rankings,
     top,
     pn,
     progress_callback,
     progress_callback_num,
-):
+    journal=None,
+) -> dict:
+    """
+    Gathers every id needed by the enabled jobs before anything else is scraped.
+    The top50 sheets that are in the journal are not loaded again.
+
+    The plan is a dictionary with the format:
+        {
+            'funds': <missing_funds>,
+            'ranking_ids': <list_ids>,
+            'top': {<sheet_name>: <list_top>, ...}
+        }
+
+    Where
+        <missing_funds> is the missing_funds data of the workbook manager, without
+            the funds that are up to date in the history database
+            (empty if the funds job is not enabled);
+
+        <list_ids> is a list of the fund ids (str) in the rankings sheet;
+
+        <list_top> is the list of (<id>, <name>) for a top50 sheet, in ranking order.
+    """
+    plan = {"funds": {}, "ranking_ids": [], "top": {}}
+
+    if funds:  # holding funds with missing daily prices in sheet 基金日记
+        read_funds(
+            workbook_manager,
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
+        )
+        # the funds that are up to date in the history database are not scraped again
+        plan["funds"] = scraper.load_history(
+            workbook_manager.missing_funds or {}, progress_callback=progress_callback
+        )
+
+    if rankings:  # holding funds in sheet 基金排队
+        read_rankings(
+            workbook_manager,
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
+        )
+        plan["ranking_ids"] = [
+            str(cell.value) for cell in workbook_manager.ranking_ids or []
+        ]
 
-    if funds:  # update all holding fund's daily prices in sheet 基金日记
-        start_funds_job_thread_worker(
+    if top:  # top funds of the 5 categories in sheets top50混合, top50股票 etc
+        urls = top_urls(pn)
+        if journal is not None:
+            for sheet_name in list(urls):
+                if sheet_name in journal.top:
+                    plan["top"][sheet_name] = journal.top[sheet_name]
+                    urls.pop(sheet_name)
+
+        # with more than one webdriver session the top pages load in parallel
+        scraper.prefetch_pages(
+            list(urls.values()),
+            run_threads=run_threads,
+            progress_callback=progress_callback,
+        )
+
+        for sheet_name, url in urls.items():
+            if not run_threads.flag:
+                break
+            progress_callback.emit(f"PROG:TOP50 SHEET {sheet_name}")
+            scraper.data["top"] = []
+            if scraper.parse_top(
+                url,
+                progress_callback=progress_callback,
+                progress_callback_num=progress_callback_num,
+            ):
+                if journal is not None:
+                    journal.record_sheet(sheet_name, scraper.data["top"])
+                plan["top"][sheet_name] = scraper.data["top"]
+            else:
+                # an empty list would write the sheet as 基金排队, it is left as it is
+                logging.warning(f"[plan] {sheet_name} is not written, its page failed")
+                progress_callback.emit(
+                    f"[plan] {sheet_name} is not written, its page failed"
+                )
+            scraper.data["top"] = []
+
+    return plan
+
+
+def plan_ranking_ids(plan: dict) -> list:
+    """All of the ranking ids in the plan, each one only once (in order of appearance)."""
+    ids = dict.fromkeys(plan["ranking_ids"])
+    for top_ids in plan["top"].values():
+        ids.update(dict.fromkeys(str(a[0]) for a in top_ids))
+    return list(ids)
+
+
+def fetch_plan(
+    scraper,
+    plan: dict,
+    run_threads,
+    progress_callback,
+    progress_callback_num,
+    journal=None,
+) -> None:
+    """
+    Scrapes every page needed by the plan exactly once into scraper.data.
+    The ranking pages that are in the journal are not loaded again.
+    """
+    if plan["funds"]:
+        progress_callback_num.emit(len(plan["funds"]))
+        progress_callback.emit("PROG:FUNDS SHEET")
+        scrape_funds(
             scraper,
+            plan["funds"],
+            [],
+            run_threads=run_threads,
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
+        )
+        if not run_threads.flag:
+            return
+
+    ranking_ids = plan_ranking_ids(plan)
+    duplicates = len(plan["ranking_ids"]) + sum(len(a) for a in plan["top"].values())
+    duplicates -= len(ranking_ids)
+    if journal is not None and journal.ranking:
+        ranking_ids = [id for id in ranking_ids if id not in journal.ranking]
+        logging.info(
+            f"[journal] {len(journal.ranking)} ranking pages were fetched before the job stopped"
+        )
+        progress_callback.emit(
+            f"[journal] {len(journal.ranking)} ranking pages were fetched before the job stopped"
+        )
+    logging.info(
+        f"[plan] {len(ranking_ids)} ranking pages to fetch ({duplicates} duplicates skipped)"
+    )
+    progress_callback.emit(
+        f"[plan] {len(ranking_ids)} ranking pages to fetch ({duplicates} duplicates skipped)"
+    )
+
+    progress_callback_num.emit(len(ranking_ids))
+    progress_callback.emit("PROG: RANKINGS")
+    scrape_rankings(
+        scraper,
+        {},
+        ranking_ids,
+        top=True,
+        run_threads=run_threads,
+        progress_callback=progress_callback,
+        progress_callback_num=progress_callback_num,
+        journal=journal,
+    )
+
+
+def write_plan(
+    scraper,
+    workbook_manager,
+    plan: dict,
+    funds,
+    rankings,
+    top,
+    progress_callback,
+    progress_callback_num,
+) -> None:
+    """Every writer reads from the shared scraper.data filled by fetch_plan"""
+    # the top50 pages list the names of their funds, so they need no lookup
+    for top_ids in plan["top"].values():
+        workbook_manager.name_cache.update((a[0], a[1]) for a in top_ids)
+
+    if funds:
+        write_funds(
             workbook_manager,
-            run_threads,
-            progress_callback,
-            progress_callback_num,
+            scraper.data["funds"],
+            scraper.data["ranking"],
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
+        )
+
+    if rankings:
+        write_rankings(
+            workbook_manager,
+            scraper.data["funds"],
+            scraper.data["ranking"],
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
         )
 
-    if rankings:  # update all holding fund's info in sheet 基金排队
-        start_rankings_job_thread_worker(
+    if top:
+        for sheet_name, top_ids in plan["top"].items():
+            write_rankings(
+                workbook_manager,
+                scraper.data["funds"],
+                scraper.data["ranking"],
+                sheet_name,
+                top_ids.copy(),
+                progress_callback=progress_callback,
+                progress_callback_num=progress_callback_num,
+            )
+
+
+def start(
+    scraper,
+    workbook_manager,
+    run_threads,
+    save_data,
+    funds,
+    rankings,
+    top,
+    pn,
+    progress_callback,
+    progress_callback_num,
+    journal=None,
+    resume=False,
+):
+    """
+    Runs the enabled jobs in three stages:
+        1. plan: read the workbook and the top50 pages to find every id that is needed
+        2. fetch: scrape each funds and ranking page once
+        3. write: update each sheet from the shared results
+    The funds are written while they are fetched (see pipeline_funds).
+
+    With a journal, every top50 sheet and page that is fetched is recorded until the
+    workbook is saved. With resume, the job of the (loaded) journal is continued:
+    what it recorded is not fetched again.
+    """
+    logging.info("--- web scraper start")
+    progress_callback.emit("--- web scraper start")
+    instruments.reset()
+
+    if journal is not None:
+        if resume:
+            journal.restore(scraper)
+            progress_callback.emit(f"[journal] Resuming from {journal}")
+        else:
+            journal.begin(
+                workbook_manager.path,
+                {"funds": funds, "rankings": rankings, "top": top, "pn": pn},
+            )
+
+    with span("job.plan"):
+        plan = plan_jobs(
             scraper,
             workbook_manager,
             run_threads,
+            funds,
+            rankings,
+            top,
+            pn,
             progress_callback,
             progress_callback_num,
+            journal=journal,
         )
 
-    if (
-        top
-    ):  # update top 50 fund's position in reach 5 categories in sheets top50混合, top50股票 etc
-        #
-        top50Name = [
-            ("top50混合", "thh"),
-            ("top50股票", "tgp"),
-            ("top50指数", "tzs"),
-            ("top50债券", "tzq"),
-            ("top50QDII", "tqdii"),
-        ]
-        # top50Name = [('top50混合','thh')]
-        #
-        today = datetime.now()
-        one_year_ago = today.replace(year=today.year - 1)
-
-        for index, tuple in enumerate(top50Name):  # loop through all 5 sheets
-            element_one = tuple[0]  # sheet name
-            element_two = tuple[1]  # hash tag
-            start_top_job_thread_worker(
+    if run_threads.flag and funds:
+        to_scrape = plan["funds"]
+        if journal is not None:
+            # the journaled funds were put back in scraper.data by restore
+            to_scrape = {
+                id: dates
+                for id, dates in to_scrape.items()
+                if str(id) not in journal.funds
+            }
+        with span("job.funds"):
+            pipeline_funds(
                 scraper,
                 workbook_manager,
+                to_scrape,
+                run_threads,
+                progress_callback,
+                progress_callback_num,
+                keep_data=save_data,
+                journal=journal,
+            )
+        plan["funds"] = {}
+
+    if run_threads.flag:
+        with span("job.fetch"):
+            fetch_plan(
+                scraper,
+                plan,
                 run_threads,
                 progress_callback,
                 progress_callback_num,
-                sheet_name=element_one,
-                pn=pn,
-                hash=element_two,
-                date_low=one_year_ago.strftime("%Y%m%d"),
-                date_high=today.strftime("%Y%m%d"),
+                journal=journal,
             )
-            print(scraper.data)
-            scraper.data = {"ranking": {}, "funds": {}, "top": []}
-            workbook_manager.missing_funds = None
-            workbook_manager.ranking_ids = None
-            print()  # print a blank line for reading clarity
 
     if not run_threads.flag:
         logging.info(
@@ -448,12 +937,37 @@ def start(
         progress_callback.emit(
             "The workbook tasks thread was manually stopped and did not finish correctly."
         )
+        if journal is not None:
+            progress_callback.emit(
+                "[journal] The pages fetched so far are kept, resume to continue the job"
+            )
+        save_page_cache(scraper)
+        write_stats(progress_callback)
         return False
 
+    with span("job.write"):
+        write_plan(
+            scraper,
+            workbook_manager,
+            plan,
+            False,  # written by pipeline_funds
+            rankings,
+            top,
+            progress_callback,
+            progress_callback_num,
+        )
+
     if save_data:
         save(scraper, workbook_manager, progress_callback)
 
     workbook_manager.close()
+    if journal is not None:
+        journal.finish()
+    save_page_cache(scraper)
+    write_stats(progress_callback)
+
+    logging.info("--- web scraper done")
+    progress_callback.emit("--- web scraper done")
     return True
 
 
@@ -466,3 +980,15 @@ def buy_funds_from_workbook(
     )
     workbook_manager.close()
     return True
+
+
+def buy_funds_batch_from_workbook(
+    workbook_manager, entries, progress_callback, progress_callback_num
+):
+    """Buys a list of (<id>, <amount>, <date>) entries and saves the workbook once"""
+    logging.info(f"(buy funds) trying to buy {len(entries)} funds {entries}")
+    workbook_manager.buy_funds_batch(
+        entries, sheet="基金日记", progress_callback=progress_callback
+    )
+    workbook_manager.close()
+    return True
@@ -0,0 +1,136 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class DriverPool:
+    """
+    A pool of reusable webdriver sessions.
+
+    Sessions are created by the factory function (which returns a started driver
+    or raises) and are handed out one at a time with lease(). A leased session is
+    health checked first and restarted if its browser went away; if the code using
+    it raises, the session is assumed to be broken and is restarted in the background.
+
+    warm() starts the sessions in background threads so the caller does not block
+    while the browsers start up; lease() waits for the first one to be ready.
+    """
+
+    def __init__(self, factory, size: int = 1):
+        self.factory = factory
+        self.size = max(1, size)
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.live = 0  # sessions that are started (idle or leased)
+        self.starting = 0  # sessions that are being started
+        self.closed = False
+
+    def __str__(self) -> str:
+        return (
+            f"Driver pool | {self.live}/{self.size} sessions, {self.idle.qsize()} idle"
+        )
+
+    def _start_session(self):
+        try:
+            driver = self.factory()
+        except Exception as e:
+            logging.error(e)
+            logging.error("[driver pool] A webdriver session failed to start.")
+            driver = None
+
+        with self.lock:
+            self.starting -= 1
+            if driver is None:
+                return
+            if self.closed:
+                self._quit(driver)
+                return
+            self.live += 1
+        self.idle.put(driver)
+
+    def _spawn(self, background: bool = True):
+        with self.lock:
+            self.starting += 1
+        if background:
+            threading.Thread(target=self._start_session, daemon=True).start()
+        else:
+            self._start_session()
+
+    def warm(self, background: bool = True):
+        """Starts the sessions of the pool, in background threads by default."""
+        with self.lock:
+            missing = self.size - self.live - self.starting
+        for _ in range(missing):
+            self._spawn(background)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def is_healthy(driver) -> bool:
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _retire(self, driver):
+        """Quits a broken session and starts a replacement in the background."""
+        self._quit(driver)
+        with self.lock:
+            self.live -= 1
+            closed = self.closed
+        if not closed:
+            self._spawn()
+
+    def _get_idle(self):
+        while True:
+            with self.lock:
+                if self.closed:
+                    raise RuntimeError("The driver pool is closed")
+                if self.live == 0 and self.starting == 0 and self.idle.empty():
+                    raise RuntimeError("There are no webdriver sessions running")
+            try:
+                return self.idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    @contextmanager
+    def lease(self):
+        """Hands out a healthy session for the duration of the with block."""
+        driver = self._get_idle()
+        while not self.is_healthy(driver):
+            logging.warning("[driver pool] A webdriver session crashed, restarting it")
+            self._retire(driver)
+            driver = self._get_idle()
+
+        try:
+            yield driver
+        except BaseException:
+            self._retire(driver)
+            raise
+        else:
+            if self.closed:
+                self._quit(driver)
+                with self.lock:
+                    self.live -= 1
+            else:
+                self.idle.put(driver)
+
+    def close(self):
+        """Quits every idle session. Leased sessions are quit when they are returned."""
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+            with self.lock:
+                self.live -= 1
@@ -0,0 +1,125 @@
+"""
+Formulas that are tokenized once and then written out for other cells by only
+patching their cell references.
+
+openpyxl's Translator tokenizes the whole formula every time it translates it.
+A FormulaTemplate keeps the tokens, with the references parsed into their
+columns and rows, so writing the formula for another cell only writes its
+references again.
+"""
+import re
+from string import Formatter
+
+from openpyxl.formula.tokenizer import Token, Tokenizer
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+# one end of a reference: a column and/or a row, each absolute if it starts with $
+_END = re.compile(r"(?:(\$?)([A-Za-z]{1,3}))?(?:(\$?)([0-9]+))?")
+
+# from_format fills in its placeholders with rows past the last row of a sheet
+_PLACEHOLDER_ROW = 2**20 + 1
+
+
+def _parse_reference(value: str, placeholders: list):
+    """
+    Parses a range operand (ie. A1, $D$2:$D$51, 基金排队!D$3:AA$200, $1:$1, A:C)
+    into its sheet prefix and a list of its ends, as
+    [<column absolute>, <column>, <row absolute>, <row>, <placeholder>].
+    Returns None for a defined name, which is not moved.
+    """
+    sheet, bang, cells = value.rpartition("!")
+    ends = []
+    for end in cells.split(":"):
+        match = _END.fullmatch(end)
+        if match is None or not (match.group(2) or match.group(4)):
+            return None
+        col_abs, col, row_abs, row = match.groups("")
+        col = column_index_from_string(col.upper()) if col else None
+        row = int(row) if row else None
+        placeholder = None
+        if row is not None and row >= _PLACEHOLDER_ROW:
+            placeholder = placeholders[row - _PLACEHOLDER_ROW]
+        ends.append([col_abs, col, row_abs, row, placeholder])
+
+    # a single end needs both a column and a row (A or 1 alone is a name), and the
+    # ends of a range the same parts
+    kinds = {(end[1] is None, end[3] is None) for end in ends}
+    if len(ends) > 2 or len(kinds) > 1:
+        return None
+    if len(ends) == 1 and True in kinds.pop():
+        return None
+    return sheet + bang, ends
+
+
+class FormulaTemplate:
+    """
+    A formula of the cell at (row, column) that can be written for other cells.
+    The references are moved like Translator moves them: absolute columns and
+    rows ($) stay, the others move with the cell.
+    """
+
+    def __init__(self, formula: str, row: int = 1, column: int = 1, placeholders=()):
+        self.formula = formula
+        self.row = row
+        self.column = column
+
+        # text and references, in formula order
+        self._parts = []
+        text = "=" if formula.startswith("=") else ""
+        for token in Tokenizer(formula).items:
+            if token.type == Token.OPERAND and token.subtype == Token.RANGE:
+                reference = _parse_reference(token.value, placeholders)
+                if reference is not None:
+                    self._parts.append(text)
+                    self._parts.append(reference)
+                    text = ""
+                    continue
+            text += token.value
+        self._parts.append(text)
+
+    @classmethod
+    def from_format(cls, template: str):
+        """
+        Compiles a str.format formula template whose placeholders are rows, like
+        '=INDEX(C{first}:C{last},MATCH(D{row},...))'. Fill them in with fill.
+        """
+        placeholders = list(
+            dict.fromkeys(name for _, name, _, _ in Formatter().parse(template) if name)
+        )
+        rows = {name: _PLACEHOLDER_ROW + i for i, name in enumerate(placeholders)}
+        return cls(template.format(**rows), placeholders=placeholders)
+
+    def translate(self, row_delta: int = 0, col_delta: int = 0, rows: dict = None):
+        """
+        The formula with its references moved by row_delta rows and col_delta
+        columns, and the placeholder rows filled in from rows.
+        """
+        out = []
+        for part in self._parts:
+            if part.__class__ is str:
+                out.append(part)
+                continue
+
+            sheet, ends = part
+            texts = []
+            for col_abs, col, row_abs, row, placeholder in ends:
+                if placeholder is not None:
+                    row = rows[placeholder]
+                elif row is not None and not row_abs:
+                    row += row_delta
+                if col is not None and not col_abs:
+                    col += col_delta
+                texts.append(
+                    (f"{col_abs}{get_column_letter(col)}" if col is not None else "")
+                    + (f"{row_abs}{row}" if row is not None else "")
+                )
+            out.append(sheet + ":".join(texts))
+        return "".join(out)
+
+    def at(self, row: int, column: int) -> str:
+        """The formula written for the cell at (row, column)."""
+        return self.translate(row - self.row, column - self.column)
+
+    def fill(self, **rows) -> str:
+        """The formula of a from_format template with its placeholders filled in."""
+        return self.translate(rows=rows)
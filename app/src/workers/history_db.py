@@ -0,0 +1,136 @@
+import logging
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class HistoryDatabase:
+    """
+    Local SQLite database of everything that was scraped before.
+
+    The nav table keeps the price history of each fund keyed by (fund id, date),
+    and the ranking table keeps one snapshot of a ranking page per (fund id, date)
+    along with when it was scraped. Rows are only ever added (a price scraped again
+    for the same date replaces the old one), so the database grows with the daily
+    delta and lets a run skip every date that is already known.
+    """
+
+    date_pattern = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # the scraper runs in a worker thread, every access goes through the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS nav (
+                    fund_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (fund_id, date)
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS ranking (
+                    fund_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    scraped TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (fund_id, date)
+                ) WITHOUT ROWID;
+                """
+            )
+
+    @classmethod
+    def from_settings(cls, settings: dict, base_path: str):
+        """Creates the database from the 'historyDatabase' section of fb_config.json"""
+        if not settings or not settings.get("enabled", True):
+            return None
+        return cls(os.path.join(base_path, settings.get("path", "history.sqlite3")))
+
+    def __str__(self) -> str:
+        return f"History database | {self.path}"
+
+    def add_prices(self, id: str, prices: dict) -> int:
+        """Adds {<date>: <price>} results of a fund. Returns the number of rows written."""
+        rows = [
+            (str(id), date, str(value))
+            for date, value in prices.items()
+            if self.date_pattern.match(date)
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO nav (fund_id, date, value) VALUES (?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def prices(self, ids: list) -> dict:
+        """Returns the stored history of the funds as {<id>: {<date>: <price>}}"""
+        ids = [str(id) for id in ids]
+        data = {id: {} for id in ids}
+        with self.lock:
+            for id in ids:
+                for date, value in self.connection.execute(
+                    "SELECT date, value FROM nav WHERE fund_id = ? ORDER BY date DESC",
+                    (id,),
+                ):
+                    data[id][date] = value
+        return data
+
+    def latest_dates(self, ids: list) -> dict:
+        """Returns {<id>: <most recent stored date>} for the funds that have any history."""
+        latest = {}
+        with self.lock:
+            for id in ids:
+                row = self.connection.execute(
+                    "SELECT MAX(date) FROM nav WHERE fund_id = ?", (str(id),)
+                ).fetchone()
+                if row[0] is not None:
+                    latest[str(id)] = row[0]
+        return latest
+
+    def add_ranking(self, id: str, ranking: list):
+        """Adds a ranking snapshot ([<date>, <price>, <price change>, ...]) of a fund."""
+        if not ranking:
+            return
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ranking (fund_id, date, scraped, data) VALUES (?, ?, ?, ?)",
+                (
+                    str(id),
+                    ranking[0],
+                    datetime.now().isoformat(timespec="seconds"),
+                    json.dumps(ranking, ensure_ascii=False),
+                ),
+            )
+
+    def ranking(self, id: str, date: str = None) -> list:
+        """Returns the ranking snapshot of a fund for a date (the latest one by default)."""
+        with self.lock:
+            if date is None:
+                row = self.connection.execute(
+                    "SELECT data FROM ranking WHERE fund_id = ? ORDER BY date DESC LIMIT 1",
+                    (str(id),),
+                ).fetchone()
+            else:
+                row = self.connection.execute(
+                    "SELECT data FROM ranking WHERE fund_id = ? AND date = ?",
+                    (str(id), date),
+                ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.close()
+            except sqlite3.Error as e:
+                logging.error(f"[history database] {e}")
@@ -0,0 +1,251 @@
+import logging
+import json
+import re
+from datetime import date
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class EastMoneyHttpFetcher:
+    """
+    Fetches the static EastMoneyFund pages (jjjz_ and jdzf_) over plain HTTP.
+
+    The data on those pages is rendered by javascript from a couple of plain
+    endpoints, so instead of loading the page in a browser the fetcher calls the
+    endpoints directly and rebuilds a small html body that has the same tables
+    the parsers look for (table.lsjz, div#jdzftable). Pages that need a browser
+    (ie. the fundranking page) are not supported and should go through selenium.
+
+    A single pooled requests session is shared by all requests, and fetch_many
+    keeps at most max_concurrency requests in flight. Every request takes a token
+    from the rate_limiter (if given), and timeouts or blocked responses slow it down.
+
+    If a page_cache is given, the raw responses of the endpoints are kept in it:
+    fresh responses are reused without a request, and stale ones are revalidated
+    with their ETag/Last-Modified validators.
+    """
+
+    funds_page = re.compile(r"fundf10\.eastmoney\.com/jjjz_(\w+)\.html")
+    ranking_page = re.compile(r"fundf10\.eastmoney\.com/jdzf_(\w+)\.html")
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        timeout: int = 30,
+        user_agent: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:90.0) Gecko/20100101 Firefox/90.0",
+        rate_limiter=None,
+        page_cache=None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.page_cache = page_cache
+
+        self.base_url_funds_api = "http://api.fund.eastmoney.com/f10/lsjz"
+        self.base_url_ranking_api = (
+            "http://fundf10.eastmoney.com/FundArchivesDatas.aspx"
+        )
+
+        retries = Retry(
+            total=2, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504]
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.max_concurrency,
+            pool_maxsize=self.max_concurrency,
+            max_retries=retries,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {"User-Agent": user_agent, "Referer": "http://fundf10.eastmoney.com/"}
+        )
+
+    def supports(self, url: str) -> bool:
+        return bool(self.funds_page.search(url) or self.ranking_page.search(url))
+
+    def _get_text(self, url: str, params: dict = None, cache_key: str = None) -> str:
+        """
+        The body of the response, from the page cache while it is fresh. It is kept
+        under cache_key (the url by default) with its validators.
+        """
+        url = requests.Request("GET", url, params=params).prepare().url
+        key = cache_key or url
+        headers = {}
+        if self.page_cache is not None:
+            body = self.page_cache.get(key)
+            if body is not None:
+                return body
+            headers = self.page_cache.validators(key)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        try:
+            r = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.exceptions.Timeout:
+            if self.rate_limiter is not None:
+                self.rate_limiter.penalize()
+            raise
+
+        if r.status_code in (403, 429) and self.rate_limiter is not None:
+            self.rate_limiter.penalize()
+
+        if r.status_code == 304 and self.page_cache is not None:
+            body = self.page_cache.revalidated(key)
+            if body is not None:
+                return body
+            # the cached body disappeared, ask again without the validators
+            r = self.session.get(url, timeout=self.timeout)
+        r.raise_for_status()
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.reward()
+
+        body = r.content.decode("utf-8", errors="replace")
+        if self.page_cache is not None:
+            self.page_cache.put(
+                key,
+                body,
+                etag=r.headers.get("ETag"),
+                last_modified=r.headers.get("Last-Modified"),
+            )
+        return body
+
+    def fetch_page(self, url: str) -> str:
+        """
+        Returns an html body for the page url that can be parsed the same way as
+        the page source from the webdriver.
+        """
+        match = self.funds_page.search(url)
+        if match:
+            # funds pages can ask for the prices since a date only (?startDate=YYYY-MM-DD)
+            start_date = parse_qs(urlparse(url).query).get("startDate", [None])[0]
+            return self._fetch_funds_page(match.group(1), start_date)
+
+        match = self.ranking_page.search(url)
+        if match:
+            return self._fetch_ranking_page(url, match.group(1))
+
+        raise ValueError(f"The http fetcher does not support the page {url}")
+
+    @staticmethod
+    def _funds_params(id: str, start_date: str = None) -> dict:
+        params = {"fundCode": id, "pageIndex": 1, "pageSize": 20}
+        if start_date:
+            params["startDate"] = start_date
+            days = (date.today() - date.fromisoformat(start_date)).days + 1
+            params["pageSize"] = max(20, min(days, 366))
+        return params
+
+    def _fetch_funds_page(self, id: str, start_date: str = None) -> str:
+        """
+        Builds the table.lsjz price table from the price history endpoint.
+        With a start_date only the prices from that date on are requested.
+        """
+        body = json.loads(
+            self._get_text(
+                self.base_url_funds_api, params=self._funds_params(id, start_date)
+            )
+        )
+        rows = []
+        for entry in (body.get("Data") or {}).get("LSJZList") or []:
+            rows.append(
+                "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}%</td></tr>".format(
+                    entry.get("FSRQ", ""),
+                    entry.get("DWJZ", ""),
+                    entry.get("LJJZ", ""),
+                    entry.get("JZZZL", ""),
+                )
+            )
+        return f'<html><body><table class="lsjz"><tbody>{"".join(rows)}</tbody></table></body></html>'
+
+    @staticmethod
+    def _ranking_params(id: str) -> dict:
+        return {"type": "jdzf", "code": id}
+
+    def _fetch_ranking_page(self, url: str, id: str) -> str:
+        """
+        The info bar (div.bs_jz) is served with the page itself, but the
+        div#jdzftable contents are filled in from the archives endpoint.
+        """
+        # the raw page has its own key, the url is the one of the page as it is parsed
+        page = self._get_text(url, cache_key=url + "#raw")
+        archive = self._get_text(
+            self.base_url_ranking_api, params=self._ranking_params(id)
+        )
+
+        # the endpoint returns a javascript snippet: var apidata={ content:"<html>"};
+        match = re.search(r'content:"(.*)"\s*}', archive, re.S)
+        content = match.group(1).replace('\\"', '"') if match else ""
+
+        table = re.search(r"<div[^>]*id=[\"']jdzftable[\"'][^>]*>", page)
+        if table:
+            return page[: table.end()] + content + page[table.end() :]
+        return page + f'<div id="jdzftable">{content}</div>'
+
+    def invalidate(self, url: str):
+        """Drops the cached responses the page url is built from, ie. a block page."""
+        if self.page_cache is None:
+            return
+        match = self.funds_page.search(url)
+        if match:
+            start_date = parse_qs(urlparse(url).query).get("startDate", [None])[0]
+            keys = [
+                (
+                    self.base_url_funds_api,
+                    self._funds_params(match.group(1), start_date),
+                )
+            ]
+        else:
+            match = self.ranking_page.search(url)
+            if not match:
+                return
+            keys = [
+                (url + "#raw", None),
+                (self.base_url_ranking_api, self._ranking_params(match.group(1))),
+            ]
+        for key, params in keys:
+            self.page_cache.invalidate(
+                requests.Request("GET", key, params=params).prepare().url
+            )
+
+    def fetch_many(self, urls: list, should_continue=None) -> dict:
+        """
+        Fetches all of the urls concurrently with at most max_concurrency requests
+        in flight. Returns a dictionary of <url>: <html> for every page that was
+        fetched successfully. should_continue is checked before each new request
+        is started; returning False stops the remaining requests.
+        """
+        pages = {}
+        pending = list(urls)
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while pending or in_flight:
+                while (
+                    pending
+                    and len(in_flight) < self.max_concurrency
+                    and (should_continue is None or should_continue())
+                ):
+                    url = pending.pop(0)
+                    in_flight[executor.submit(self.fetch_page, url)] = url
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    try:
+                        pages[url] = future.result()
+                    except Exception as e:
+                        logging.error(f"[http fetch] Failed to fetch {url}: {e}")
+
+        return pages
+
+    def close(self):
+        self.session.close()
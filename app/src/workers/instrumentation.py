@@ -0,0 +1,145 @@
+"""
+Timings of the hot paths of a run: page fetches, rate limit pauses, parsing,
+sheet reads and writes and the workbook save.
+
+    with span("parse.funds"):
+        ...
+
+    @timed("read.funds")
+    def read_funds(self, ...):
+        ...
+
+Every span adds one sample (in seconds) to its stage, and count adds to a counter.
+stats() gives the count, total, p50, p95 and max of every stage, and
+write_summary saves them (ie. next to the log file, see summary_path) at the end
+of a run. The module level functions use the one Instrumentation of the app.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+
+from ..constants import BASE_PATH
+
+
+class Instrumentation:
+    """
+    Thread safe spans and counters. Only the last max_samples samples of a stage
+    are kept for its percentiles; its count and total cover every sample.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Starts a new run."""
+        with self.lock:
+            self.started = datetime.now()
+            self.samples = {}  # <stage>: deque of seconds
+            self.totals = {}  # <stage>: [<count>, <seconds>]
+            self.counters = {}
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.max_samples)
+                self.totals[stage] = [0, 0.0]
+            self.samples[stage].append(seconds)
+            self.totals[stage][0] += 1
+            self.totals[stage][1] += seconds
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def span(self, stage: str):
+        """Times the body of the with statement, also when it raises."""
+        t = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, perf_counter() - t)
+
+    def timed(self, stage: str):
+        """Decorator that times every call of the function as a span of stage."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _percentile(ordered: list, p: float) -> float:
+        # nearest rank
+        return ordered[max(0, min(len(ordered) - 1, round(p * len(ordered)) - 1))]
+
+    def stats(self) -> dict:
+        """
+        {<stage>: {"count", "total", "p50", "p95", "max"}} in seconds, by stage name.
+        """
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+            totals = {stage: list(total) for stage, total in self.totals.items()}
+
+        return {
+            stage: {
+                "count": totals[stage][0],
+                "total": round(totals[stage][1], 4),
+                "p50": round(self._percentile(ordered, 0.5), 4),
+                "p95": round(self._percentile(ordered, 0.95), 4),
+                "max": round(ordered[-1], 4),
+            }
+            for stage, ordered in sorted(samples.items())
+        }
+
+    def summary(self) -> dict:
+        with self.lock:
+            counters = dict(sorted(self.counters.items()))
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "stages": self.stats(),
+            "counters": counters,
+        }
+
+    def write_summary(self, path: str) -> dict:
+        """Writes the summary of the run to path (json) and returns it."""
+        summary = self.summary()
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=4)
+            logging.info(f"[stats] Wrote the timings of the run to {path}")
+        except OSError:
+            logging.warning(f"[stats] Could not write the timings of the run to {path}")
+        return summary
+
+
+def summary_path(started: datetime = None) -> str:
+    """logs/stats_<time>.json, next to the log files of app.py"""
+    started = started or datetime.now()
+    return os.path.join(
+        BASE_PATH, "logs", f'stats_{started.strftime("%Y-%m-%d_%H-%M-%S")}.json'
+    )
+
+
+instruments = Instrumentation()
+record = instruments.record
+count = instruments.count
+span = instruments.span
+timed = instruments.timed
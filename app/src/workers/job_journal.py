@@ -0,0 +1,132 @@
+import logging
+import json
+import os
+import threading
+from datetime import datetime
+
+
+class JobJournal:
+    """
+    Journal of what a job (controller.start) has scraped so far, so a job that was
+    stopped or crashed can be resumed without fetching the same pages again.
+
+    The journal is a json lines file, one record per line, appended as the job goes:
+        {"type": "start", "workbook": <path>, "options": {...}, "time": <iso time>}
+        {"type": "sheet", "sheet": <top50 sheet name>, "top": [[<id>, <name>], ...]}
+        {"type": "funds", "id": <id>, "prices": {<date>: <price>, ...}}
+        {"type": "ranking", "id": <id>, "values": [...]}
+
+    A "sheet" record is the checkpoint of a top50 sheet: its list of funds is known
+    and its page is not loaded again. The journal is removed once the workbook is
+    saved, so a journal on disk is always a job that can be resumed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self._clear()
+
+    @classmethod
+    def from_settings(cls, settings: dict, base_path: str):
+        """Creates the journal from the 'jobJournal' section of fb_config.json"""
+        if not settings or not settings.get("enabled", True):
+            return None
+        return cls(os.path.join(base_path, settings.get("path", "journal.jsonl")))
+
+    def __str__(self) -> str:
+        return (
+            f"Job journal | {self.path} ({len(self.funds)} funds, "
+            f"{len(self.ranking)} ranking pages, {len(self.top)} sheets)"
+        )
+
+    def _clear(self):
+        self.workbook = None
+        self.options = {}
+        self.top = {}  # <sheet name>: [[<id>, <name>], ...]
+        self.funds = {}  # <id>: {<date>: <price>}
+        self.ranking = {}  # <id>: [<values>]
+
+    def resumable(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> bool:
+        """
+        Reads the journal on disk. A line cut off by a crash is skipped.
+        Returns false if there is no journal to resume.
+        """
+        self._clear()
+        if not self.resumable():
+            return False
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning("[journal] Skipped an incomplete record")
+                    continue
+                kind = record.get("type")
+                if kind == "start":
+                    self.workbook = record["workbook"]
+                    self.options = record["options"]
+                elif kind == "sheet":
+                    self.top[record["sheet"]] = record["top"]
+                elif kind == "funds":
+                    self.funds[record["id"]] = record["prices"]
+                elif kind == "ranking":
+                    self.ranking[record["id"]] = record["values"]
+
+        logging.info(f"[journal] Loaded {self}")
+        return self.workbook is not None
+
+    def begin(self, workbook: str, options: dict):
+        """Starts a new journal for a job on workbook, replacing the last one."""
+        self._clear()
+        self.workbook = workbook
+        self.options = options
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock, open(self.path, "w", encoding="utf-8"):
+            pass
+        self._append(
+            {
+                "type": "start",
+                "workbook": workbook,
+                "options": options,
+                "time": datetime.now().isoformat(timespec="seconds"),
+            }
+        )
+
+    def _append(self, record: dict):
+        # one line per record, flushed to disk right away so it survives a crash
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record_sheet(self, sheet: str, top: list):
+        self.top[sheet] = [list(a) for a in top]
+        self._append({"type": "sheet", "sheet": sheet, "top": self.top[sheet]})
+
+    def record_funds(self, id, prices: dict):
+        self.funds[str(id)] = prices
+        self._append({"type": "funds", "id": str(id), "prices": prices})
+
+    def record_ranking(self, id, values: list):
+        self.ranking[str(id)] = values
+        self._append({"type": "ranking", "id": str(id), "values": values})
+
+    def restore(self, scraper):
+        """Puts the journaled pages back into scraper.data"""
+        for id, prices in self.funds.items():
+            scraper.data["funds"].merge(id, prices)
+        scraper.data["ranking"].update(self.ranking)
+        logging.info(f"[journal] Resuming from {self}")
+
+    def finish(self):
+        """Removes the journal once the job is saved."""
+        self._clear()
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
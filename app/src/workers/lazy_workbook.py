@@ -0,0 +1,87 @@
+"""
+Opens a workbook for editing without parsing its worksheets up front.
+
+load_workbook parses the cells of every sheet of the package. LazyWorkbook reads
+the workbook, its shared strings and its styles, and puts an empty placeholder in
+the place of every worksheet. A worksheet is only parsed (with openpyxl's own
+reader) when it is first asked for. Sheets that are never asked for are left as
+they are in the package, which save_changed_sheets copies without reading them.
+"""
+import logging
+from io import BytesIO
+
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.styles.stylesheet import apply_stylesheet
+from openpyxl.worksheet.worksheet import Worksheet
+
+
+class LazyWorkbook:
+    """
+    The workbook of the package at path with its worksheets parsed on demand.
+    Use lazy_workbook[name] (not wb[name]) to get a sheet, and parse_all before
+    saving the whole workbook with wb.save.
+    """
+
+    def __init__(self, path: str):
+        # the package is kept in memory, so the file can be replaced when saving
+        with open(path, "rb") as f:
+            self.reader = ExcelReader(BytesIO(f.read()), keep_vba=False)
+
+        reader = self.reader
+        reader.read_manifest()
+        reader.read_strings()
+        reader.read_workbook()
+        reader.read_properties()
+        reader.read_custom()
+        reader.read_theme()
+        apply_stylesheet(reader.archive, reader.wb)
+        self.wb = reader.wb
+        # like keep_vba, the original parts are kept for a full save
+        self.wb.vba_archive = reader.archive
+
+        self.unparsed = {}  # sheet name -> (sheet, relationship)
+        for sheet, rel in reader.parser.find_sheets():
+            if rel.target not in reader.valid_files:
+                continue
+            if "chartsheet" in rel.Type:
+                reader.read_chartsheet(sheet, rel)
+                continue
+            placeholder = Worksheet(self.wb, sheet.name)
+            placeholder.sheet_state = sheet.state
+            self.wb._sheets.append(placeholder)
+            self.unparsed[sheet.name] = (sheet, rel)
+        reader.parser.assign_names()
+
+    def __getitem__(self, name: str) -> Worksheet:
+        if name in self.unparsed:
+            self._parse(name)
+        return self.wb[name]
+
+    def _parse(self, name: str):
+        """Parses a worksheet and puts it in the place of its placeholder."""
+        placeholder = self.wb[name]
+        index = self.wb._sheets.index(placeholder)
+        self.wb._sheets.remove(placeholder)
+
+        find_sheets = self.reader.parser.find_sheets
+        self.reader.parser.find_sheets = lambda: [self.unparsed.pop(name)]
+        try:
+            self.reader.read_worksheets()
+        finally:
+            self.reader.parser.find_sheets = find_sheets
+
+        ws = self.wb._sheets.pop()
+        # the names assign_names bound to the placeholder
+        for attr in ("defined_names", "_print_rows", "_print_cols", "_print_area"):
+            if hasattr(placeholder, attr):
+                setattr(ws, attr, getattr(placeholder, attr))
+        self.wb._sheets.insert(index, ws)
+        logging.info(f"(Load) Parsed the sheet {name}")
+
+    def parse_all(self):
+        """Parses the sheets that are still placeholders, ie. before a full save."""
+        for name in list(self.unparsed):
+            self._parse(name)
+
+    def close(self):
+        self.reader.archive.close()
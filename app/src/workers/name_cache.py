@@ -0,0 +1,184 @@
+import logging
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from .rate_limiter import TokenBucketRateLimiter
+
+
+class FundNameCache:
+    """
+    Cache of fund names by fund id, kept in a json file so the names survive runs.
+
+    A name comes from the title of the fund's page (fund.eastmoney.com/<id>.html)
+    or from a page that already lists it (ie. the top50 pages). Names expire after
+    ttl_days, and failed lookups ("Not found") are never cached.
+
+    fetch_many looks up the missing names concurrently through one pooled session,
+    so they can all be fetched before a sheet is written. Every lookup takes a token
+    from a rate limiter of its own (requests_per_second, request_burst), so the
+    lookups do not wait for the pages' request budget.
+    """
+
+    url = "https://fund.eastmoney.com/{}.html"
+    not_found = "Not found"
+
+    def __init__(
+        self,
+        path: str = None,
+        ttl_days: float = 30,
+        max_concurrency: int = 8,
+        timeout: int = 15,
+        requests_per_second: float = 2,
+        request_burst: int = 4,
+        rate_limiter=None,
+    ):
+        """
+        Without a path the names are only kept in memory. A rate_limiter replaces
+        the one made from requests_per_second and request_burst.
+        """
+        self.path = path
+        self.ttl = ttl_days * 24 * 3600
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        if rate_limiter is None:
+            rate_limiter = TokenBucketRateLimiter(
+                rate=requests_per_second, burst=request_burst
+            )
+        self.rate_limiter = rate_limiter
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._session = None
+
+        self.names = {}  # <id>: {"name": <name>, "fetched": <timestamp>}
+        if path is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.names = json.load(f)
+            except (OSError, ValueError):
+                self.names = {}
+
+    @classmethod
+    def from_settings(cls, settings: dict, base_path: str):
+        """Creates the cache from the 'nameCache' section of fb_config.json"""
+        if not settings or not settings.get("enabled", True):
+            return None
+        return cls(
+            os.path.join(base_path, settings.get("path", "names.json")),
+            ttl_days=settings.get("ttlDays", 30),
+            requests_per_second=settings.get("requestsPerSecond", 2),
+            request_burst=settings.get("requestBurst", 4),
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def session(self):
+        """The pooled session of the lookups, requests is loaded with the first one"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            adapter = HTTPAdapter(
+                pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency
+            )
+            self._session = requests.Session()
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        return self._session
+
+    def get(self, id) -> str:
+        """Returns the cached name of the fund, or None if it is missing or expired."""
+        with self.lock:
+            entry = self.names.get(str(id))
+            if entry is None or time() - entry["fetched"] >= self.ttl:
+                return None
+            return entry["name"]
+
+    def put(self, id, name: str):
+        if not name or name == self.not_found:
+            return
+        with self.lock:
+            self.names[str(id)] = {"name": name, "fetched": time()}
+            self.dirty = True
+
+    def update(self, names):
+        """Adds (<id>, <name>) pairs that are already known, ie. from the top50 pages"""
+        for id, name in names:
+            self.put(id, name)
+
+    def missing(self, ids) -> list:
+        """The ids (once each) that have no fresh name in the cache."""
+        return [
+            id for id in dict.fromkeys(str(id) for id in ids) if self.get(id) is None
+        ]
+
+    def fetch(self, id) -> str:
+        """
+        Looks the name of the fund up on its page, returns "Not found" on failure:
+        an error status or a title without the "(<id>)" of a fund page.
+        """
+        from bs4 import BeautifulSoup, SoupStrainer
+
+        self.rate_limiter.acquire()
+        try:
+            r = self.session.get(self.url.format(id), timeout=self.timeout)
+        except Exception:
+            logging.warning(f"[names] Failed to look up the name of {id}")
+            self.rate_limiter.penalize()
+            return self.not_found
+
+        if not r.ok:
+            logging.warning(
+                f"[names] Failed to look up the name of {id}: {r.status_code}"
+            )
+            if r.status_code in (403, 429):
+                self.rate_limiter.penalize()
+            return self.not_found
+        soup = BeautifulSoup(r.content, "html.parser", parse_only=SoupStrainer("title"))
+        title = soup.find("title")
+        text = title.text.strip() if title is not None else ""
+        if "(" not in text:
+            logging.warning(f"[names] The page of {id} has no fund name: {text!r}")
+            return self.not_found
+        return text[: text.find("(")]
+
+    def fetch_many(self, ids, progress_callback=None) -> dict:
+        """Fetches the missing names of ids concurrently, returns them by id."""
+        ids = self.missing(ids)
+        if not ids:
+            return {}
+
+        logging.info(f"[names] Looking up {len(ids)} fund names")
+        if progress_callback is not None:
+            progress_callback.emit(f"[names] Looking up {len(ids)} fund names")
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            names = dict(zip(ids, executor.map(self.fetch, ids)))
+        for id, name in names.items():
+            self.put(id, name)
+        self.save()
+        return names
+
+    def name(self, id) -> str:
+        """The name of the fund, from the cache or else from its page."""
+        name = self.get(id)
+        if name is None:
+            name = self.fetch(id)
+            self.put(id, name)
+        return name
+
+    def save(self):
+        """Writes the names to disk if they changed."""
+        with self.lock:
+            if not self.dirty or self.path is None:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.names, f, ensure_ascii=False)
+            os.replace(self.path + ".tmp", self.path)
+            self.dirty = False
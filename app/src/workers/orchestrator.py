@@ -0,0 +1,370 @@
+"""
+Runs the workbook jobs (funds, rankings and the top50 sheets) as asyncio tasks.
+
+controller.start runs the jobs one after another. The jobs only depend on each
+other through the workbook, so here every job is a chain of tasks
+(read -> scrape -> write) and the scrapes of all the jobs run at the same time:
+
+    funds:      read_funds -> one task per funds page -> write each fund
+    rankings:   read_rankings -> ranking pages -> write the 基金排队 sheet
+    top50 x 5:  top page -> ranking pages -> write the top50 sheet
+
+A ranking page needed by more than one sheet is only fetched once. The blocking
+scraper calls run in a thread pool, at most max_concurrency at a time, and they
+all share the scraper's rate limiter. The workbook is only used from one thread:
+reads and writes go through a single writer task, in the order they are queued.
+"""
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .controller import save, save_page_cache, top_urls, write_stats
+from .instrumentation import instruments
+
+
+class ProgressBridge:
+    """
+    Drives the progress bar of ThreadWorkerSignals.progress_num (n resets the bar to
+    a maximum of n, -1 is one step) from all of the tasks. The total grows as the
+    jobs find out what they have to fetch, the steps already done are kept.
+    """
+
+    def __init__(self, progress_callback_num):
+        self.progress_callback_num = progress_callback_num
+        self.lock = threading.Lock()
+        self.total = 0
+        self.done = 0
+
+    def add(self, n: int):
+        if n <= 0:
+            return
+        with self.lock:
+            self.total += n
+            self.progress_callback_num.emit(self.total)
+            for _ in range(self.done):
+                self.progress_callback_num.emit(-1)
+
+    def step(self):
+        with self.lock:
+            self.done += 1
+            self.progress_callback_num.emit(-1)
+
+
+class JobOrchestrator:
+    """
+    Runs the enabled jobs of controller.start concurrently, see run.
+    The journal (if any) records every page fetched, like in controller.start.
+    """
+
+    def __init__(
+        self,
+        scraper,
+        workbook_manager,
+        run_threads,
+        progress_callback,
+        progress_callback_num,
+        journal=None,
+        max_concurrency: int = None,
+        keep_data: bool = False,
+    ):
+        self.scraper = scraper
+        self.workbook_manager = workbook_manager
+        self.run_threads = run_threads
+        self.progress_callback = progress_callback
+        self.progress_callback_num = progress_callback_num
+        self.progress = ProgressBridge(progress_callback_num)
+        self.journal = journal
+        self.keep_data = keep_data
+
+        # as many pages at once as the scraper can load at once
+        if max_concurrency is None:
+            max_concurrency = scraper.driver_pool_size
+            if scraper.http_fetcher is not None:
+                max_concurrency = max(
+                    max_concurrency, scraper.http_fetcher.max_concurrency
+                )
+        self.max_concurrency = max(1, max_concurrency)
+
+    def _emit(self, message: str):
+        logging.info(message)
+        self.progress_callback.emit(message)
+
+    async def _scrape(self, fn, *args, **kwargs):
+        """Runs a blocking scraper call in the scrape pool, None once stopped."""
+        async with self.semaphore:
+            if not self.run_threads.flag:
+                return None
+            return await self.loop.run_in_executor(
+                self.scrape_pool, functools.partial(fn, *args, **kwargs)
+            )
+
+    async def _workbook(self, fn, *args, **kwargs):
+        """Queues a call on the workbook manager and waits for the writer to run it."""
+        done = self.loop.create_future()
+        await self.writes.put((functools.partial(fn, *args, **kwargs), done))
+        return await done
+
+    async def _writer(self):
+        """The only task that uses the workbook manager, one call at a time."""
+        while True:
+            item = await self.writes.get()
+            if item is None:
+                return
+            call, done = item
+            try:
+                result = await self.loop.run_in_executor(self.workbook_pool, call)
+            except Exception as e:
+                done.set_exception(e)
+            else:
+                done.set_result(result)
+
+    def _rankings(self, ids: list):
+        """
+        Waits for the ranking pages of ids. Each page is fetched by one task, shared
+        by every job that needs it, and the ones in the journal are not fetched.
+        """
+        new = list(dict.fromkeys(id for id in ids if id not in self.rankings))
+        if self.journal is not None:
+            journaled = [id for id in new if id in self.journal.ranking]
+            for id in journaled:
+                self.rankings[id] = self.loop.create_future()
+                self.rankings[id].set_result(None)
+            new = [id for id in new if id not in self.journal.ranking]
+
+        self.progress.add(len(new))
+        for id in new:
+            self.rankings[id] = self.loop.create_task(self._fetch_ranking(id))
+        return asyncio.gather(*(self.rankings[id] for id in ids))
+
+    async def _fetch_ranking(self, id: str):
+        parsed = await self._scrape(
+            self.scraper.parse_ranking_page,
+            id,
+            progress_callback=self.progress_callback,
+            progress_callback_num=self.progress_callback_num,
+        )
+        if parsed and self.journal is not None:
+            self.journal.record_ranking(id, self.scraper.data["ranking"][id])
+        self.progress.step()
+
+    async def _write_fund(self, id, prices=None):
+        if prices is None:
+            prices = self.scraper.data["funds"].pop(id)
+        await self._workbook(
+            self.workbook_manager.write_fund,
+            id,
+            prices,
+            progress_callback=self.progress_callback,
+        )
+        if self.keep_data:
+            self.scraper.data["funds"].add(prices)
+
+    async def _fetch_fund(self, id):
+        parsed = await self._scrape(
+            self.scraper.parse_funding_page,
+            id,
+            progress_callback=self.progress_callback,
+            progress_callback_num=self.progress_callback_num,
+        )
+        self.progress.step()
+        if parsed is None:  # stopped
+            return
+        prices = self.scraper.data["funds"].pop(id)
+        if parsed and self.journal is not None:
+            self.journal.record_funds(id, prices.to_dict().get(str(id), {}))
+        await self._write_fund(id, prices)
+
+    async def funds_job(self):
+        await self._workbook(
+            self.workbook_manager.read_funds,
+            progress_callback=self.progress_callback,
+            progress_callback_num=self.progress_callback_num,
+        )
+        missing_funds = self.workbook_manager.missing_funds or {}
+        to_scrape = await self._scrape(
+            self.scraper.load_history,
+            missing_funds,
+            progress_callback=self.progress_callback,
+        )
+        if to_scrape is None:
+            return
+        if self.journal is not None:
+            to_scrape = {
+                id: dates
+                for id, dates in to_scrape.items()
+                if str(id) not in self.journal.funds
+            }
+
+        self._emit(f"[jobs] {len(to_scrape)} funds pages to fetch")
+        self.progress.add(len(to_scrape))
+        await asyncio.gather(
+            *(
+                self._fetch_fund(id) if id in to_scrape else self._write_fund(id)
+                for id in missing_funds
+            )
+        )
+
+    async def rankings_job(self):
+        await self._workbook(
+            self.workbook_manager.read_rankings,
+            progress_callback=self.progress_callback,
+            progress_callback_num=self.progress_callback_num,
+        )
+        ids = [str(cell.value) for cell in self.workbook_manager.ranking_ids or []]
+        await self._rankings(ids)
+        if not self.run_threads.flag:
+            return
+
+        await self._workbook(
+            self.workbook_manager.write_rankings,
+            self.scraper.data["ranking"],
+            progress_callback=self.progress_callback,
+            progress_callback_num=self.progress_callback_num,
+        )
+
+    async def top_job(self, sheet_name: str, url: str):
+        if self.journal is not None and sheet_name in self.journal.top:
+            top = self.journal.top[sheet_name]
+        else:
+            top = await self._scrape(
+                self.scraper.fetch_top,
+                url,
+                progress_callback=self.progress_callback,
+                progress_callback_num=self.progress_callback_num,
+            )
+            self.progress.step()
+            if not self.run_threads.flag:
+                return
+            if top is None:
+                # the sheet is left as it is, an empty list would write it as 基金排队
+                self._emit(
+                    f"[jobs] Failed to load the top50 page of {sheet_name}, not written"
+                )
+                return
+            if self.journal is not None:
+                self.journal.record_sheet(sheet_name, top)
+
+        # the top50 pages list the names of their funds, so they need no lookup
+        self.workbook_manager.name_cache.update((a[0], a[1]) for a in top)
+        await self._rankings([str(a[0]) for a in top])
+        if not self.run_threads.flag:
+            return
+
+        await self._workbook(
+            self.workbook_manager.write_rankings,
+            self.scraper.data["ranking"],
+            sheet_name,
+            [tuple(a) for a in top],
+            progress_callback=self.progress_callback,
+            progress_callback_num=self.progress_callback_num,
+        )
+
+    async def run(self, funds: bool, rankings: bool, top: bool, pn: int) -> bool:
+        """
+        Runs the enabled jobs until every sheet is written (the workbook is not
+        saved). Returns false if the jobs were stopped through run_threads.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.writes = asyncio.Queue()
+        self.rankings = {}  # <id>: task that fetches its ranking page
+        self.scrape_pool = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="scrape"
+        )
+        self.workbook_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="workbook"
+        )
+
+        jobs = []
+        if funds:
+            jobs.append(self.funds_job())
+        if rankings:
+            jobs.append(self.rankings_job())
+        if top:
+            urls = top_urls(pn)
+            journaled = self.journal.top if self.journal is not None else {}
+            self.progress.add(len([s for s in urls if s not in journaled]))
+            jobs += [self.top_job(sheet, url) for sheet, url in urls.items()]
+
+        self.progress_callback.emit("PROG:ALL JOBS")
+        writer = self.loop.create_task(self._writer())
+        try:
+            await asyncio.gather(*jobs)
+        finally:
+            await self.writes.put(None)
+            await writer
+            self.scrape_pool.shutdown(wait=False)
+            self.workbook_pool.shutdown()
+        return self.run_threads.flag
+
+
+def start_async(
+    scraper,
+    workbook_manager,
+    run_threads,
+    save_data,
+    funds,
+    rankings,
+    top,
+    pn,
+    progress_callback,
+    progress_callback_num,
+    journal=None,
+    resume=False,
+):
+    """
+    Same as controller.start, with the jobs run at the same time by a
+    JobOrchestrator. Meant to be run in a ThreadWorker (it runs its own event loop).
+    """
+    logging.info("--- web scraper start (concurrent jobs)")
+    progress_callback.emit("--- web scraper start (concurrent jobs)")
+    instruments.reset()
+
+    if journal is not None:
+        if resume:
+            journal.restore(scraper)
+            progress_callback.emit(f"[journal] Resuming from {journal}")
+        else:
+            journal.begin(
+                workbook_manager.path,
+                {"funds": funds, "rankings": rankings, "top": top, "pn": pn},
+            )
+
+    orchestrator = JobOrchestrator(
+        scraper,
+        workbook_manager,
+        run_threads,
+        progress_callback,
+        progress_callback_num,
+        journal=journal,
+        keep_data=save_data,
+    )
+    if not asyncio.run(orchestrator.run(funds, rankings, top, pn)):
+        logging.info(
+            "The workbook tasks thread was manually stopped and did not finish correctly."
+        )
+        progress_callback.emit(
+            "The workbook tasks thread was manually stopped and did not finish correctly."
+        )
+        if journal is not None:
+            progress_callback.emit(
+                "[journal] The pages fetched so far are kept, resume to continue the job"
+            )
+        save_page_cache(scraper)
+        write_stats(progress_callback)
+        return False
+
+    if save_data:
+        save(scraper, workbook_manager, progress_callback)
+
+    workbook_manager.close()
+    if journal is not None:
+        journal.finish()
+    save_page_cache(scraper)
+    write_stats(progress_callback)
+
+    logging.info("--- web scraper done")
+    progress_callback.emit("--- web scraper done")
+    return True
@@ -0,0 +1,238 @@
+import logging
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import Counter
+from time import time
+
+
+class PageCache:
+    """
+    Content-addressed on-disk cache of raw page bodies, keyed by url.
+
+    Bodies are stored once under objects/<sha256>, and index.json maps each url to
+    its body hash along with when it was fetched, when it was last used and the
+    ETag/Last-Modified validators sent by the server (if any).
+
+    Each url belongs to a page type ('funds', 'ranking', 'top' or 'other') that has
+    its own time to live. Stale entries are not returned by get(), but their
+    validators can still be used to revalidate them with a conditional request.
+    When the stored bodies go over max_bytes the least recently used entries are evicted.
+
+    The index is written to disk every save_every changes rather than on every page,
+    and by save() at the end of a run.
+    """
+
+    page_types = [
+        ("funds", re.compile(r"jjjz_|f10/lsjz")),
+        ("ranking", re.compile(r"jdzf_|FundArchivesDatas\.aspx.*jdzf")),
+        ("top", re.compile(r"fundranking")),
+    ]
+
+    default_ttls = {"funds": 360, "ranking": 720, "top": 60, "other": 60}
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 200 * 2**20,
+        ttls: dict = None,
+        save_every: int = 50,
+    ):
+        """ttls are given in minutes for each page type"""
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_bytes = max_bytes
+        self.ttls = {**self.default_ttls, **(ttls or {})}
+        self.save_every = max(1, save_every)
+        self.lock = threading.RLock()
+        self.dirty = False
+        self.changes = 0  # puts since the index was last written
+
+        os.makedirs(self.objects_directory, exist_ok=True)
+        self.index = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+        # the bodies are shared by the urls with the same content
+        self.references = Counter(entry["hash"] for entry in self.index.values())
+        self.total = sum(
+            {entry["hash"]: entry["size"] for entry in self.index.values()}.values()
+        )
+
+    @classmethod
+    def from_settings(cls, settings: dict, base_path: str):
+        """Creates the cache from the 'pageCache' section of fb_config.json"""
+        if not settings or not settings.get("enabled", True):
+            return None
+        return cls(
+            os.path.join(base_path, settings.get("directory", "cache")),
+            max_bytes=int(settings.get("maxMegabytes", 200) * 2**20),
+            ttls=settings.get("ttlMinutes"),
+            save_every=settings.get("saveEvery", 50),
+        )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def page_type(self, url: str) -> str:
+        for name, pattern in self.page_types:
+            if pattern.search(url):
+                return name
+        return "other"
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_directory, digest)
+
+    def _is_fresh(self, url: str, entry: dict) -> bool:
+        return time() - entry["fetched"] < self.ttls[self.page_type(url)] * 60
+
+    def is_fresh(self, url: str) -> bool:
+        with self.lock:
+            entry = self.index.get(url)
+            return entry is not None and self._is_fresh(url, entry)
+
+    def _read(self, url: str, entry: dict) -> str:
+        try:
+            with open(self._object_path(entry["hash"]), "r", encoding="utf-8") as f:
+                body = f.read()
+        except OSError:
+            # the body went missing, forget about the entry
+            self._drop(url)
+            return None
+        entry["accessed"] = time()
+        self.dirty = True
+        return body
+
+    def get(self, url: str) -> str:
+        """Returns the cached body for the url, or None if it is missing or stale."""
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None or not self._is_fresh(url, entry):
+                return None
+            return self._read(url, entry)
+
+    def validators(self, url: str) -> dict:
+        """Returns the conditional request headers for a (stale) cached url."""
+        with self.lock:
+            entry = self.index.get(url)
+            headers = {}
+            if entry is None:
+                return headers
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return headers
+
+    def revalidated(self, url: str) -> str:
+        """
+        Marks a cached url as fresh again after the server answered 304 Not Modified
+        and returns its body.
+        """
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None:
+                return None
+            entry["fetched"] = time()
+            body = self._read(url, entry)
+            self._changed()
+            return body
+
+    def put(self, url: str, body: str, etag: str = None, last_modified: str = None):
+        with self.lock:
+            data = body.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._object_path(digest)
+            if not os.path.exists(path):
+                with open(path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+
+            replaced = self._drop(url)
+            if replaced is not None and replaced != digest:
+                self._remove_object(replaced)
+            self.references[digest] += 1
+            if self.references[digest] == 1:
+                self.total += len(data)
+
+            now = time()
+            self.index[url] = {
+                "hash": digest,
+                "size": len(data),
+                "fetched": now,
+                "accessed": now,
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+            self.dirty = True
+            if self.total > self.max_bytes:
+                self._evict()
+            self._changed()
+
+    def invalidate(self, url: str):
+        """Drops a url, ie. when its page turned out to be unparseable."""
+        with self.lock:
+            digest = self._drop(url)
+            if digest is not None:
+                self._remove_object(digest)
+                self._changed()
+
+    def _drop(self, url: str) -> str:
+        """
+        Removes a url from the index, returns the hash of its body if no other url
+        uses it anymore (the body is left on disk).
+        """
+        entry = self.index.pop(url, None)
+        if entry is None:
+            return None
+        self.dirty = True
+        self.references[entry["hash"]] -= 1
+        if self.references[entry["hash"]] > 0:
+            return None
+        del self.references[entry["hash"]]
+        self.total -= entry["size"]
+        return entry["hash"]
+
+    def _changed(self):
+        """Writes the index once every save_every changes."""
+        self.changes += 1
+        if self.changes >= self.save_every:
+            self.save()
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        for url, entry in sorted(self.index.items(), key=lambda i: i[1]["accessed"]):
+            if self.total <= self.max_bytes:
+                break
+            self._drop(url)
+        logging.info(f"[page cache] evicted entries, cache is now {self.total} bytes")
+        self._remove_unreferenced()
+
+    def _remove_object(self, digest: str):
+        try:
+            os.remove(self._object_path(digest))
+        except OSError:
+            pass
+
+    def _remove_unreferenced(self):
+        referenced = {entry["hash"] for entry in self.index.values()}
+        for name in os.listdir(self.objects_directory):
+            if name not in referenced:
+                self._remove_object(name)
+
+    def save(self):
+        """Writes the index to disk if it changed."""
+        with self.lock:
+            self.changes = 0
+            if not self.dirty:
+                return
+            with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.index, f)
+            os.replace(self.index_path + ".tmp", self.index_path)
+            self.dirty = False
@@ -0,0 +1,151 @@
+"""
+Selective parsers for the EastMoneyFund pages.
+
+Each page is only used for one table (table.lsjz, div#jdzftable, table#dbtable)
+and the info bar above it, so instead of building a tree for the whole page the
+parsers scan the html for those elements and only parse the matching subtrees.
+lxml is used for the subtrees when it is installed, otherwise they go through
+BeautifulSoup's html.parser like before. The output is the same either way.
+"""
+import re
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover
+    lxml_html = None
+
+
+def _opening_tag(tag: str, attribute: str, value: str):
+    """Matches an opening tag that has value in the given attribute (ie. one of its classes)"""
+    return re.compile(
+        rf"<{tag}\b[^>]*\b{attribute}\s*=\s*[\"'](?:[^\"']*\s)?{value}(?:\s[^\"']*)?[\"'][^>]*>",
+        re.I,
+    )
+
+
+lsjz_table = _opening_tag("table", "class", "lsjz")
+bs_jz_div = _opening_tag("div", "class", "bs_jz")
+jdzf_div = _opening_tag("div", "id", "jdzftable")
+db_table = _opening_tag("table", "id", "dbtable")
+
+
+def extract_element(html: str, opening_tag, tag: str) -> str:
+    """
+    Returns the html of the first element matched by the opening_tag pattern,
+    up to its matching closing tag. Returns None if the element is not in the html.
+    """
+    start = opening_tag.search(html)
+    if start is None:
+        return None
+
+    tags = re.compile(rf"<(/?){tag}\b[^>]*>", re.I)
+    depth = 1
+    for match in tags.finditer(html, start.end()):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return html[start.start() : match.end()]
+
+    # unclosed element, let the parser close it
+    return html[start.start() :]
+
+
+def _element(html: str, opening_tag, tag: str, name: str):
+    fragment = extract_element(html, opening_tag, tag)
+    if fragment is None:
+        raise ValueError(f"Did not find {name} in the page")
+    if lxml_html is not None:
+        return lxml_html.fragment_fromstring(fragment)
+    return BeautifulSoup(fragment, "html.parser").find(tag)
+
+
+def _has_class(element, name: str) -> bool:
+    return name in (element.get("class") or "").split()
+
+
+def _lxml_text(element) -> str:
+    return element.text_content()
+
+
+def parse_prices(html: str) -> dict:
+    """
+    Returns the price history of a funds (jjjz_) page as {<date>: <price>}
+    from the first two columns of table.lsjz
+    """
+    table = _element(html, lsjz_table, "table", "table.lsjz")
+    prices = {}
+
+    if lxml_html is not None:
+        tbody = table.find("tbody")
+        for row in tbody.iter("tr"):
+            attr = row.findall(".//td")
+            prices[_lxml_text(attr[0]).strip()] = _lxml_text(attr[1]).strip()
+        return prices
+
+    for row in table.find("tbody").find_all("tr"):
+        attr = row.find_all("td")
+        prices[attr[0].text.strip()] = attr[1].text.strip()
+    return prices
+
+
+def parse_ranking(html: str) -> list:
+    """
+    Returns the ranking data of a ranking (jdzf_) page as a list:
+        [<date>, <price>, <price change>, <period change>, ...]
+    The date and prices come from the div.bs_jz info bar, and the period changes
+    from the div#jdzftable table.
+    """
+    info = _element(html, bs_jz_div, "div", "div.bs_jz")
+    table = _element(html, jdzf_div, "div", "div#jdzftable")
+
+    if lxml_html is not None:
+        # get the SECOND label from the right column's row1
+        col_right = next(e for e in info.iter("div") if _has_class(e, "col-right"))
+        row1 = next(e for e in col_right.iter("p") if _has_class(e, "row1"))
+        label_text = _lxml_text(row1.findall(".//label")[1])
+
+        jdzfnew = next(e for e in table.iter("div") if _has_class(e, "jdzfnew"))
+        uls = jdzfnew.findall(".//ul")
+        changes = [_lxml_text(ul.findall(".//li")[1]).strip() for ul in uls[1:-1]]
+    else:
+        label_text = (
+            (info.find("div", {"class": "col-right"}))
+            .find("p", {"class": "row1"})
+            .find_all("label")[1]
+            .text
+        )
+
+        uls = table.find("div", {"class": "jdzfnew"}).find_all("ul")
+        changes = [ul.find_all("li")[1].text.strip() for ul in uls[1:-1]]
+
+    label_texts = [s.strip() for s in label_text.strip().split("\n")]
+
+    # 1. the date
+    date = label_texts[0]
+    date = date[date.find("（") + 1 : date.find("）")]
+
+    # 2. and 3. the initial prices
+    prices = label_texts[2].split(" ( ")
+
+    return [date, prices[0], prices[1].strip(" )")] + changes
+
+
+def parse_top(html: str) -> list:
+    """Returns the rows of a fundranking page table#dbtable as a list of [<id>, <name>]"""
+    table = _element(html, db_table, "table", "table#dbtable")
+    top = []
+
+    if lxml_html is not None:
+        for row in table.find("tbody").iter("tr"):
+            cols = row.findall(".//td")
+            id = _lxml_text(cols[2].find(".//a")).strip()
+            name = cols[3].find(".//a").get("title")
+            top.append([id, name])
+        return top
+
+    for row in table.find("tbody").find_all("tr"):
+        cols = row.find_all("td")
+        id = (cols[2]).find("a").text.strip()
+        name = (cols[3]).find("a").get("title")
+        top.append([id, name])
+    return top
@@ -0,0 +1,176 @@
+import numpy as np
+
+
+class FundPriceStore:
+    """
+    Columnar in-memory store of fund prices.
+
+    Each fund has one sorted datetime64[D] array of dates and one float64 array of
+    prices. Values that are not numbers (ie. '--' on suspended days) are stored as NaN
+    in the price array and kept as text on the side so they can still be written out.
+
+    The store replaces the {<id>: {<date>: <price>}} dictionaries of scraper.data['funds']:
+    merge() takes that format for one fund, and to_dict() gives it back for export.
+    """
+
+    def __init__(self):
+        self._dates = {}
+        self._prices = {}
+        self._text = {}  # <id>: {<date>: <text>} for values that are not numbers
+        self._decimals = {}  # decimals the prices were given with, for export
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def __contains__(self, id) -> bool:
+        return str(id) in self._dates
+
+    def __iter__(self):
+        return iter(self._dates)
+
+    def __repr__(self) -> str:
+        return f"FundPriceStore({len(self)} funds, {sum(len(a) for a in self._dates.values())} prices)"
+
+    def ids(self) -> list:
+        return list(self._dates)
+
+    @staticmethod
+    def to_dates(dates) -> np.ndarray:
+        """Converts a list of 'YYYY-MM-DD' strings (or dates) to a datetime64[D] array."""
+        return np.array(dates, dtype="datetime64[D]")
+
+    @staticmethod
+    def _is_date(date) -> bool:
+        try:
+            np.datetime64(date, "D")
+            return True
+        except ValueError:
+            return False
+
+    @classmethod
+    def from_dict(cls, funds_data: dict):
+        """Creates a store from the {<id>: {<date>: <price>}} format."""
+        store = cls()
+        for id, prices in funds_data.items():
+            store.merge(id, prices)
+        return store
+
+    def merge(self, id, prices: dict):
+        """
+        Merges new {<date>: <price>} results for a fund into the store.
+        New prices replace the stored prices of the same date.
+        """
+        id = str(id)
+        if not prices and id in self._dates:
+            return
+
+        values = np.full(len(prices), np.nan)
+        text = self._text.get(id, {})
+        decimals = self._decimals.get(id, 0)
+        for i, (date, value) in enumerate(prices.items()):
+            try:
+                values[i] = float(value)
+                text.pop(date, None)
+                if isinstance(value, str) and "." in value:
+                    decimals = max(
+                        decimals, len(value.strip()) - value.strip().index(".") - 1
+                    )
+            except (TypeError, ValueError):
+                text[date] = value
+
+        try:
+            dates = self.to_dates(list(prices.keys()))
+        except ValueError:
+            # drop the rows that are not dates (ie. a 'no data' row)
+            valid = [i for i, d in enumerate(prices) if self._is_date(d)]
+            dates = self.to_dates([list(prices)[i] for i in valid])
+            values = values[valid]
+        if id in self._dates:
+            dates = np.concatenate([dates, self._dates[id]])
+            values = np.concatenate([values, self._prices[id]])
+
+        # np.unique keeps the first occurrence, so the new prices win
+        dates, index = np.unique(dates, return_index=True)
+        self._dates[id] = dates
+        self._prices[id] = values[index]
+        self._decimals[id] = decimals
+        if text:
+            self._text[id] = text
+
+    def pop(self, id):
+        """Removes a fund from the store and returns it in a store of its own."""
+        id = str(id)
+        store = FundPriceStore()
+        if id in self._dates:
+            store._dates[id] = self._dates.pop(id)
+            store._prices[id] = self._prices.pop(id)
+            store._decimals[id] = self._decimals.pop(id)
+            if id in self._text:
+                store._text[id] = self._text.pop(id)
+        return store
+
+    def add(self, store):
+        """Moves the funds of another store (ie. one given by pop) into this one."""
+        for id in store.ids():
+            self._dates[id] = store._dates[id]
+            self._prices[id] = store._prices[id]
+            self._decimals[id] = store._decimals[id]
+            self._text.pop(id, None)
+            if id in store._text:
+                self._text[id] = store._text[id]
+
+    def lookup(self, id, dates) -> np.ndarray:
+        """
+        Returns the prices of a fund for many dates at once, NaN where a date
+        has no price (or the price is not a number).
+        """
+        query = self.to_dates(dates)
+        result = np.full(len(query), np.nan)
+        id = str(id)
+        if id not in self._dates or len(query) == 0:
+            return result
+
+        stored = self._dates[id]
+        index = np.searchsorted(stored, query)
+        found = index < len(stored)
+        found[found] = stored[index[found]] == query[found]
+        result[found] = self._prices[id][index[found]]
+        return result
+
+    def text(self, id, date: str):
+        """Returns the stored text for a value that is not a number, or None."""
+        return self._text.get(str(id), {}).get(date)
+
+    def get(self, id, date: str, default=None):
+        """Returns the price (float) or the text value for one date of a fund."""
+        value = self.lookup(id, [date])[0]
+        if not np.isnan(value):
+            return float(value)
+        text = self.text(id, date)
+        return default if text is None else text
+
+    def latest_date(self, id) -> str:
+        """Returns the most recent date that has a value for a fund, or None."""
+        dates = self._dates.get(str(id))
+        if dates is None or len(dates) == 0:
+            return None
+        return str(dates[-1])
+
+    def to_dict(self) -> dict:
+        """
+        Returns the store in the {<id>: {<date>: <price>}} format of export_data,
+        newest date first like on the funds page.
+        """
+        data = {}
+        for id, dates in self._dates.items():
+            prices = self._prices[id]
+            text = self._text.get(id, {})
+            decimals = self._decimals[id]
+            fund = {}
+            for date, value in zip(dates[::-1].astype(str), prices[::-1]):
+                if np.isnan(value):
+                    fund[date] = text.get(date, "")
+                else:
+                    fund[date] = f"{value:.{decimals}f}"
+            data[id] = fund
+        return data
@@ -0,0 +1,236 @@
+"""
+Progress reporting from the worker threads to MainUi.
+
+The workers report through progress_callback.emit(<str>) and
+progress_callback_num.emit(<int>), which used to be the pyqtSignals of
+ThreadWorkerSignals: every message was queued to the GUI thread on its own.
+A ProgressChannel takes the same calls (and structured ProgressEvents through
+report), keeps them in a bounded buffer, and lets the GUI take them out in one
+coalesced batch per frame (see MainUi._drainProgress). A ConsoleProgress takes
+them without a gui, for the headless runs of cli.py.
+"""
+import json
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+
+
+class ProgressEvent:
+    """
+    One thing a worker reports. kind is what happened (ie. "funds", "ranking",
+    "page", "write"), and fund_id, count (ie. the number of prices) and duration
+    (seconds) are the details of it, if any.
+    """
+
+    __slots__ = ("kind", "message", "fund_id", "count", "duration")
+
+    def __init__(
+        self,
+        kind: str,
+        message: str = "",
+        fund_id: str = None,
+        count: int = None,
+        duration: float = None,
+    ):
+        self.kind = kind
+        self.message = message
+        self.fund_id = fund_id
+        self.count = count
+        self.duration = duration
+
+    def __str__(self) -> str:
+        text = self.message or self.kind
+        if self.duration is not None:
+            text += f" in {round(self.duration, 3)} seconds"
+        return text
+
+
+def report(
+    progress_callback,
+    kind: str,
+    message: str = "",
+    fund_id: str = None,
+    count: int = None,
+    duration: float = None,
+):
+    """
+    Reports a ProgressEvent to progress_callback, as an event if it is a
+    ProgressChannel or a ConsoleProgress, or as its message for anything else
+    with an emit(<str>).
+    """
+    if progress_callback is None:
+        return
+    event = ProgressEvent(kind, message, fund_id, count, duration)
+    if isinstance(progress_callback, (ProgressChannel, ConsoleProgress)):
+        progress_callback.put(event)
+    else:
+        progress_callback.emit(str(event))
+
+
+class _Counter:
+    """The progress_callback_num side of a channel: n sets the total, -1 is a step."""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def emit(self, n: int):
+        self.channel.count(n)
+
+
+class ProgressChannel:
+    """
+    A thread safe, bounded buffer of progress from the workers to the GUI.
+
+    Pass the channel as progress_callback and channel.counter as
+    progress_callback_num (ThreadWorker does with progress_channel=...).
+    drain() returns everything since the last drain, coalesced:
+        {
+            "lines": [<str>, ...],   the messages, oldest first
+            "status": <str>,         the last message
+            "label": <str>,          the last "PROG:" label
+            "total": <int>,          the last total of the progress bar
+            "steps": <int>,          the steps since that total (or since the last drain)
+            "events": {<kind>: <count>, ...}
+        }
+    Only the last max_lines messages are kept between two drains, and messages
+    are cut to max_length characters.
+    """
+
+    def __init__(self, max_lines: int = 500, max_length: int = 300):
+        self.max_length = max_length
+        self.lock = threading.Lock()
+        self.lines = deque(maxlen=max_lines)
+        self.counter = _Counter(self)
+        self._reset()
+
+    def _reset(self):
+        self.lines.clear()
+        self.dropped = 0
+        self.status = None
+        self.label = None
+        self.total = None
+        self.steps = 0
+        self.events = {}
+
+    def emit(self, message: str):
+        """Same as progress_callback.emit, "PROG:" messages set the label"""
+        message = str(message)
+        with self.lock:
+            if message.startswith("PROG:"):
+                self.label = message[len("PROG:") :].strip()
+                return
+            self._line(message)
+
+    def put(self, event: ProgressEvent):
+        with self.lock:
+            self.events[event.kind] = self.events.get(event.kind, 0) + 1
+            self._line(str(event))
+
+    def _line(self, message: str):
+        if len(message) > self.max_length:
+            message = message[: self.max_length] + " ..."
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(message)
+        self.status = message
+
+    def count(self, n: int):
+        with self.lock:
+            if n == -1:
+                self.steps += 1
+            else:
+                self.total = n
+                self.steps = 0
+
+    def drain(self) -> dict:
+        """Takes out everything reported since the last drain, None if nothing was."""
+        with self.lock:
+            if not (self.lines or self.label or self.total is not None or self.steps):
+                return None
+            lines = list(self.lines)
+            if self.dropped:
+                lines.insert(0, f"... {self.dropped} messages skipped")
+            batch = {
+                "lines": lines,
+                "status": self.status,
+                "label": self.label,
+                "total": self.total,
+                "steps": self.steps,
+                "events": dict(self.events),
+            }
+            self._reset()
+            return batch
+
+
+class ConsoleProgress:
+    """
+    Writes the progress of a headless run to a stream (stdout by default) as it
+    comes, one line per message:
+        <time> [<label> <steps>/<total>] <message>
+    or with json_lines, one json object per line:
+        {"time", "kind", "message", "label", "steps", "total", <details of the event>}
+    Takes the same calls as a ProgressChannel: pass it as progress_callback and
+    its counter as progress_callback_num.
+    """
+
+    def __init__(self, stream=None, json_lines: bool = False):
+        self.stream = stream if stream is not None else sys.stdout
+        self.json_lines = json_lines
+        self.lock = threading.Lock()
+        self.counter = _Counter(self)
+        self.label = None
+        self.total = None
+        self.steps = 0
+
+    def emit(self, message: str):
+        message = str(message)
+        if message.startswith("PROG:"):
+            with self.lock:
+                self.label = message[len("PROG:") :].strip()
+            self._write("label", self.label)
+        else:
+            self._write("log", message)
+
+    def put(self, event: ProgressEvent):
+        details = {
+            "fund_id": event.fund_id,
+            "count": event.count,
+            "duration": event.duration,
+        }
+        self._write(event.kind, str(event), details)
+
+    def count(self, n: int):
+        with self.lock:
+            if n == -1:
+                self.steps += 1
+            else:
+                self.total = n
+                self.steps = 0
+
+    def _write(self, kind: str, message: str, details: dict = None):
+        with self.lock:
+            now = datetime.now()
+            if self.json_lines:
+                record = {
+                    "time": now.isoformat(timespec="seconds"),
+                    "kind": kind,
+                    "message": message,
+                    "label": self.label,
+                    "steps": self.steps,
+                    "total": self.total,
+                }
+                record.update(
+                    (key, value)
+                    for key, value in (details or {}).items()
+                    if value is not None
+                )
+                line = json.dumps(record, ensure_ascii=False)
+            else:
+                progress = f"{self.steps}/{self.total}" if self.total else ""
+                prefix = " ".join(a for a in (self.label, progress) if a)
+                line = f'{now.strftime("%H:%M:%S")} ' + (
+                    f"[{prefix}] {message}" if prefix else message
+                )
+            self.stream.write(line + "\n")
+            self.stream.flush()
@@ -0,0 +1,84 @@
+import random
+import threading
+from time import monotonic, sleep
+
+
+class TokenBucketRateLimiter:
+    """
+    A token bucket shared by everything that requests pages from EastMoneyFund.
+
+    Every request takes one token. Tokens refill at `rate` per second up to `burst`,
+    so a caller only waits when the budget has run out: time spent parsing or writing
+    to the workbook between two requests counts towards the next one.
+
+    penalize() halves the current rate (down to min_rate) and empties the bucket.
+    It should be called when the site times out or looks like it is blocking us.
+    reward() slowly brings the rate back up to the configured rate after successful loads.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.2,
+        burst: int = 1,
+        min_rate: float = None,
+        jitter: bool = False,
+    ):
+        self.max_rate = rate if rate and rate > 0 else float("inf")
+        self.rate = self.max_rate
+        self.min_rate = min_rate if min_rate else self.max_rate / 8
+        self.burst = max(1, burst)
+        self.jitter = jitter
+
+        self.tokens = float(self.burst)
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f"Rate limiter | {round(self.rate, 3)} requests/s, burst {self.burst}"
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, should_continue=None) -> float:
+        """
+        Takes a token, waiting for one to refill if the bucket is empty.
+        Returns the number of seconds spent waiting. should_continue is checked
+        while waiting; if it returns False the wait is abandoned without a token.
+        """
+        if self.max_rate == float("inf"):
+            return 0
+
+        waited = 0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+                if self.jitter:
+                    wait_time += random.uniform(0, 0.5 / self.rate)
+
+            if should_continue is not None and not should_continue():
+                return waited
+
+            # wait in short steps so a stop request is picked up quickly
+            wait_time = min(wait_time, 1)
+            sleep(wait_time)
+            waited += wait_time
+
+    def penalize(self):
+        """Slows down after a timeout or a blocked page."""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.updated = monotonic()
+
+    def reward(self):
+        """Recovers towards the configured rate after a successful page load."""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate * 1.1)
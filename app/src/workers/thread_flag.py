@@ -0,0 +1,8 @@
+class ThreadFlag:
+    """
+    Holds a boolean flag that can be used to communicate with worker
+    threads.
+    """
+
+    def __init__(self, initial_flag: bool = True):
+        self.flag = initial_flag
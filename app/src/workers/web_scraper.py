@@ -1,17 +1,19 @@
 import logging
-import random
 import json
 import os
 import functools
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from time import time, sleep
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.common.exceptions import TimeoutException
 
 from ..constants import BASE_PATH
+from .http_fetcher import EastMoneyHttpFetcher
+from .rate_limiter import TokenBucketRateLimiter
+from .driver_pool import DriverPool
+from .price_store import FundPriceStore
+from . import page_parser
+from .progress import report
+from .instrumentation import count, record, span
 
 # flag = 0x08000000  # No-Window flag
 # webdriver.common.service.subprocess.Popen = functools.partial(
@@ -33,131 +35,389 @@ class EastMoneyFundScraper:
         request_pause: int = 15,
         random_pauses: bool = True,
         driver: str = "firefox",
+        fetch_backend: str = "selenium",
+        http_concurrency: int = 8,
+        requests_per_second: float = None,
+        request_burst: int = 1,
+        page_cache=None,
+        driver_pool_size: int = 1,
+        history=None,
     ):
         self.driver_options_arguments = driver_options_arguments
         self.page_timeout = page_timeout
         self.request_pause = request_pause
         self.random_pauses = random_pauses
 
+        # one request every request_pause seconds, unless a rate is given
+        if requests_per_second is None:
+            requests_per_second = 1 / request_pause if request_pause else 0
+        self.rate_limiter = TokenBucketRateLimiter(
+            rate=requests_per_second, burst=request_burst, jitter=random_pauses
+        )
+
+        # raw page bodies are kept on disk so a re-run only loads missing pages
+        self.page_cache = page_cache
+
+        # prices and rankings scraped before, funds are only asked for the newer dates
+        self.history = history
+        self.last_dates = {}  # <id>: latest date in the history, for funds_url
+
         self.base_url_ranking = "http://fundf10.eastmoney.com/jdzf_"
         self.base_url_funds = "http://fundf10.eastmoney.com/jjjz_"
-        self.driver = None
-        self.data = {"ranking": {}, "funds": {}, "top": []}
+        self.data = {"ranking": {}, "funds": FundPriceStore(), "top": []}
         self.updated = False
         self.is_on = False
         self.first = True
         self.funds_page = 1
         self.driver = driver
 
+        # the webdriver sessions, pages lease a session each (see start_driver)
+        self.driver_pool = None
+        self.driver_pool_size = driver_pool_size
+
+        # "selenium" loads every page in the webdriver, "http" fetches the static
+        # pages (funds and ranking) over plain http and only uses the webdriver for the rest
+        self.fetch_backend = fetch_backend
+        self.http_fetcher = None
+        if fetch_backend == "http":
+            self.http_fetcher = EastMoneyHttpFetcher(
+                max_concurrency=http_concurrency,
+                timeout=page_timeout,
+                rate_limiter=self.rate_limiter,
+                page_cache=page_cache,
+            )
+        self._prefetched = {}
+
     def __str__(self) -> str:
         return f"EastMoneyFund parser | data updated: {self.updated}"
 
-    def start_driver(self) -> bool:
+    def start_driver(self, wait: bool = False) -> bool:
+        """
+        Starts the pool of webdriver sessions. The browsers are started in the
+        background; pages wait for the first session to be ready.
+        With wait, the sessions are started before it returns, and it returns
+        False if none of them started.
+        """
         if self.driver == "firefox":
-            self.start_firefox_driver()
+            factory = self.start_firefox_driver
         elif self.driver == "chrome":
-            self.start_chrome_driver()
+            factory = self.start_chrome_driver
+        else:
+            logging.error(f"[start driver] Unknown driver {self.driver}")
+            return False
 
-    def start_firefox_driver(self, driver_path: str = "geckodriver.exe") -> bool:
-        try:
-            logging.info("[start driver] starting geckodriver")
-            options = Options()
-            for arg in self.driver_options_arguments:
-                logging.debug(f"[start driver] added option to driver: {arg}")
-                options.add_argument(arg)
+        self.driver_pool = DriverPool(factory, size=self.driver_pool_size)
+        self.driver_pool.warm(background=not wait)
+        if wait and self.driver_pool.live == 0:
+            logging.error("[start driver] No webdriver session could be started")
+            self.driver_pool.close()
+            return False
+        self.is_on = True
+        return True
 
-            profile = webdriver.FirefoxProfile()
+    def start_firefox_driver(self, driver_path: str = "geckodriver.exe"):
+        """Starts and returns a firefox webdriver session"""
+        # selenium is only loaded once a session is started
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
 
-            profile.set_preference(
-                "general.useragent.override",
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:90.0) Gecko/20100101 Firefox/90.0",
-            )
+        logging.info("[start driver] starting geckodriver")
+        options = Options()
+        for arg in self.driver_options_arguments:
+            logging.debug(f"[start driver] added option to driver: {arg}")
+            options.add_argument(arg)
 
-            self.driver = webdriver.Firefox(
-                firefox_profile=profile, options=options, executable_path=driver_path
-            )
-            self.driver.set_page_load_timeout(self.page_timeout)
-            self.is_on = True
-        except Exception as e:
-            logging.error(e)
-            logging.error("[start driver] The selenium driver failed to start.")
-            return False
-        return True
+        profile = webdriver.FirefoxProfile()
 
-    def start_chrome_driver(self, driver_path: str = "chromedriver.exe") -> bool:
-        try:
-            logging.info("[start driver] starting chromedriver")
-            options = Options()
-            for arg in self.driver_options_arguments:
-                logging.debug(f"[start driver] added option to driver: {arg}")
-                options.add_argument(arg)
+        profile.set_preference(
+            "general.useragent.override",
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:90.0) Gecko/20100101 Firefox/90.0",
+        )
+
+        driver = webdriver.Firefox(
+            firefox_profile=profile, options=options, executable_path=driver_path
+        )
+        driver.set_page_load_timeout(self.page_timeout)
+        return driver
+
+    def start_chrome_driver(self, driver_path: str = "chromedriver.exe"):
+        """Starts and returns a chrome webdriver session"""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service as ChromeService
+
+        logging.info("[start driver] starting chromedriver")
+        options = Options()
+        for arg in self.driver_options_arguments:
+            logging.debug(f"[start driver] added option to driver: {arg}")
+            options.add_argument(arg)
 
-            # options.add_argument("--remote-debugging-port=9222")
+        # options.add_argument("--remote-debugging-port=9222")
 
-            options.binary_location = (
-                r"C:\Program Files\Google\Chrome\Application\chrome.exe"
+        options.binary_location = (
+            r"C:\Program Files\Google\Chrome\Application\chrome.exe"
+        )
+        # options.binary_location = driver_path
+        logging.info(driver_path)
+        logging.info(os.path.join(BASE_PATH, "drivers", driver_path))
+        # logging.info(options)
+        chrome_service = ChromeService(os.path.join(BASE_PATH, "drivers", driver_path))
+        chrome_service.creation_flags = subprocess.CREATE_NO_WINDOW
+        driver = webdriver.Chrome(
+            options=options,
+            executable_path=os.path.join(BASE_PATH, "drivers", driver_path),
+            service=chrome_service,
+        )
+        driver.set_page_load_timeout(self.page_timeout)
+        return driver
+
+    def funds_url(self, id: str) -> str:
+        if str(id) in self.last_dates:
+            return (
+                f"{self.base_url_funds}{id}.html?startDate={self.last_dates[str(id)]}"
             )
-            # options.binary_location = driver_path
-            logging.info(driver_path)
-            logging.info(os.path.join(BASE_PATH, "drivers", driver_path))
-            # logging.info(options)
-            chrome_service = ChromeService(
-                os.path.join(BASE_PATH, "drivers", driver_path)
+        return f"{self.base_url_funds}{id}.html"
+
+    def ranking_url(self, id: str) -> str:
+        return f"{self.base_url_ranking}{id}.html"
+
+    def load_history(self, missing_funds: dict, progress_callback=None) -> dict:
+        """
+        Loads the stored price history of the funds in missing_funds into data['funds']
+        and returns the part of missing_funds that still has to be scraped: the funds
+        that have a missing date newer than their latest stored date. Those funds
+        are only asked for the prices since that date.
+        """
+        if self.history is None or not missing_funds:
+            return missing_funds
+
+        ids = [str(id) for id in missing_funds]
+        for id, prices in self.history.prices(ids).items():
+            if prices:
+                self.data["funds"].merge(id, prices)
+        latest = self.history.latest_dates(ids)
+
+        to_scrape = {}
+        for id, dates in missing_funds.items():
+            last_date = latest.get(str(id))
+            self.last_dates.pop(str(id), None)
+            if last_date is None:
+                to_scrape[id] = dates
+            elif any(date > last_date for _, date in dates["missing-dates"]):
+                to_scrape[id] = dates
+                self.last_dates[str(id)] = last_date
+
+        logging.info(
+            f"[history] {len(missing_funds) - len(to_scrape)}/{len(missing_funds)} funds are up to date in the history database"
+        )
+        progress_callback.emit(
+            f"[history] {len(missing_funds) - len(to_scrape)}/{len(missing_funds)} funds are up to date in the history database"
+        )
+        return to_scrape
+
+    def prefetch_pages(
+        self, urls: list, run_threads=None, progress_callback=None
+    ) -> int:
+        """
+        Loads the given pages concurrently and keeps them until they are requested
+        through _get_page. Pages supported by the http backend are fetched over http,
+        the rest are loaded in parallel by the sessions of the driver pool.
+        Returns the number of pages that were prefetched.
+        """
+        urls = [
+            url
+            for url in dict.fromkeys(urls)
+            if url not in self._prefetched
+            and not (self.page_cache is not None and self.page_cache.is_fresh(url))
+        ]
+        http_urls = []
+        if self.http_fetcher is not None:
+            http_urls = [url for url in urls if self.http_fetcher.supports(url)]
+        driver_urls = [url for url in urls if url not in http_urls]
+        if self.driver_pool is None or self.driver_pool.size == 1:
+            # one session loads the pages one by one anyway
+            driver_urls = []
+
+        if not http_urls and not driver_urls:
+            return 0
+
+        logging.info(
+            f"[prefetch] fetching {len(http_urls)} pages over http and {len(driver_urls)} with the webdriver"
+        )
+        progress_callback.emit(
+            f"[prefetch] fetching {len(http_urls)} pages over http and {len(driver_urls)} with the webdriver"
+        )
+        t = time()
+        should_continue = (lambda: run_threads.flag) if run_threads else None
+
+        pages = {}
+        if http_urls:
+            # the fetcher caches the responses it builds the pages from
+            pages.update(
+                self.http_fetcher.fetch_many(http_urls, should_continue=should_continue)
             )
-            chrome_service.creation_flags = subprocess.CREATE_NO_WINDOW
-            self.driver = webdriver.Chrome(
-                options=options,
-                executable_path=os.path.join(BASE_PATH, "drivers", driver_path),
-                service=chrome_service,
+        if driver_urls:
+            pages.update(
+                self._load_many_in_drivers(
+                    driver_urls, should_continue, progress_callback
+                )
             )
-            self.driver.set_page_load_timeout(self.page_timeout)
-            self.is_on = True
-        except Exception as e:
-            logging.error(e)
-            logging.error("[start driver] The selenium driver failed to start.")
-            return False
-        return True
+        self._prefetched.update(pages)
+        record("fetch.batch", time() - t)
+        count("pages.fetched", len(pages))
+
+        total = len(http_urls) + len(driver_urls)
+        logging.info(
+            f"[prefetch] fetched {len(pages)}/{total} pages in {round(time()-t, 3)} seconds"
+        )
+        progress_callback.emit(
+            f"[prefetch] fetched {len(pages)}/{total} pages in {round(time()-t, 3)} seconds"
+        )
+        return len(pages)
+
+    def _load_many_in_drivers(
+        self, urls: list, should_continue=None, progress_callback=None
+    ) -> dict:
+        """Loads the pages with one worker per session of the driver pool"""
+
+        def load(url):
+            if should_continue is not None and not should_continue():
+                return url, None
+            return url, self._get_page_selenium(url, progress_callback)
+
+        with ThreadPoolExecutor(max_workers=self.driver_pool.size) as executor:
+            return {
+                url: page for url, page in executor.map(load, urls) if page is not None
+            }
 
     def _get_page(
         self, url: str, progress_callback=None, progress_callback_num=None
-    ) -> bool:
-        """Loads the page url from the webdriver."""
-        pause = self.request_pause
-        if self.random_pauses:
-            pause += random.randint(-5, 5)
+    ) -> str:
+        """
+        Loads the page url and returns its html, or None if the page could not be loaded.
+        Pages that were prefetched are returned right away; pages supported by the
+        http backend are fetched over http; everything else goes through the webdriver.
+        """
+        if url in self._prefetched:
+            logging.info(f"[get page] using prefetched page data {url}")
+            count("pages.prefetched")
+            return self._prefetched.pop(url)
 
-        logging.info(f"[get page] Pausing for {pause} seconds")
-        progress_callback.emit(f"[get page] Pausing for {pause} seconds")
-        sleep(pause)
+        if self.http_fetcher is not None and self.http_fetcher.supports(url):
+            # the fetcher caches the responses it builds the page from, with their
+            # validators, so the page itself is not cached here
+            return self._get_page_http(url, progress_callback=progress_callback)
+
+        if self.page_cache is not None:
+            page = self.page_cache.get(url)
+            if page is not None:
+                count("pages.cached")
+                logging.info(f"[get page] using cached page data {url}")
+                progress_callback.emit(f"[get page] using cached page data {url}")
+                return page
+
+        return self._get_page_selenium(url, progress_callback)
+
+    def _get_page_selenium(self, url: str, progress_callback=None) -> str:
+        """Loads a page in a session leased from the driver pool."""
+        from selenium.common.exceptions import TimeoutException
+
+        self._wait_for_rate_limit(progress_callback)
 
-        logging.info(f"[get page] getting page data {url}...")
-        progress_callback.emit(f"[get page] getting page data {url}...")
-        t = time()
         try:
-            self.driver.get(url)
-        except TimeoutException as e:
-            logging.error(
-                f"[get page] The webdriver reached the timeout limit at {self.page_timeout} seconds."
-            )
-            progress_callback.emit(
-                f"[get page] The webdriver reached the timeout limit at {self.page_timeout} seconds"
-            )
-            self.driver.execute_script("window.stop();")
-            return True
+            with self.driver_pool.lease() as driver:
+                logging.info(f"[get page] getting page data {url}...")
+                progress_callback.emit(f"[get page] getting page data {url}...")
+                t = time()
+                try:
+                    with span("fetch.selenium"):
+                        driver.get(url)
+                except TimeoutException as e:
+                    logging.error(
+                        f"[get page] The webdriver reached the timeout limit at {self.page_timeout} seconds."
+                    )
+                    progress_callback.emit(
+                        f"[get page] The webdriver reached the timeout limit at {self.page_timeout} seconds"
+                    )
+                    driver.execute_script("window.stop();")
+                    count("pages.timeout")
+                    self.rate_limiter.penalize()
+                    return driver.page_source
+                page = driver.page_source
         except Exception as e:
+            # the pool restarts the session if it crashed
             logging.critical(e)
             logging.critical("[get page] The webdriver failed to get the page.")
             progress_callback.emit("[get page] The webdriver failed to get the page.")
-            return False
+            self.rate_limiter.penalize()
+            return None
 
         logging.info(
             f"[get page] Page {url} was loaded in {round(time()-t, 3)} seconds"
         )
-        progress_callback.emit(
-            f"[get page] Page {url} was loaded in {round(time()-t, 3)} seconds"
+        report(
+            progress_callback,
+            "page",
+            f"[get page] Page {url} was loaded",
+            duration=time() - t,
         )
+        self.rate_limiter.reward()
 
-        return True
+        if self.page_cache is not None:
+            self.page_cache.put(url, page)
+        return page
+
+    def _discard_page(self, url: str):
+        """
+        Called when a loaded page could not be parsed. The page is most likely
+        incomplete or a block page, so it is dropped from the cache and the
+        requests are slowed down.
+        """
+        self.rate_limiter.penalize()
+        if self.http_fetcher is not None and self.http_fetcher.supports(url):
+            self.http_fetcher.invalidate(url)
+        elif self.page_cache is not None:
+            self.page_cache.invalidate(url)
+
+    def _wait_for_rate_limit(self, progress_callback=None):
+        """Waits only if the request budget of the rate limiter has run out."""
+        waited = self.rate_limiter.acquire()
+        record("pause", waited)
+        if waited:
+            logging.info(
+                f"[get page] Waited {round(waited, 3)} seconds for the rate limit"
+            )
+            progress_callback.emit(
+                f"[get page] Waited {round(waited, 3)} seconds for the rate limit"
+            )
+
+    def _get_page_http(self, url: str, progress_callback=None) -> str:
+        """Fetches a single page with the http backend."""
+        logging.info(f"[get page] getting page data over http {url}...")
+        progress_callback.emit(f"[get page] getting page data over http {url}...")
+        t = time()
+        try:
+            with span("fetch.http"):
+                page = self.http_fetcher.fetch_page(url)
+        except Exception as e:
+            # the fetcher already slows the rate limiter down for timeouts and blocks
+            logging.critical(e)
+            logging.critical("[get page] The http backend failed to get the page.")
+            progress_callback.emit(
+                "[get page] The http backend failed to get the page."
+            )
+            return None
+
+        logging.info(
+            f"[get page] Page {url} was loaded in {round(time()-t, 3)} seconds"
+        )
+        report(
+            progress_callback,
+            "page",
+            f"[get page] Page {url} was loaded",
+            duration=time() - t,
+        )
+        return page
 
     def parse_funding_page(
         self,
@@ -173,25 +433,12 @@ class EastMoneyFundScraper:
         """
 
         # load the funds page for this id
-        if not self._get_page(
-            f"{self.base_url_funds}{id}.html",
+        page = self._get_page(
+            self.funds_url(id),
             progress_callback=progress_callback,
             progress_callback_num=progress_callback_num,
-        ):
-            return False
-
-        # parse the html
-        soup = None
-        try:
-            soup = BeautifulSoup(self.driver.page_source, "html.parser")
-        except Exception as e:
-            logging.error(e)
-            logging.error(
-                f"[parse funds] Something went wrong while parsing the funds page for {id}"
-            )
-            progress_callback.emit(
-                f"[parse funds] Something went wrong while parsing the funds page for {id}"
-            )
+        )
+        if page is None:
             return False
 
         funds_data = self.data["funds"]
@@ -199,27 +446,26 @@ class EastMoneyFundScraper:
         ###########################
         # get price table
         try:
-            prices = {}
-            table = soup.find("table", {"class": "lsjz"})
-
-            tbody = table.find("tbody")
-            rows = tbody.find_all("tr")
-
-            for row in rows:
-                attr = row.find_all("td")
-                prices[attr[0].text.strip()] = attr[1].text.strip()
-
-            funds_data[id] = prices
+            with span("parse.funds"):
+                prices = page_parser.parse_prices(page)
+            funds_data.merge(id, prices)
+            if self.history is not None:
+                self.history.add_prices(id, prices)
 
             logging.info(
                 f"[parse funds] Retrieved funds history for {id} {prices.keys()}"
             )
-            progress_callback.emit(
-                f"[parse funds] Retrieved funds history for {id} {prices.keys()}"
+            report(
+                progress_callback,
+                "funds",
+                f"[parse funds] Retrieved {len(prices)} prices for {id}",
+                fund_id=id,
+                count=len(prices),
             )
 
         except Exception as e:
             logging.critical(e)
+            self._discard_page(self.funds_url(id))
             logging.critical(
                 f"[parse funds] Something went wrong while parsing the page html.\
                 Make sure you aren't being blocked from loading the page and are using a sufficient pause between requests."
@@ -241,82 +487,38 @@ class EastMoneyFundScraper:
         """
 
         # load the ranking page for this id
-        if not self._get_page(
-            f"{self.base_url_ranking}{id}.html",
+        page = self._get_page(
+            self.ranking_url(id),
             progress_callback=progress_callback,
             progress_callback_num=progress_callback_num,
-        ):
-            return False
-
-        # parse the html
-        soup = None
-        try:
-            soup = BeautifulSoup(self.driver.page_source, "html.parser")
-        except Exception as e:
-            logging.error(e)
-            logging.error(
-                f"[parse ranking] Something went wrong while parsing the ranking page for {id}"
-            )
-            progress_callback.emit(
-                f"[parse ranking] Something went wrong while parsing the ranking page for {id}"
-            )
+        )
+        if page is None:
             return False
 
         ranking_data = self.data["ranking"]
         ranking_data[id] = []
 
         ###########################
-        # get the top info bar
+        # get the top info bar and the table with historical prices
         try:
-            info = soup.find("div", {"class": "bs_jz"})
-
-            # get the SECOND label from the right column's row1
-            label = (
-                (info.find("div", {"class": "col-right"}))
-                .find("p", {"class": "row1"})
-                .find_all("label")[1]
-            )
-
-            label_texts = [s.strip() for s in label.text.strip().split("\n")]
-
-            # 1. get the date
-            date = label_texts[0]
-            date = date[date.find("（") + 1 : date.find("）")]
-            ranking_data[id].append(date)
-
-            # get the initial prices
-            prices = label_texts[2]
-            prices = prices.split(" ( ")
-            # 2.
-            ranking_data[id].append(prices[0])
-            # 3.
-            ranking_data[id].append(prices[1].strip(" )"))
-
-            #################################
-            # get table with historical prices
-            table = (
-                (soup.find("div", {"id": "jdzftable"}))
-                .find("div", {"class": "jdzfnew"})
-                .find_all("ul")
-            )
-
-            for tbl_element in table[1:-1]:
-                ranking_data[id].append(tbl_element.find_all("li")[1].text.strip())
-
-            # name = get_name_from_id(id)
-            # temp = ranking_data[id]
-            # ranking_data[id] = {}
-            # ranking_data[id]['name'] = name
-            # ranking_data[id]['info'] = temp
+            with span("parse.ranking"):
+                ranking_data[id] = page_parser.parse_ranking(page)
+            if self.history is not None:
+                self.history.add_ranking(id, ranking_data[id])
 
             self.updated = True
 
             logging.info(f"Fetched ranking data for {id} with info {ranking_data[id]}")
-            progress_callback.emit(
-                f"Fetched ranking data for {id} with info {ranking_data[id]}"
+            report(
+                progress_callback,
+                "ranking",
+                f"Fetched ranking data for {id}",
+                fund_id=id,
+                count=len(ranking_data[id]),
             )
         except Exception as e:
             logging.critical(e)
+            self._discard_page(self.ranking_url(id))
             logging.critical(
                 f"[parse ranking] Something went wrong while parsing the page html.\
                 Make sure you aren't being blocked from loading the page and are using a sufficient pause between requests."
@@ -336,47 +538,40 @@ class EastMoneyFundScraper:
         All of the data gets stored into data['top'] as a list of two-tuples,
         (<id>, <name>)
         """
-        if not self._get_page(
+        top = self.fetch_top(
             url,
             progress_callback=progress_callback,
             progress_callback_num=progress_callback_num,
-        ):
-            return False
-
-        # parse the html
-        soup = None
-        try:
-            soup = BeautifulSoup(self.driver.page_source, "html.parser")
-        except Exception as e:
-            logging.error(e)
-            logging.error(
-                f"[parse top] Something went wrong while parsing the top ranking page"
-            )
-            progress_callback.emit(
-                f"[parse top] Something went wrong while parsing the top ranking page"
-            )
+        )
+        if top is None:
             return False
+        self.data["top"].extend(top)
+        return True
 
-        top_ids = self.data["top"]
+    def fetch_top(self, url, progress_callback=None, progress_callback_num=None):
+        """
+        Same as parse_top, but returns the list of (<id>, <name>) instead of storing
+        it, so several top pages can be loaded at once. Returns None on failure.
+        """
+        page = self._get_page(
+            url,
+            progress_callback=progress_callback,
+            progress_callback_num=progress_callback_num,
+        )
+        if page is None:
+            return None
 
         try:
-            body = (soup.find("table", {"id": "dbtable"})).find("tbody")
-
-            rows = body.find_all("tr")
-            for row in rows:
-                cols = row.find_all("td")
-                id = (cols[2]).find("a").text.strip()
-                name = (cols[3]).find("a").get("title")
-                # link = (cols[3]).find("a").get("href")
-                # name = (cols[3]).find("a").text.strip()
-                top_ids.append([id, name])
+            with span("parse.top"):
+                top = page_parser.parse_top(page)
 
             self.updated = True
 
-            logging.info(f"Fetched top ranking data {len(top_ids)}")
-            progress_callback.emit(f"Fetched top ranking data {len(top_ids)}")
+            logging.info(f"Fetched top ranking data {len(top)}")
+            progress_callback.emit(f"Fetched top ranking data {len(top)}")
         except Exception as e:
             logging.critical(e)
+            self._discard_page(url)
             logging.critical(
                 f"[parse top] Something went wrong while parsing the page html.\
                 Make sure you aren't being blocked from loading the page and are using a sufficient pause between requests."
@@ -385,22 +580,27 @@ class EastMoneyFundScraper:
                 f"[parse top] Something went wrong while parsing the page html.\
                 Make sure you aren't being blocked from loading the page and are using a sufficient pause between requests."
             )
-            return False
-        return True
+            return None
+        return top
 
     def export_data(self, path: str):
+        data = {**self.data, "funds": self.data["funds"].to_dict()}
         with open(path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f)
+            json.dump(data, f)
             logging.info(f"[export web scraper data] saved data to {path}")
 
     def click_next_page(self):
         self.funds_page += 1
-        self.driver.find_element_by_css_selector("#pnum").send_keys(
-            str(self.funds_page)
-        )
-        self.driver.find_element_by_css_selector(".pgo").click()
-        time.sleep(3)
+        with self.driver_pool.lease() as driver:
+            driver.find_element_by_css_selector("#pnum").send_keys(str(self.funds_page))
+            driver.find_element_by_css_selector(".pgo").click()
+            sleep(3)
 
     def stop_driver(self):
-        self.driver.quit()
+        if self.driver_pool is not None:
+            self.driver_pool.close()
         self.is_on = False
+        if self.http_fetcher is not None:
+            self.http_fetcher.close()
+        if self.page_cache is not None:
+            self.page_cache.save()
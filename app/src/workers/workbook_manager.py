@@ -1,14 +1,114 @@
 import logging
 import traceback
-import requests
-from bs4 import BeautifulSoup
 from copy import copy
+from itertools import islice
 from datetime import date as datetimedate, timedelta
+from time import time
 from shutil import copyfile
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill, Alignment, Font
 from openpyxl.utils import get_column_letter
-from openpyxl.formula.translate import Translator
+from math import isnan
+import numpy as np
+
+from .formula_template import FormulaTemplate
+from .instrumentation import span, timed
+from .lazy_workbook import LazyWorkbook
+from .name_cache import FundNameCache
+from .price_store import FundPriceStore
+from .workbook_package import save_changed_sheets
+
+# the number of rows of a block of a top sheet (#1 to #50)
+TOP_BLOCK_ROWS = 50
+
+# the formulas and formatting of the columns of a new block of a top sheet, as
+# (<column>, <formula>, <style>), the rows of the formula are the row of the
+# cell and the first and last rows of the new block and of the previous one
+_CENTER = Alignment(horizontal="center", vertical="center")
+_BLUE = PatternFill("solid", fgColor="D2E2FF")
+_SMALL = Font(size=9)
+_RANKING = "基金排队!D$3:AA$200, MATCH(D{row},基金排队!D$3:D$200,0)"
+_HOLDING = (
+    "=IFERROR(INDEX(" + _RANKING + ",{n}),"
+    "IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row},基金排队!AB$3:AB$200,0),{n}),"
+    'IFERROR(IF(MATCH(D{row},历史排队!D$2:D$200,0),"已清仓"),'
+    'IFERROR(IF(MATCH(D{row},历史排队!AB$2:AB$200,0),"已清仓"),"从未建仓"))))'
+)
+_DETAIL = "=IFERROR(INDEX(" + _RANKING + ',{n}),"")'
+_C_TYPE = "INDEX(基金排队!$D$3:$AB$200, MATCH($D{row},基金排队!$D$3:$D$200,0),25)"
+TOP_BLOCK_COLUMNS = [
+    # column A：持仓/清仓情况
+    (
+        1,
+        '=IFERROR(IF(MATCH(D{row},基金日记!$1:$1,FALSE),"持仓","error1"),IFERROR(IF(MATCH(AB{row},基金日记!$1:$1,FALSE),"持仓","error2"),IFERROR(IF(MATCH(D{row},历史日记!$1:$1,FALSE),"X","error3"),IFERROR(IF(MATCH(AB{row},历史日记!$1:$1,FALSE),"X","error4"),"N"))))',
+        {"font": _SMALL},
+    ),
+    # column B：排名上升/下降情况
+    (
+        2,
+        '=IFERROR((INDEX(C{previous_first}:C{previous_last},MATCH(D{row},D{previous_first}:D{previous_last},FALSE),1)-C{row}),"new")',
+        {"alignment": Alignment(horizontal="right", vertical="center")},
+    ),
+    # column C: fund's ranking position
+    (3, None, {"fill": PatternFill("solid", fgColor="FCE4D6")}),
+    # column D: fund's code
+    (4, None, {"alignment": _CENTER, "fill": _BLUE}),
+    # column E: fund's name
+    (5, None, {"font": _SMALL}),
+    # column F: date
+    (6, None, {"alignment": _CENTER, "fill": _BLUE}),
+    # column G: price
+    (7, None, {"fill": _BLUE}),
+    # column R：持仓成本
+    (
+        18,
+        _HOLDING.replace("{n}", "15"),
+        {"fill": _BLUE, "number_format": "#,##0.0000￥", "font": _SMALL},
+    ),
+    # column S：持仓收益
+    (
+        19,
+        _HOLDING.replace("{n}", "16"),
+        {"fill": _BLUE, "number_format": "#,##0.0000￥", "font": _SMALL},
+    ),
+    # column T：盈利百分比 %
+    (
+        20,
+        _HOLDING.replace("{n}", "17"),
+        {"fill": _BLUE, "number_format": "0.00%", "font": _SMALL},
+    ),
+    # column U：夏普比
+    (21, _DETAIL.replace("{n}", "18"), {}),
+    # column V：波动率（标准差）
+    (22, _DETAIL.replace("{n}", "19"), {"number_format": "0.00%"}),
+    # column W：最大回撤
+    (23, _DETAIL.replace("{n}", "20"), {"number_format": "0.00%"}),
+    # column X：收益回撤比
+    (24, _DETAIL.replace("{n}", "21"), {}),
+    # column Y：基金成立日期, = 2021-10-03, if using MMM, that will be 2021-Oct-03
+    (25, _DETAIL.replace("{n}", "22"), {"number_format": "YYYY-MM-DD"}),
+    # column Z：基金经理姓名
+    (26, _DETAIL.replace("{n}", "23"), {"fill": _BLUE, "font": _SMALL}),
+    # column AA：基金规模（亿元）
+    (27, _DETAIL.replace("{n}", "24"), {"fill": _BLUE}),
+    # column AB：C type fund code
+    (
+        28,
+        "=IFERROR(IF("
+        + _C_TYPE
+        + '="","",IFERROR(IF(MATCH('
+        + _C_TYPE
+        + ',$D${first}:$D${last},0),"","error"),'
+        + _C_TYPE
+        + ')),"")',
+        {},
+    ),
+]
+# the formulas are tokenized once, and only their references are filled in per cell
+TOP_BLOCK_COLUMNS = [
+    (col, formula and FormulaTemplate.from_format(formula), style)
+    for col, formula, style in TOP_BLOCK_COLUMNS
+]
 
 
 class WorkbookManager:
@@ -20,20 +120,92 @@ class WorkbookManager:
         - missing_funds: the missing funds for the funds sheet
         - ranking_ids: the ranking ids that need to be scraped for the ranking sheet
             (or top sheets)
+
+    The sheets are read from a read_only workbook that streams their rows, the
+    editable workbook (wb) is only loaded when something is written to it, and
+    then only the sheets that are written to are parsed (see LazyWorkbook).
     """
 
     def __init__(
-        self, path: str = "FundsBook.xlsm", backup: bool = True
+        self,
+        path: str = "FundsBook.xlsm",
+        backup: bool = True,
+        incremental_save: bool = True,
+        top_layout: str = "prepend",
+        name_cache: FundNameCache = None,
     ):  # str='FundsBook.xlsx'
         self.path = path
         self.backup = backup
-        self.wb = load_workbook(path, read_only=False, keep_vba=True)
+        self._wb = None  # the editable workbook, see wb
+        self._lazy = None  # parses the sheets of wb on first access
+        self._reader = None  # the read_only workbook used to read the sheets
         self.missing_funds = None
+        self.filled_cells = {}
         self.ranking_ids = None
+        self.sheet_indexes = {}  # see _funds_index
+
+        # names of the sheets that were written to, only those are saved again
+        self.modified_sheets = set()
+        self.incremental_save = incremental_save
+        # "prepend" (newest top block first) or "append" (newest top block last)
+        self.top_layout = top_layout
+        # fund names by id, for the name column of the ranking sheet
+        self.name_cache = name_cache if name_cache is not None else FundNameCache()
 
         # if self.backup:
         # copyfile(path, f"app/workbooks/backup_{datetimedate.today()}_{path}")
 
+    @property
+    def wb(self):
+        """
+        The editable workbook, it is loaded the first time it is needed. Its sheets
+        are placeholders until they are parsed by _sheet.
+        """
+        if self._wb is None:
+            self._close_reader()
+            t = time()
+            with span("load.workbook"):
+                self._lazy = LazyWorkbook(self.path)
+            self._wb = self._lazy.wb
+            logging.info(f"(Load) Loaded the workbook in {round(time()-t, 3)} seconds")
+        return self._wb
+
+    @wb.setter
+    def wb(self, wb):
+        self._wb = wb
+
+    def _sheet(self, sheet: str):
+        """A sheet of the editable workbook, parsed on first access."""
+        wb = self.wb
+        if self._lazy is not None:
+            return self._lazy[sheet]
+        return wb[sheet]
+
+    def _edit_sheet(self, sheet: str):
+        """A sheet of the editable workbook that is going to be written to."""
+        ws = self._sheet(sheet)
+        self.modified_sheets.add(sheet)
+        return ws
+
+    def _read_sheet(self, sheet: str):
+        """
+        The sheet to read from: the editable one if the workbook is already loaded,
+        otherwise a read_only one that only parses the rows that are iterated over.
+        """
+        if self._wb is not None:
+            return self._sheet(sheet)
+        if self._reader is None:
+            with span("load.reader"):
+                self._reader = load_workbook(
+                    self.path, read_only=True, keep_links=False
+                )
+        return self._reader[sheet]
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
     @staticmethod
     def date_by_adding_business_days(from_date, add_days):
         business_days_to_add = add_days
@@ -46,6 +218,7 @@ class WorkbookManager:
             business_days_to_add -= 1
         return current_date
 
+    @timed("read.funds")
     def read_funds(
         self, sheet: str = "基金日记", progress_callback=None, progress_callback_num=None
     ) -> bool:
@@ -79,7 +252,7 @@ class WorkbookManager:
         try:
             logging.info("(Read funds) Finding missing data for funds sheet")
             progress_callback.emit(f"(Read funds) Finding missing data for funds sheet")
-            ws = self.wb[sheet]
+            ws = self._read_sheet(sheet)
             price_columns = {}
 
             """
@@ -126,13 +299,19 @@ class WorkbookManager:
                 current_day = self.date_by_adding_business_days(current_day, 1)
             """
 
+            # Read the sheet in one pass from the top, only as far down as needed
+            chunks = self._sheet_chunks(ws)
+            values = next(chunks)
+
             # Get the columns of all company funds ids
-            for i in range(ws.max_column + 1):
-                if ws.cell(row=1, column=i + 1).value is not None:
-                    price_columns[ws.cell(row=1, column=i + 1).value] = i + 1
+            for i, id in enumerate(values[0] if len(values) else []):
+                if id is not None:
+                    price_columns[id] = i + 1
 
             # Construct the missing_funds data
-            self.missing_funds = self._get_missing_price_funds(ws, price_columns)
+            self.missing_funds = self._get_missing_price_funds(
+                ws, price_columns, values, chunks
+            )
 
         except Exception as e:
             logging.error(f"(Read funds) Failed to read missing data for funds sheet")
@@ -150,51 +329,115 @@ class WorkbookManager:
         )
         return True
 
-    def _get_missing_price_funds(self, ws, price_columns) -> dict:
+    @staticmethod
+    def _sheet_rows(ws, n_columns: int):
+        """Yields the cell values of the sheet row by row from the top."""
+        yield from ws.iter_rows(max_col=n_columns, values_only=True)
+
+    def _sheet_chunks(self, ws, chunk_size: int = 16):
+        """
+        Reads the cell values of the sheet from the top in one pass, as 2-D object
+        arrays of a growing number of rows. Always yields at least one array.
+        """
+        if ws.max_column is None:
+            # a read_only sheet without its dimensions, they are found by reading it
+            ws.calculate_dimension(force=True)
+        n_columns = ws.max_column
+        rows = self._sheet_rows(ws, n_columns)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            values = np.full((len(chunk), n_columns), None, dtype=object)
+            for i, row in enumerate(chunk):
+                values[i, : len(row)] = row
+            yield values
+            if len(chunk) < chunk_size:
+                return
+            chunk_size = min(chunk_size * 2, 256)
+
+    def _get_missing_price_funds(
+        self, ws, price_columns, values=None, chunks=None
+    ) -> dict:
         """
         A helper function to parse the missing cells for the funds sheet.
+
+        For each fund, the first price at or below row 9 is found, and from that row
+        up every row with a date in column A is recorded until the first empty date.
+        The sheet is only read down to the last of those first prices, and the rows
+        of all the funds are found at once on its values.
         """
         row = 9  # pass the first few rows that may have contents other than price
-        current = None
         missing_price_funds = {}
-
-        for id, col in price_columns.items():
-            # Skip the blank template
-            if id == "000000":
-                continue
-
-            # get the last blank row in this column
-            current_row = row
-            while current is None or current == "":
-                current = ws.cell(row=current_row, column=col).value
-                # print(current)
-                current_row += 1
-
-            # print(current_row)
-            missing_price_funds[id] = {"column": col, "missing-dates": []}
-
-            current_row -= 1
-
-            # record all the missing dates
-            """ column=1 is the date column """
-            while ws.cell(row=current_row, column=1).value is not None:
-                # print(current_row)
-                missing_price_funds[id]["missing-dates"].append(
-                    (
-                        current_row,
-                        (ws.cell(row=current_row, column=1).value).strftime("%Y-%m-%d"),
-                    )
+        # (row, column) -> value of the first price of every fund, the only cell of
+        # the missing ones that already has a value
+        self.filled_cells = {}
+        if values is None:
+            chunks = self._sheet_chunks(ws)
+            values = next(chunks)
+
+        # Skip the blank template
+        ids = [id for id in price_columns if id != "000000"]
+        if ids:
+            cols = np.array([price_columns[id] for id in ids]) - 1
+
+            # the first row with a price of every fund (past the end if there is none)
+            while True:
+                prices = values[row - 1 :, cols]
+                filled = ~(np.equal(prices, None) | np.equal(prices, ""))
+                chunk = None
+                if chunks is not None and not filled.any(axis=0).all():
+                    chunk = next(chunks, None)
+                if chunk is None or len(chunk) == 0:
+                    break
+                values = np.concatenate([values, chunk])
+
+            n_rows = values.shape[0]
+            if n_rows < row:
+                # no price rows yet, none of the funds has a price to start from
+                for id in ids:
+                    missing_price_funds[id] = {
+                        "column": price_columns[id],
+                        "missing-dates": [],
+                    }
+                logging.info(
+                    "(Read missing funds) The funds sheet has no price rows, nothing is missing"
                 )
-                current_row -= 1
+                return missing_price_funds
 
-            # reset and repeat
-            current = None
+            first = np.where(
+                filled.any(axis=0), filled.argmax(axis=0) + row, n_rows + 1
+            )
+
+            # the closest empty date at or above every row, column=1 is the date column
+            dates = np.append(values[:, 0], None)
+            empty_rows = np.where(np.equal(dates, None), np.arange(1, n_rows + 2), 0)
+            last_empty = np.maximum.accumulate(empty_rows)
+            stop = last_empty[first - 1]
+
+            # record all the missing dates, from the first price up
+            date_text = {}
+            for id, col, start, end in zip(ids, cols, first, stop):
+                missing_dates = []
+                for current_row in range(int(start), int(end), -1):
+                    if current_row not in date_text:
+                        date_text[current_row] = dates[current_row - 1].strftime(
+                            "%Y-%m-%d"
+                        )
+                    missing_dates.append((current_row, date_text[current_row]))
+                if start <= n_rows:
+                    self.filled_cells[(int(start), int(col) + 1)] = values[
+                        start - 1, col
+                    ]
+                missing_price_funds[id] = {
+                    "column": int(col) + 1,
+                    "missing-dates": missing_dates,
+                }
 
         logging.info(
             f"(Read missing funds) Done reading missing cells for funds sheet {missing_price_funds}"
         )
         return missing_price_funds
 
+    @timed("write.funds")
     def write_funds(
         self,
         funds_data: dict = {},
@@ -207,35 +450,17 @@ class WorkbookManager:
         The missing_funds should have been initialized beforehand.
         Returns true on success, false on failure.
 
-        funds_data is a dictionary containing items with the format:
+        funds_data is a FundPriceStore, or a dictionary containing items with the format:
         <id> : {<date> : <value>, ...}
         """
         try:
-            ws = self.wb[sheet]
-            count = 0
-
-            for id, dates in self.missing_funds.items():
-                col = dates["column"]
-                for date in dates["missing-dates"]:
-                    row = date[0]
-                    missing_date = date[1]
-                    try:
-                        try:
-                            ws.cell(row=row, column=col).value = float(
-                                funds_data[str(id)][missing_date]
-                            )
-                        except ValueError:
-                            ws.cell(row=row, column=col).value = funds_data[str(id)][
-                                missing_date
-                            ]
-                        count += 1
-                    except KeyError as e:
-                        logging.warning(
-                            f"(Write funds) Tried to write to ({row},{col}) but did not find id or missing date in funds data (KeyError {e})"
-                        )
-                        progress_callback.emit(
-                            f"------------------------- (Write funds) Tried to write to ({row},{col}) but did not find id or missing date in funds data (KeyError {e})"
-                        )
+            if not isinstance(funds_data, FundPriceStore):
+                funds_data = FundPriceStore.from_dict(funds_data)
+
+            cells = []  # (row, column, value)
+            for id in self.missing_funds:
+                cells += self._fund_cells(id, funds_data, progress_callback)
+            count = self._write_cells(cells, sheet)
 
             logging.info(f"(Write funds) Done writing {count} new cells")
             progress_callback.emit(f"(Write funds) Done writing {count} cells")
@@ -248,6 +473,79 @@ class WorkbookManager:
             logging.error(traceback.format_exc())
             return False
 
+    @timed("write.fund")
+    def write_fund(
+        self,
+        id,
+        funds_data: FundPriceStore,
+        sheet: str = "基金日记",
+        progress_callback=None,
+    ) -> int:
+        """
+        Writes the missing dates of one fund, ie. as soon as its page is parsed
+        (see controller.pipeline_funds). The missing_funds should have been
+        initialized beforehand. Returns the number of cells written, False on failure.
+        """
+        try:
+            return self._write_cells(
+                self._fund_cells(id, funds_data, progress_callback), sheet
+            )
+
+        except Exception as e:
+            logging.error(f"(Write funds) Failed to write funds data of {id}")
+            progress_callback.emit(f"(Write funds) Failed to write funds data of {id}")
+            logging.error(traceback.format_exc())
+            return False
+
+    def _fund_cells(self, id, funds_data: FundPriceStore, progress_callback) -> list:
+        """The (row, column, value) cells of the missing dates of one fund."""
+        dates = self.missing_funds[id]
+        col = dates["column"]
+        missing_dates = [date[1] for date in dates["missing-dates"]]
+        # look up all of the missing dates of this fund at once
+        prices = funds_data.lookup(str(id), missing_dates)
+
+        cells = []
+        for (row, missing_date), price in zip(dates["missing-dates"], prices):
+            if not isnan(price):
+                cells.append((row, col, float(price)))
+                continue
+
+            # not a number on the page, write the text as it is
+            text = funds_data.text(str(id), missing_date)
+            if text is not None:
+                cells.append((row, col, text))
+                continue
+
+            e = repr(str(id)) if str(id) not in funds_data else repr(missing_date)
+            logging.warning(
+                f"(Write funds) Tried to write to ({row},{col}) but did not find id or missing date in funds data (KeyError {e})"
+            )
+            progress_callback.emit(
+                f"------------------------- (Write funds) Tried to write to ({row},{col}) but did not find id or missing date in funds data (KeyError {e})"
+            )
+        return cells
+
+    def _write_cells(self, cells: list, sheet: str) -> int:
+        """
+        Writes (row, column, value) cells to the sheet, except the ones that read_funds
+        found with the same value. Returns the number of cells written.
+        """
+        cells = [
+            (row, col, value)
+            for row, col, value in cells
+            if (row, col) not in self.filled_cells
+            or self.filled_cells[(row, col)] != value
+        ]
+
+        # the editable workbook is only loaded if there is something new to write
+        if cells:
+            ws = self._edit_sheet(sheet)
+            for row, col, value in cells:
+                ws.cell(row=row, column=col).value = value
+        return len(cells)
+
+    @timed("read.rankings")
     def read_rankings(
         self, sheet: str = "基金排队", progress_callback=None, progress_callback_num=None
     ) -> bool:
@@ -260,10 +558,10 @@ class WorkbookManager:
         where the company id was written. The value can be accessed through Cell.value
         """
         try:
-            ws = self.wb[sheet]
+            ws = self._read_sheet(sheet)
             self.ranking_ids = [
                 id
-                for id in ws["D"]
+                for (id,) in ws.iter_rows(min_col=4, max_col=4)
                 if not str(id.value).startswith("=") and id.value is not None
             ]
 
@@ -282,6 +580,7 @@ class WorkbookManager:
             logging.error(traceback.format_exc())
             return False
 
+    @timed("write.rankings")
     def write_rankings(
         self,
         ranking_data: dict = {},
@@ -308,98 +607,75 @@ class WorkbookManager:
         The ids_override parameter is meant to be used to write to top sheet rankings.
         """
 
-        ws = self.wb[sheet]
+        ws = self._edit_sheet(sheet)
         id_col = 4  # fund's code
         low_col = 6  # date
         high_col = 17  # 5 year value
         count = 0
+        styles = {}  # shared styles of the written cells, see _write_ranking_row
 
         try:
             if not ids_override:
+                # the names of the rows that get values, fetched before writing
+                self.prefetch_names(
+                    [
+                        id
+                        for (id,) in ws.iter_rows(
+                            min_col=id_col, max_col=id_col, values_only=True
+                        )
+                        if ranking_data.get(str(id))
+                    ],
+                    progress_callback,
+                )
+
                 for i in range(ws.max_row):
                     id = ws.cell(row=i + 1, column=id_col).value
-                    if not str(id).startswith("=") and id is not None:
-                        for idx, c in enumerate(range(low_col, high_col + 1)):
-                            try:
-                                if idx == 0:
-
-                                    # column D of sheet 基金排队, this is the found's code
-                                    ws.cell(row=i + 1, column=c).value = ranking_data[
-                                        str(id)
-                                    ][idx]
-
-                                    """ jj added the following 3 lines, still need to figure out which are date and price columns """
-                                    # column E of sheet 基金排队, fund's name
-                                    ws.cell(
-                                        row=i + 1, column=id_col + 1
-                                    ).value = self._get_name_from_id(id)
-                                    ws.cell(
-                                        row=i + 1, column=id_col + 1
-                                    ).value = f'=HYPERLINK("https://fund.eastmoney.com/{id}.html", "{self._get_name_from_id(id)}")'
-                                    ws.cell(row=i + 1, column=id_col + 1).font = Font(
-                                        size=9, color="0000ff"
-                                    )
-
-                                    """  
-                                    # columns R,S,T of sheet 基金排队
-                                    ws.cell(row=i+1, column=id_col+14).value = 'R column'
-                                    ws.cell(row=i+1, column=id_col+15).value = 'S column'
-                                    ws.cell(row=i+1, column=id_col+16).value = 'T column'
-                                    """
-
-                                    """
-                                    ??? where are the code lines to write column F (Date column of sheet 基金排队) ???
-                                    """
-
-                                elif ranking_data[str(id)][idx].endswith("%"):
-                                    percent = ranking_data[str(id)][idx][:-1]
-                                    percent = float(percent) / 100
-                                    ws.cell(row=i + 1, column=c).style = "Percent"
-                                    ws.cell(row=i + 1, column=c).number_format = "0.00%"
-                                    ws.cell(row=i + 1, column=c).value = percent
-
-                                else:
-                                    try:
-                                        # column G of sheet 基金排队, the Price column
-                                        ws.cell(row=i + 1, column=c).value = float(
-                                            ranking_data[str(id)][idx]
-                                        )
-
-                                    except ValueError:
-                                        ws.cell(
-                                            row=i + 1, column=c
-                                        ).value = ranking_data[str(id)][idx]
-
-                                count += 1
-                            except KeyError as e:
-                                logging.warning(
-                                    f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {e}) for {id}"
-                                )
-                                progress_callback.emit(
-                                    f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {e}) for {id}"
-                                )
-
-                            except IndexError as e:
-                                logging.warning(
-                                    f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError {e}) for {id}"
-                                )
-                                progress_callback.emit(
-                                    f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError {e}) for {id}"
-                                )
+                    if str(id).startswith("=") or id is None:
+                        continue
+
+                    values = ranking_data.get(str(id))
+                    if values is None:
+                        for c in range(low_col, high_col + 1):
+                            logging.warning(
+                                f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {str(id)!r}) for {id}"
+                            )
+                            progress_callback.emit(
+                                f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {str(id)!r}) for {id}"
+                            )
+                        continue
+
+                    if values:
+                        # column E of sheet 基金排队, fund's name
+                        name = self._get_name_from_id(id)
+                        name_cell = ws.cell(row=i + 1, column=id_col + 1)
+                        name_cell.value = f'=HYPERLINK("https://fund.eastmoney.com/{id}.html", "{name}")'
+                        name_cell.font = Font(size=9, color="0000ff")
+
+                    # columns F (date), G (price) and onwards
+                    count += self._write_ranking_row(
+                        ws, i + 1, low_col, values[: high_col - low_col + 1], styles
+                    )
+                    for c in range(low_col + len(values), high_col + 1):
+                        logging.warning(
+                            f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError list index out of range) for {id}"
+                        )
+                        progress_callback.emit(
+                            f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError list index out of range) for {id}"
+                        )
 
             else:
                 # Fix for writing to topx sheets
                 # Add to this list to not write to rows
                 exclude_rows = [1]
                 old_ids = []
-                i = 0
 
-                # move current sheet down
-                self.copy_top_range(
+                # open up a new block, on top or under the history (see top_layout)
+                first_row = self.copy_top_range(
                     sheet=sheet,
                     progress_callback=progress_callback,
                     progress_callback_num=progress_callback_num,
                 )
+                i = first_row - 1 if first_row else 0
 
                 while len(ids_override) > 0:
                     if (i + 1) not in exclude_rows:
@@ -418,48 +694,32 @@ class WorkbookManager:
 
                             old_ids.append(a)
 
-                            for idx, c in enumerate(range(low_col, high_col + 1)):
-                                try:
-                                    if idx == 0:
-                                        ws.cell(
-                                            row=i + 1, column=c
-                                        ).value = ranking_data[str(new_id)][idx]
-                                    elif ranking_data[str(new_id)][idx].endswith("%"):
-                                        percent = ranking_data[str(new_id)][idx][:-1]
-                                        percent = float(percent) / 100
-                                        ws.cell(row=i + 1, column=c).style = "Percent"
-                                        ws.cell(
-                                            row=i + 1, column=c
-                                        ).number_format = "0.00%"
-                                        ws.cell(row=i + 1, column=c).value = percent
-                                    else:
-                                        try:
-                                            ws.cell(row=i + 1, column=c).value = float(
-                                                ranking_data[str(new_id)][idx].strip()
-                                            )
-                                            ws.cell(
-                                                row=i + 1, column=c
-                                            ).number_format = "0.0000"
-                                        except ValueError:
-                                            ws.cell(
-                                                row=i + 1, column=c
-                                            ).value = ranking_data[str(new_id)][idx]
-
-                                    count += 1
-                                except KeyError as e:
+                            values = ranking_data.get(str(new_id))
+                            if values is None:
+                                for c in range(low_col, high_col + 1):
                                     logging.error(
-                                        f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {e}) for {id}"
+                                        f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {str(new_id)!r}) for {id}"
                                     )
                                     progress_callback.emit(
-                                        f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {e}) for {id}"
+                                        f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (KeyError {str(new_id)!r}) for {id}"
                                     )
-
-                                except IndexError as e:
+                                values = []
+
+                            count += self._write_ranking_row(
+                                ws,
+                                i + 1,
+                                low_col,
+                                values[: high_col - low_col + 1],
+                                styles,
+                                number_format="0.0000",
+                            )
+                            if str(new_id) in ranking_data:
+                                for c in range(low_col + len(values), high_col + 1):
                                     logging.error(
-                                        f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError {e}) for {id}"
+                                        f"(Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError list index out of range) for {id}"
                                     )
                                     progress_callback.emit(
-                                        f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError {e}) for {id}"
+                                        f"------------------------- (Write ranking) Tried to write to ({i+1, c}) but data was missing (IndexError list index out of range) for {id}"
                                     )
 
                     i += 1
@@ -475,237 +735,212 @@ class WorkbookManager:
             logging.error(traceback.format_exc())
             return False
 
-    def copy_top_range(
-        self, sheet: str = "top50混合", progress_callback=None, progress_callback_num=None
-    ) -> bool:
-        try:
-            ws = self.wb[sheet]
-            id_col = 4  # fund's code, the column for #1 to #50 (company ids)
-
-            # move the whole page down {row_down} rows, except the first row that's the title row
-            row_down = 52
-
-            """ if want to write over the old data(no move down 52 rows), just comment out the following blocks """
-
-            # before move dowm 52 rows, clear columns A and R to AA
-            for idx, row_i in enumerate(range(2, 52), 1):
-                # column A：持仓/清仓情况
-                ws.cell(row=row_i, column=id_col - 3).value = ""
-                # column R to AA
-                ws.cell(row=row_i, column=id_col + 14).value = ""
-                ws.cell(row=row_i, column=id_col + 15).value = ""
-                ws.cell(row=row_i, column=id_col + 16).value = ""
-                ws.cell(row=row_i, column=id_col + 17).value = ""
-                ws.cell(row=row_i, column=id_col + 18).value = ""
-                ws.cell(row=row_i, column=id_col + 19).value = ""
-                ws.cell(row=row_i, column=id_col + 20).value = ""
-                ws.cell(row=row_i, column=id_col + 21).value = ""
-                ws.cell(row=row_i, column=id_col + 22).value = ""
-                ws.cell(row=row_i, column=id_col + 23).value = ""
-                # ws.cell(row=row_i, column=id_col+24).value = "" NOTE: we need this to calculate position difference
-
-            ws.move_range(f"A2:AB{ws.max_row+1}", rows=row_down, translate=True)
-            # copy the first row (title row) down
-            for c in range(1, ws.max_column - 3):
-                ws.cell(row=row_down + 1, column=c).value = ws.cell(
-                    row=1, column=c
-                ).value
-                ws.cell(row=row_down + 1, column=c).fill = PatternFill(
-                    "solid", fgColor="FCE4D6"
-                )
-                # ws.cell(row=row_down+1, column=c).font = Font(name='宋体', size=9, bold=True)
-                ws.cell(row=row_down + 1, column=c).alignment = Alignment(
-                    horizontal="center", vertical="center"
-                )
+    @staticmethod
+    def _ranking_cells(values: list, number_format: str = None) -> list:
+        """
+        Converts the ranking values of a fund once into the typed values of its row,
+        as a list of (<value>, <style>) where <style> is None to keep the style of
+        the cell, "Percent" for the percent style or a number format for numbers.
+        The first value (the date) is kept as it is.
+        """
+        cells = [(values[0], None)] if values else []
+        for value in values[1:]:
+            if value.endswith("%"):
+                cells.append((float(value[:-1]) / 100, "Percent"))
+                continue
+            try:
+                cells.append((float(value.strip()), number_format))
+            except ValueError:
+                cells.append((value, None))
+        return cells
 
-            """ if want to write over the old data(no move down 52 rows), just comment out the above blocks """
+    def _write_ranking_row(
+        self,
+        ws,
+        row: int,
+        first_col: int,
+        values: list,
+        styles: dict,
+        number_format: str = None,
+    ) -> int:
+        """
+        Writes the ranking values of a fund to a row from first_col on, in one pass
+        over the converted values. The percent style is resolved by name once and
+        its style array is shared by copy with every other percent cell, in styles.
+        Returns the number of cells written.
+        """
+        cells = self._ranking_cells(values, number_format)
+        for c, (value, style) in enumerate(cells, first_col):
+            cell = ws.cell(row=row, column=c, value=value)
+            if style == "Percent":
+                if "Percent" not in styles:
+                    cell.style = "Percent"
+                    cell.number_format = "0.00%"
+                    styles["Percent"] = copy(cell._style)
+                else:
+                    cell._style = copy(styles["Percent"])
+            elif style is not None:
+                cell.number_format = style
+        return len(cells)
 
-            # adding numbers, formatting and styles to the new opened up space
-            # this will go through all 50 rows no matter how many funds data need to write (maximum 50)
-            for idx, row_i in enumerate(range(2, 52), 1):
+    def copy_top_range(
+        self, sheet: str = "top50混合", progress_callback=None, progress_callback_num=None
+    ) -> int:
+        """
+        Opens up a new block of 50 rows for the next top ranking of the sheet, with
+        its formulas and formatting, and returns its first row (False on failure).
 
-                # column A：持仓/清仓情况
-                ws.cell(
-                    row=row_i, column=id_col - 3
-                ).value = f'=IFERROR(IF(MATCH(D{row_i},基金日记!$1:$1,FALSE),"持仓","error1"),IFERROR(IF(MATCH(AB{row_i},基金日记!$1:$1,FALSE),"持仓","error2"),IFERROR(IF(MATCH(D{row_i},历史日记!$1:$1,FALSE),"X","error3"),IFERROR(IF(MATCH(AB{row_i},历史日记!$1:$1,FALSE),"X","error4"),"N"))))'
-                ws.cell(row=row_i, column=id_col - 3).font = Font(size=9)
+        With the "prepend" layout the whole history is moved down 52 rows and the new
+        block is on top (rows 2 to 51). With the "append" layout the new block is
+        added under the last one and no history row is ever moved.
+        """
+        try:
+            ws = self._edit_sheet(sheet)
 
-                # column B：排名上升/下降情况
-                ws.cell(
-                    row=row_i, column=id_col - 2
-                ).value = f'=IFERROR((INDEX(C54:C103,MATCH(D{row_i},D54:D103,FALSE),1)-C{row_i}),"new")'
-                ws.cell(row=row_i, column=id_col - 2).alignment = Alignment(
-                    horizontal="right", vertical="center"
-                )
+            if self.top_layout == "append":
+                first_row, previous_row = self._append_top_block(ws)
+                message = f"(Copy top range) Added a new top block at row {first_row}"
+            else:
+                first_row, previous_row = self._prepend_top_block(ws)
+                message = f"(Copy top range) Moved top sheet down {TOP_BLOCK_ROWS + 2} rows and created new formatting on top"
 
-                # column C: fund's ranking position
-                ws.cell(row=row_i, column=id_col - 1).value = idx
-                ws.cell(row=row_i, column=id_col - 1).fill = PatternFill(
-                    "solid", fgColor="FCE4D6"
-                )
+            self._write_top_block(ws, first_row, previous_row)
 
-                # column D: fund's code
-                ws.cell(row=row_i, column=id_col).alignment = Alignment(
-                    horizontal="center", vertical="center"
-                )
-                ws.cell(row=row_i, column=id_col).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
+            logging.info(message)
+            progress_callback.emit(message)
+            return first_row
 
-                # column E: fund's name
-                ws.cell(row=row_i, column=id_col + 1).font = Font(size=9)
+        except Exception as e:
+            logging.error("(Copy top range) Failed to copy top range")
+            progress_callback.emit(f"(Copy top range) Failed to copy top range")
+            logging.error(traceback.format_exc())
+            return False
 
-                # column F: date
-                ws.cell(row=row_i, column=id_col + 2).alignment = Alignment(
-                    horizontal="center", vertical="center"
-                )
-                ws.cell(row=row_i, column=id_col + 2).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
+    @staticmethod
+    def _clear_top_block(ws, first_row: int):
+        """Clears the live columns A and R to AA of a block that becomes history."""
+        id_col = 4
+        for row_i in range(first_row, first_row + TOP_BLOCK_ROWS):
+            # column A：持仓/清仓情况
+            ws.cell(row=row_i, column=id_col - 3).value = ""
+            # column R to AA
+            for c in range(id_col + 14, id_col + 24):
+                ws.cell(row=row_i, column=c).value = ""
+            # ws.cell(row=row_i, column=id_col+24).value = "" NOTE: we need this to calculate position difference
 
-                # column G: price
-                ws.cell(row=row_i, column=id_col + 3).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
+    @staticmethod
+    def _copy_top_title(ws, row: int, n_columns: int):
+        """Copies the first row (title row) to the row above a new block."""
+        for c in range(1, n_columns - 3):
+            ws.cell(row=row, column=c).value = ws.cell(row=1, column=c).value
+            ws.cell(row=row, column=c).fill = PatternFill("solid", fgColor="FCE4D6")
+            # ws.cell(row=row, column=c).font = Font(name='宋体', size=9, bold=True)
+            ws.cell(row=row, column=c).alignment = Alignment(
+                horizontal="center", vertical="center"
+            )
 
-                """ column R：持仓成本 """
-                # ws.cell(row=row_i, column=id_col+14).value = f'=IFERROR(INDEX(基金排队!D$2:AA$200, MATCH(D{row_i},基金排队!D$2:D$200,0),15),"")'
-                ws.cell(
-                    row=row_i, column=id_col + 14
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),15),IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!AB$3:AB$200,0),15),IFERROR(IF(MATCH(D{row_i},历史排队!D$2:D$200,0),"已清仓"),IFERROR(IF(MATCH(D{row_i},历史排队!AB$2:AB$200,0),"已清仓"),"从未建仓"))))'
-                ws.cell(row=row_i, column=id_col + 14).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
-                ws.cell(row=row_i, column=id_col + 14).number_format = "#,##0.0000￥"
-                ws.cell(row=row_i, column=id_col + 14).font = Font(size=9)
-
-                """ column S：持仓收益 """
-                # ws.cell(row=row_i, column=id_col+15).value = f'=IFERROR(INDEX(基金排队!D$2:AA$200, MATCH(D{row_i},基金排队!D$2:D$200,0),16),"")'
-                ws.cell(
-                    row=row_i, column=id_col + 15
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),16),IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!AB$3:AB$200,0),16),IFERROR(IF(MATCH(D{row_i},历史排队!D$2:D$200,0),"已清仓"),IFERROR(IF(MATCH(D{row_i},历史排队!AB$2:AB$200,0),"已清仓"),"从未建仓"))))'
-                ws.cell(row=row_i, column=id_col + 15).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
-                ws.cell(row=row_i, column=id_col + 15).number_format = "#,##0.0000￥"
-                ws.cell(row=row_i, column=id_col + 15).font = Font(size=9)
-
-                """ column T：盈利百分比 % """
-                # ws.cell(row=row_i, column=id_col+16).value = f'=IFERROR(INDEX(基金排队!D$2:AA$200, MATCH(D{row_i},基金排队!D$2:D$200,0),17),"")'
-                ws.cell(
-                    row=row_i, column=id_col + 16
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),17),IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!AB$3:AB$200,0),17),IFERROR(IF(MATCH(D{row_i},历史排队!D$2:D$200,0),"已清仓"),IFERROR(IF(MATCH(D{row_i},历史排队!AB$2:AB$200,0),"已清仓"),"从未建仓"))))'
-                ws.cell(row=row_i, column=id_col + 16).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
-                ws.cell(row=row_i, column=id_col + 16).number_format = "0.00%"
-                ws.cell(row=row_i, column=id_col + 16).font = Font(size=9)
-
-                ws.cell(
-                    row=row_i, column=id_col + 17
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),18),"")'  # U column：夏普比
-
-                ws.cell(
-                    row=row_i, column=id_col + 18
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),19),"")'  # V column：波动率（标准差）
-                ws.cell(
-                    row=row_i, column=id_col + 18
-                ).number_format = "0.00%"  # V column
-
-                ws.cell(
-                    row=row_i, column=id_col + 19
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),20),"")'  # W column：最大回撤
-                ws.cell(
-                    row=row_i, column=id_col + 19
-                ).number_format = "0.00%"  # W column
-
-                ws.cell(
-                    row=row_i, column=id_col + 20
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),21),"")'  # X column：收益回撤比
-
-                ws.cell(
-                    row=row_i, column=id_col + 21
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),22),"")'  # Y column：基金成立日期
-                ws.cell(
-                    row=row_i, column=id_col + 21
-                ).number_format = "YYYY-MM-DD"  # = 2021-10-03, if using MMM, that will be 2021-Oct-03. can be 'YYYY MM DD' too
-
-                ws.cell(
-                    row=row_i, column=id_col + 22
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),23),"")'  # Z column：基金经理姓名
-                ws.cell(row=row_i, column=id_col + 22).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
-                ws.cell(row=row_i, column=id_col + 22).font = Font(size=9)
+    def _prepend_top_block(self, ws) -> tuple:
+        """
+        Moves the whole page down, except the title row. Returns the rows of the new
+        block and of the block before it.
+        """
+        row_down = TOP_BLOCK_ROWS + 2
 
-                ws.cell(
-                    row=row_i, column=id_col + 23
-                ).value = f'=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D{row_i},基金排队!D$3:D$200,0),24),"")'  # AA column：基金规模（亿元）
-                ws.cell(row=row_i, column=id_col + 23).fill = PatternFill(
-                    "solid", fgColor="D2E2FF"
-                )
+        """ if want to write over the old data(no move down 52 rows), just comment out the following blocks """
 
-                # AB column：C type fund code
-                ws.cell(
-                    row=row_i, column=id_col + 24
-                ).value = f'=IFERROR(IF(INDEX(基金排队!$D$3:$AB$200, MATCH($D{row_i},基金排队!$D$3:$D$200,0),25)="","",IFERROR(IF(MATCH(INDEX(基金排队!$D$3:$AB$200, MATCH($D{row_i},基金排队!$D$3:$D$200,0),25),$D$2:$D$51,0),"","error"),INDEX(基金排队!$D$3:$AB$200, MATCH($D{row_i},基金排队!$D$3:$D$200,0),25))),"")'
+        # before move dowm 52 rows, clear columns A and R to AA
+        self._clear_top_block(ws, 2)
+        ws.move_range(f"A2:AB{ws.max_row+1}", rows=row_down, translate=True)
+        # copy the first row (title row) down
+        self._copy_top_title(ws, row_down + 1, ws.max_column)
 
-            logging.info(
-                f"(Copy top range) Moved top sheet down {row_down} rows and created new formatting on top"
-            )
-            progress_callback.emit(
-                f"(Copy top range) Moved top sheet down {row_down} rows and created new formatting on top"
-            )
-            return True
+        """ if want to write over the old data(no move down 52 rows), just comment out the above blocks """
 
-        except Exception as e:
-            logging.error("(Copy top range) Failed to copy top range")
-            progress_callback.emit(f"(Copy top range) Failed to copy top range")
-            logging.error(traceback.format_exc())
-            return False
+        return 2, 2 + row_down
 
+    def _append_top_block(self, ws) -> tuple:
+        """
+        Adds a title row under the last block, past an empty row. Returns the rows
+        of the new block and of the newest block before it, which is the block on top
+        if the sheet was written with the "prepend" layout until now.
+        """
+        last_row = ws.max_row
+        if last_row < 2:  # nothing but the title row
+            return 2, None
+
+        date_col = 6
+        bottom_row = max(2, last_row - TOP_BLOCK_ROWS + 1)
+        top_date = ws.cell(row=2, column=date_col).value
+        bottom_date = ws.cell(row=bottom_row, column=date_col).value
+        previous_row = bottom_row
+        if top_date is not None and str(top_date) > str(bottom_date or ""):
+            previous_row = 2
+
+        n_columns = ws.max_column
+        self._clear_top_block(ws, previous_row)
+        self._copy_top_title(ws, last_row + 2, n_columns)
+        return last_row + 3, previous_row
+
+    def _write_top_block(self, ws, first_row: int, previous_row: int):
+        """
+        Writes the ranking positions, formulas and formatting of a new block of
+        TOP_BLOCK_ROWS rows from first_row. previous_row is the first row of the block
+        the ranking positions are compared with, None if there is no such block.
+        Each formula is filled in from its template in TOP_BLOCK_COLUMNS, and the
+        style of each column is made on its first cell and copied to the others.
+        """
+        rows = {"first": first_row, "last": first_row + TOP_BLOCK_ROWS - 1}
+        if previous_row is not None:
+            rows["previous_first"] = previous_row
+            rows["previous_last"] = previous_row + TOP_BLOCK_ROWS - 1
+        for col, formula, style in TOP_BLOCK_COLUMNS:
+            column_style = None
+            for idx, row_i in enumerate(range(first_row, rows["last"] + 1), 1):
+                cell = ws.cell(row=row_i, column=col)
+                if formula is not None and previous_row is None and col == 2:
+                    cell.value = "new"  # the first block of the sheet
+                elif formula is not None:
+                    cell.value = formula.fill(row=row_i, **rows)
+                elif col == 3:
+                    # column C: fund's ranking position
+                    cell.value = idx
+
+                if column_style is None:
+                    for name, value in style.items():
+                        setattr(cell, name, value)
+                    column_style = cell._style
+                else:
+                    cell._style = copy(column_style)
+
+    @timed("write.buy")
     def buy_funds(
         self, id, amount, date, sheet: str = "基金日记", progress_callback=None
     ) -> bool:
         try:
-            ws = self.wb[sheet]
+            ws = self._edit_sheet(sheet)
+            index = self._funds_index(ws)
             new = False
 
             # Find the column for the company id.
-            col = 1
-            current_col_val = ws.cell(row=1, column=col).value
-            while current_col_val != id:
-                col += 1
-                current_col_val = ws.cell(row=1, column=col).value
-
-                if col >= ws.max_column:
-                    logging.warning(
-                        f"(buy funds) did not find id {id} in the worksheet. Creating new column"
-                    )
-                    progress_callback.emit(
-                        f"(buy funds) did not find id {id} in the worksheet. Creating new column"
-                    )
-                    col = self._create_new_funds_column(id=id, open_sheet=ws)
-                    new = True
-                    break
+            col = index["columns"].get(id)
+            if col is None:
+                logging.warning(
+                    f"(buy funds) did not find id {id} in the worksheet. Creating new column"
+                )
+                progress_callback.emit(
+                    f"(buy funds) did not find id {id} in the worksheet. Creating new column"
+                )
+                col = self._create_new_funds_column(id=id, open_sheet=ws)
+                new = True
 
             # Find the row for the date.
-            row = 9
-            current_row_val = ws.cell(row=row, column=11).value
-            while (
-                current_row_val is None or current_row_val.strftime("%Y-%m-%d") != date
-            ):
-                row += 1
-                current_row_val = ws.cell(row=row, column=11).value
-
-                if row >= ws.max_row:
-                    logging.error(
-                        f"(buy funds) did not find date {date} in the worksheet."
-                    )
-                    progress_callback.emit(
-                        f"(buy funds) did not find date {date} in the worksheet."
-                    )
-                    return False
+            row = index["dates"].get(date)
+            if row is None:
+                logging.error(f"(buy funds) did not find date {date} in the worksheet.")
+                progress_callback.emit(
+                    f"(buy funds) did not find date {date} in the worksheet."
+                )
+                return False
 
             # Insert the amount.
             ws.cell(row=row, column=col - 3).value = float(amount)
@@ -725,32 +960,104 @@ class WorkbookManager:
         progress_callback.emit(f"(buy funds) Inserted {amount} for {id} at date {date}")
         return True
 
+    @timed("write.buy_batch")
+    def buy_funds_batch(
+        self, entries: list, sheet: str = "基金日记", progress_callback=None
+    ) -> bool:
+        """
+        Buys a list of (<id>, <amount>, <date>) entries, in the same workbook and
+        with the same indexes (see _funds_index). Returns true if all of them were
+        inserted.
+        """
+        results = [
+            self.buy_funds(id, amount, date, sheet, progress_callback)
+            for id, amount, date in entries
+        ]
+        logging.info(f"(buy funds) Inserted {sum(results)} of {len(results)} entries")
+        progress_callback.emit(
+            f"(buy funds) Inserted {sum(results)} of {len(results)} entries"
+        )
+        return all(results)
+
+    def _funds_index(self, ws) -> dict:
+        """
+        The indexes of a funds sheet, made the first time it is needed:
+            - columns: <id> -> the column of the id in row 1
+            - dates: <date> ('%Y-%m-%d') -> the row of the date in column K
+        Both keep the first match, like a scan from the left or the top would.
+        """
+        index = self.sheet_indexes.get(ws.title)
+        if index is None:
+            max_row = ws.max_row
+            columns = {}
+            self._index_columns(columns, ws, 1, ws.max_column - 1)
+
+            # column=11 is the date column, from row 9 on
+            dates = {}
+            for row, (cell,) in enumerate(
+                ws.iter_rows(min_row=9, max_row=max_row - 1, min_col=11, max_col=11),
+                9,
+            ):
+                if hasattr(cell.value, "strftime"):
+                    dates.setdefault(cell.value.strftime("%Y-%m-%d"), row)
+
+            index = {"columns": columns, "dates": dates}
+            self.sheet_indexes[ws.title] = index
+        return index
+
+    @staticmethod
+    def _index_columns(columns: dict, ws, first_col: int, last_col: int):
+        """Indexes (again) the ids in row 1 of the columns first_col to last_col."""
+        for id, col in list(columns.items()):
+            if first_col <= col <= last_col:
+                del columns[id]
+        for col in range(first_col, last_col + 1):
+            id = ws.cell(row=1, column=col).value
+            if id is not None and columns.get(id, col) >= col:
+                columns[id] = col
+
     def _create_new_funds_column(self, id, open_sheet) -> int:
+        """
+        Copies the last 8 columns (the template block of a fund) to the right, with
+        their formulas moved 8 columns. A formula is only tokenized again when it is
+        not the one of the row above filled down, see FormulaTemplate.
+        """
         ws = open_sheet
         template_start_col = ws.max_column - 7
         template_end_col = ws.max_column
-
-        for row_num in range(1, ws.max_row + 1):
-            for column_num in range(template_start_col, template_end_col + 1):
-                print(ws.cell(row=row_num, column=column_num).value)
-                ws.cell(row=row_num, column=column_num + 8).value = Translator(
-                    ws.cell(row=row_num, column=column_num).value,
-                    f"{get_column_letter(column_num)}{row_num}",
-                ).translate_formula(row_delta=0, col_delta=8)
-
-                if ws.cell(row=row_num, column=column_num).has_style:
-                    ws.cell(row=row_num, column=column_num + 8)._style = copy(
-                        ws.cell(row=row_num, column=column_num)._style
-                    )
-
-                if column_num in [template_end_col]:
-                    ws.column_dimensions[f"{get_column_letter(column_num+8)}"].width = 2
+        max_row = ws.max_row
+
+        for column_num in range(template_start_col, template_end_col + 1):
+            template = None
+            for row_num in range(1, max_row + 1):
+                source = ws.cell(row=row_num, column=column_num)
+                target = ws.cell(row=row_num, column=column_num + 8)
+                value = source.value
+                if isinstance(value, str) and value.startswith("="):
+                    if template is None or template.at(row_num, column_num) != value:
+                        template = FormulaTemplate(value, row_num, column_num)
+                    value = template.at(row_num, column_num + 8)
+                target.value = value
+
+                if source.has_style:
+                    target._style = copy(source._style)
+
+            if column_num in [template_end_col]:
+                ws.column_dimensions[f"{get_column_letter(column_num+8)}"].width = 2
+                for row_num in range(1, max_row + 1):
                     ws.cell(row=row_num, column=column_num + 8).fill = PatternFill(
                         "solid", fgColor="FFF2CC"
                     )
 
         ws.cell(row=1, column=template_end_col - 4).value = id
 
+        # the template block moved 8 columns right
+        index = self.sheet_indexes.get(ws.title)
+        if index is not None:
+            self._index_columns(
+                index["columns"], ws, template_start_col, template_end_col + 7
+            )
+
         ws.cell(
             row=3, column=template_end_col - 5
         ).value = f'=HYPERLINK("https://fund.eastmoney.com/{id}.html", "{self._get_name_from_id(id)}")'
@@ -758,15 +1065,38 @@ class WorkbookManager:
         return template_end_col - 4
 
     def _get_name_from_id(self, id):
-        try:
-            r = requests.get(f"https://fund.eastmoney.com/{id}.html")
-            soup = BeautifulSoup(r.content, "html.parser")
-            title = soup.find("title")
-            return title.text.strip()[: (title.text.strip().find("("))]
-        except:
-            return "Not found"
+        return self.name_cache.name(id)
+
+    def prefetch_names(self, ids, progress_callback=None):
+        """Looks up the names of the ids that are not cached yet, all at once."""
+        self.name_cache.fetch_many(ids, progress_callback=progress_callback)
 
     def close(self):
-        """Closes the workbook and saves it under the same name."""
-        self.wb.save(self.path)
-        self.wb.close()
+        """
+        Closes the workbook and saves it under the same name.
+        Only the sheets that were written to are serialized again, the rest of the
+        package is copied as it is (see save_changed_sheets). A full save is done
+        when that is not possible, and nothing is saved if nothing was written.
+        """
+        self._close_reader()
+        if not self.modified_sheets:
+            logging.info("(Close) Nothing was written to the workbook, not saving")
+        else:
+            t = time()
+            with span("save"):
+                if not (
+                    self.incremental_save
+                    and save_changed_sheets(
+                        self.wb, self.path, self.path, self.modified_sheets
+                    )
+                ):
+                    if self._lazy is not None:
+                        # a full save writes every sheet again
+                        self._lazy.parse_all()
+                    self.wb.save(self.path)
+            logging.info(f"(Close) Saved the workbook in {round(time()-t, 3)} seconds")
+        if self._wb is not None:
+            self._wb.close()
+        self.name_cache.save()
+        if self._lazy is not None:
+            self._lazy.close()
@@ -0,0 +1,271 @@
+"""
+Saves a workbook by updating its original .xlsx/.xlsm package in place.
+
+openpyxl's Workbook.save serializes every sheet again. When only a few sheets
+were written to, save_changed_sheets copies every other zip member (the other
+sheets, vbaProject.bin, drawings, ...) byte for byte from the original package
+and only regenerates:
+    - the xml of the changed sheets (and their relationships),
+    - the shared strings (the original table with the new strings appended),
+    - the styles, which are written from the workbook like a full save does.
+The calculation chain is dropped like openpyxl does, Excel rebuilds it on load.
+"""
+import logging
+import os
+import posixpath
+import struct
+import traceback
+import zipfile
+from copy import copy
+
+from openpyxl.packaging.relationship import (
+    Relationship,
+    get_dependents,
+    get_rels_path,
+)
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.stylesheet import write_stylesheet
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.xml.constants import (
+    ARC_CONTENT_TYPES,
+    ARC_ROOT_RELS,
+    CONTYPES_NS,
+    PKG_REL_NS,
+    REL_NS,
+    SHARED_STRINGS,
+    SHEET_MAIN_NS,
+)
+from openpyxl.xml.functions import Element, SubElement, fromstring, tostring
+
+
+def _rel_type(rel) -> str:
+    return rel.Type.rsplit("/", 1)[-1]
+
+
+class WorkbookPackage:
+    """The parts of an existing package that a partial save needs to know about."""
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self.archive = archive
+
+        root = get_dependents(archive, ARC_ROOT_RELS)
+        self.workbook_part = next(
+            rel.Target for rel in root if _rel_type(rel) == "officeDocument"
+        )
+        self.workbook_rels_part = get_rels_path(self.workbook_part)
+        self.rels = get_dependents(archive, self.workbook_rels_part)
+
+        # sheet name -> part name, in workbook order
+        targets = {rel.Id: rel.Target for rel in self.rels}
+        node = fromstring(archive.read(self.workbook_part))
+        self.sheets = {}
+        for sheet in node.iter(f"{{{SHEET_MAIN_NS}}}sheet"):
+            rel_id = sheet.get(f"{{{REL_NS}}}id")
+            self.sheets[sheet.get("name")] = targets.get(rel_id)
+
+        parts = {_rel_type(rel): rel.Target for rel in self.rels}
+        self.shared_strings_part = parts.get("sharedStrings")
+        self.styles_part = parts.get("styles")
+        self.calc_chain_part = parts.get("calcChain")
+
+    def shared_strings(self) -> list:
+        if self.shared_strings_part is None:
+            return []
+        with self.archive.open(self.shared_strings_part) as src:
+            return read_string_table(src)
+
+
+def _copy_member(source: zipfile.ZipFile, target: zipfile.ZipFile, info):
+    """
+    Copies a member as it is stored (still compressed) from one archive to the other.
+    zipfile only writes members by compressing them again, so the local header and
+    the raw data are written directly the same way ZipFile.writestr does.
+    """
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(30)
+    if header[:4] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source.fp.seek(info.header_offset + 30 + name_length + extra_length)
+    data = source.fp.read(info.compress_size)
+
+    member = copy(info)
+    member.flag_bits &= ~0x08  # the sizes are in the local header
+    member.extra = b""
+    member.header_offset = target.fp.tell()
+    target.fp.write(member.FileHeader())
+    target.fp.write(data)
+    target.filelist.append(member)
+    target.NameToInfo[member.filename] = member
+    target.start_dir = target.fp.tell()
+    target._didModify = True
+
+
+def _sheet_can_be_written(ws) -> bool:
+    """Parts that hang off a sheet and need a full save to be written again"""
+    return not (ws._charts or ws._images or ws._tables or ws._pivots)
+
+
+def _write_sheet(ws) -> tuple:
+    """Returns the xml of a sheet and its relationships (or None if there are none)."""
+    writer = WorksheetWriter(ws)
+    try:
+        writer.write()
+        xml = writer.read()
+    finally:
+        writer.cleanup()
+
+    rels = writer._rels
+    if ws.legacy_drawing is not None:
+        rels.append(
+            Relationship(
+                type="vmlDrawing", Id="anysvml", Target="/" + ws.legacy_drawing
+            )
+        )
+    return xml, (tostring(rels.to_tree()) if len(rels) else None)
+
+
+def _shared_strings_xml(package: WorkbookPackage, strings: list, original: list):
+    """The original shared strings table with the new strings appended."""
+    if package.shared_strings_part is not None:
+        node = fromstring(package.archive.read(package.shared_strings_part))
+    else:
+        node = Element(f"{{{SHEET_MAIN_NS}}}sst")
+
+    for text in strings[len(original) :]:
+        si = SubElement(node, f"{{{SHEET_MAIN_NS}}}si")
+        t = SubElement(si, f"{{{SHEET_MAIN_NS}}}t")
+        t.text = text
+        if text != text.strip():
+            t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+    node.set("uniqueCount", str(len(strings)))
+    node.attrib.pop("count", None)
+    return tostring(node)
+
+
+def _content_types_xml(package: WorkbookPackage, shared_strings_part: str):
+    """Drops the calculation chain and adds the shared strings if they are new."""
+    node = fromstring(package.archive.read(ARC_CONTENT_TYPES))
+    overrides = {
+        override.get("PartName"): override
+        for override in node.findall(f"{{{CONTYPES_NS}}}Override")
+    }
+    if package.calc_chain_part and "/" + package.calc_chain_part in overrides:
+        node.remove(overrides["/" + package.calc_chain_part])
+    if shared_strings_part and "/" + shared_strings_part not in overrides:
+        SubElement(
+            node,
+            f"{{{CONTYPES_NS}}}Override",
+            {"PartName": "/" + shared_strings_part, "ContentType": SHARED_STRINGS},
+        )
+    return tostring(node)
+
+
+def _workbook_rels_xml(package: WorkbookPackage, shared_strings_part: str):
+    """Drops the calculation chain and adds the shared strings if they are new."""
+    node = fromstring(package.archive.read(package.workbook_rels_part))
+    relationships = node.findall(f"{{{PKG_REL_NS}}}Relationship")
+    for rel in relationships:
+        if rel.get("Type", "").endswith("/calcChain"):
+            node.remove(rel)
+
+    if shared_strings_part and package.shared_strings_part is None:
+        ids = {rel.get("Id") for rel in relationships}
+        n = len(ids) + 1
+        while f"rId{n}" in ids:
+            n += 1
+        folder = posixpath.dirname(package.workbook_part)
+        SubElement(
+            node,
+            f"{{{PKG_REL_NS}}}Relationship",
+            {
+                "Id": f"rId{n}",
+                "Type": f"{REL_NS}/sharedStrings",
+                "Target": posixpath.relpath(shared_strings_part, folder),
+            },
+        )
+    return tostring(node)
+
+
+def save_changed_sheets(wb, source: str, target: str, sheets) -> bool:
+    """
+    Saves the workbook wb, loaded from the package at source, to target by only
+    writing the given sheets (names) again. Returns False without writing anything
+    if the workbook changed in a way that needs a full save (ie. sheets were
+    added or renamed) or if the package could not be updated.
+    """
+    sheets = set(sheets)
+    tmp = target + ".tmp"
+    try:
+        with zipfile.ZipFile(source) as archive:
+            package = WorkbookPackage(archive)
+
+            if list(package.sheets) != wb.sheetnames:
+                logging.info(
+                    "[save] the sheets of the workbook changed, doing a full save"
+                )
+                return False
+            if package.styles_part is None:
+                return False
+            for name in sheets:
+                if package.sheets[name] is None or not _sheet_can_be_written(wb[name]):
+                    logging.info(f"[save] the sheet {name} needs a full save")
+                    return False
+
+            # the changed sheets refer to the original shared strings by position
+            original_strings = package.shared_strings()
+            wb.shared_strings = IndexedList(original_strings)
+
+            parts = {}
+            for name in sheets:
+                part = package.sheets[name]
+                xml, rels = _write_sheet(wb[name])
+                if wb[name]._comments:
+                    logging.info(
+                        f"[save] the sheet {name} has comments, doing a full save"
+                    )
+                    return False
+                parts[part] = xml
+                parts[get_rels_path(part)] = rels  # None drops the old relationships
+
+            strings = list(wb.shared_strings)
+            shared_strings_part = package.shared_strings_part
+            if len(strings) > len(original_strings):
+                shared_strings_part = shared_strings_part or posixpath.join(
+                    posixpath.dirname(package.workbook_part), "sharedStrings.xml"
+                )
+                parts[shared_strings_part] = _shared_strings_xml(
+                    package, strings, original_strings
+                )
+
+            parts[package.styles_part] = tostring(write_stylesheet(wb))
+            parts[ARC_CONTENT_TYPES] = _content_types_xml(package, shared_strings_part)
+            parts[package.workbook_rels_part] = _workbook_rels_xml(
+                package, shared_strings_part
+            )
+            if package.calc_chain_part:
+                parts[package.calc_chain_part] = None
+
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as out:
+                for info in archive.infolist():
+                    if info.filename not in parts:
+                        _copy_member(archive, out, info)
+                    elif parts[info.filename] is not None:
+                        out.writestr(info.filename, parts.pop(info.filename))
+                    else:
+                        parts.pop(info.filename)
+                for name, data in parts.items():
+                    if data is not None:
+                        out.writestr(name, data)
+
+        os.replace(tmp, target)
+        logging.info(f"[save] saved {len(sheets)} changed sheets to {target}")
+        return True
+
+    except Exception:
+        logging.error("[save] Failed to save the changed sheets only")
+        logging.error(traceback.format_exc())
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
@@ -4,6 +4,9 @@
 if [[ $1 == 'app' ]]; then
     echo "Running app"
     python app/app.py
+elif [[ $1 == 'cli' ]]; then
+    echo "Running the workbook jobs without the gui"
+    python app/cli.py "${@:2}"
 elif [[ $1 == 'launcher' ]]; then
     echo "Running launcher"
     python launcher/launcher.py
@@ -0,0 +1,106 @@
+"""
+Compares WorkbookManager.read_funds, which scans the 基金日记 sheet in one
+vectorized pass, against the old cell by cell scan on a generated workbook.
+Run from the repo root:
+
+    python tests/app/benchmarks/bench_missing_funds.py [n_funds] [n_rows]
+
+Each fund has up to max_gap empty rows on top, a short gap is a workbook that is
+updated daily and a long gap one that has not been updated for a long time.
+"""
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "app"))
+
+from openpyxl import Workbook  # noqa: E402
+from src.workers.workbook_manager import WorkbookManager  # noqa: E402
+
+
+class Callback:
+    def emit(self, message):
+        pass
+
+
+def generate_sheet(n_funds: int, n_rows: int, max_gap: int, seed: int = 0):
+    rng = random.Random(seed)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "基金日记"
+    today = datetime.today()
+    for r in range(9, 9 + n_rows):
+        ws.cell(row=r, column=1).value = today - timedelta(days=r - 9)
+    for i in range(n_funds):
+        col = 3 + i
+        ws.cell(row=1, column=col).value = f"{i + 1:06d}"
+        for r in range(9 + rng.randrange(0, max_gap), 9 + n_rows):
+            ws.cell(row=r, column=col).value = round(rng.uniform(0.5, 5), 4)
+    return wb
+
+
+def cell_by_cell(ws):
+    price_columns = {}
+    for i in range(ws.max_column + 1):
+        if ws.cell(row=1, column=i + 1).value is not None:
+            price_columns[ws.cell(row=1, column=i + 1).value] = i + 1
+
+    missing_price_funds = {}
+    for id, col in price_columns.items():
+        current, current_row = None, 9
+        while current is None or current == "":
+            current = ws.cell(row=current_row, column=col).value
+            current_row += 1
+        missing_price_funds[id] = {"column": col, "missing-dates": []}
+        current_row -= 1
+        while ws.cell(row=current_row, column=1).value is not None:
+            missing_price_funds[id]["missing-dates"].append(
+                (
+                    current_row,
+                    ws.cell(row=current_row, column=1).value.strftime("%Y-%m-%d"),
+                )
+            )
+            current_row -= 1
+    # read_funds logs the result either way
+    logging.info(f"(Read missing funds) {missing_price_funds}")
+    return missing_price_funds
+
+
+def run(n_funds: int, n_rows: int, max_gap: int):
+    wb = generate_sheet(n_funds, n_rows, max_gap)
+    ws = wb["基金日记"]
+    # the sheet is scanned in memory, the workbook is never loaded from a file
+    workbook_manager = WorkbookManager()
+    workbook_manager.wb = wb
+
+    t = perf_counter()
+    workbook_manager.read_funds(progress_callback=Callback())
+    vectorized = perf_counter() - t
+
+    t = perf_counter()
+    expected = cell_by_cell(ws)
+    baseline = perf_counter() - t
+
+    assert workbook_manager.missing_funds == expected
+    print(
+        f"{n_funds:>6}{n_rows:>8}{max_gap:>8}{baseline * 1000:>14.2f}ms"
+        f"{vectorized * 1000:>12.2f}ms{baseline / vectorized:>9.1f}x"
+    )
+
+
+def main():
+    n_funds = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print(
+        f"{'funds':>6}{'rows':>8}{'gap':>8}{'cell by cell':>16}{'vectorized':>14}{'speedup':>10}"
+    )
+    for max_gap in (10, n_rows // 4, n_rows // 2):
+        run(n_funds, n_rows, max_gap)
+
+
+if __name__ == "__main__":
+    main()
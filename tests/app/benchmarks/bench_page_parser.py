@@ -0,0 +1,52 @@
+"""
+Compares the selective page parsers against a full BeautifulSoup parse of the
+saved fixture pages. Run from the repo root:
+
+    python tests/app/benchmarks/bench_page_parser.py
+"""
+import os
+import sys
+from timeit import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "app"))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from src.workers import page_parser  # noqa: E402
+
+PAGES = os.path.join(os.path.dirname(__file__), "..", "fixtures", "pages")
+RUNS = 20
+
+
+def full_parse(html):
+    return BeautifulSoup(html, "html.parser")
+
+
+def main():
+    cases = [
+        ("jjjz_000001.html", page_parser.parse_prices),
+        ("jdzf_000001.html", page_parser.parse_ranking),
+        ("fundranking_thh.html", page_parser.parse_top),
+    ]
+    lxml = page_parser.lxml_html
+
+    print(
+        f"{'page':<24}{'html.parser':>14}{'selective':>14}{'no lxml':>14}{'speedup':>10}"
+    )
+    for name, parse in cases:
+        with open(os.path.join(PAGES, name), "r", encoding="utf-8") as f:
+            html = f.read()
+
+        baseline = timeit(lambda: full_parse(html), number=RUNS) / RUNS
+        selective = timeit(lambda: parse(html), number=RUNS) / RUNS
+        page_parser.lxml_html = None
+        fallback = timeit(lambda: parse(html), number=RUNS) / RUNS
+        page_parser.lxml_html = lxml
+
+        print(
+            f"{name:<24}{baseline * 1000:>12.2f}ms{selective * 1000:>12.2f}ms"
+            f"{fallback * 1000:>12.2f}ms{baseline / selective:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
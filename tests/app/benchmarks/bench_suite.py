@@ -0,0 +1,351 @@
+"""
+Times the scraper and the workbook manager offline and stores the results as
+json, so a regression between two versions shows up. Run from the repo root:
+
+    python tests/app/benchmarks/bench_suite.py [--sizes small,medium] [--repeat 3]
+        [--pages 40] [--latency 0] [--out <file or directory>] [--compare <old.json>]
+
+The scraper loads its pages over the http backend from a ReplayServer (the saved
+pages of tests/app/fixtures/pages), and the workbook manager works on workbooks
+made by workbook_generator, a fresh copy for every repeat:
+
+    replay      parse_funding_page, parse_ranking_page (one page after another),
+                prefetch_pages (all of them at once, then parsed), parse_top
+    workbook    read_funds, _get_missing_price_funds, load_workbook (the editable
+                one), write_funds, write_rankings, copy_top_range, write_rankings_top,
+                buy_funds, close
+
+Every benchmark keeps the seconds of each repeat and their median, and the
+instrumentation stages of the runs are kept too. With --compare, the medians are
+compared with an older result file and the exit code is 1 if one of them is more
+than --threshold slower.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(HERE, "..", "..", "..", "app")
+sys.path.insert(0, APP)
+sys.path.insert(0, HERE)
+
+import requests  # noqa: E402
+from replay_server import ReplayServer  # noqa: E402
+from src.workers import page_parser  # noqa: E402
+from src.workers.controller import top_urls  # noqa: E402
+from src.workers.instrumentation import instruments  # noqa: E402
+from src.workers.name_cache import FundNameCache  # noqa: E402
+from src.workers.price_store import FundPriceStore  # noqa: E402
+from src.workers.web_scraper import EastMoneyFundScraper  # noqa: E402
+from src.workers.workbook_manager import WorkbookManager  # noqa: E402
+from workbook_generator import (  # noqa: E402
+    FUNDS_SHEET,
+    RANKING_SHEET,
+    dates,
+    fund_ids,
+    generate_workbook,
+)
+
+# <name>: (n_funds, n_rows, top_depth)
+SIZES = {
+    "small": (20, 250, 5),
+    "medium": (100, 1000, 20),
+    "large": (300, 3000, 60),
+}
+RESULTS = os.path.join(HERE, "results")
+N_BUYS = 10
+
+
+class Callback:
+    def emit(self, message):
+        pass
+
+
+class Timings:
+    """The seconds of every run of every benchmark, by name"""
+
+    def __init__(self):
+        self.runs = {}
+
+    @contextmanager
+    def time(self, name: str):
+        t = perf_counter()
+        yield
+        self.runs.setdefault(name, []).append(perf_counter() - t)
+
+    def results(self) -> dict:
+        return {
+            name: {
+                "median": round(median(runs), 6),
+                "min": round(min(runs), 6),
+                "max": round(max(runs), 6),
+                "runs": [round(run, 6) for run in runs],
+            }
+            for name, runs in self.runs.items()
+        }
+
+
+def saved_ranking() -> list:
+    with open(
+        os.path.join(HERE, "..", "fixtures", "pages", "jdzf_000001.html"),
+        "r",
+        encoding="utf-8",
+    ) as f:
+        return page_parser.parse_ranking(f.read())
+
+
+def bench_replay(n_pages: int, repeat: int, latency: float) -> dict:
+    callback = Callback()
+    ids = fund_ids(n_pages)
+    timings = Timings()
+    instruments.reset()
+
+    with ReplayServer(latency=latency) as server:
+        session = server.route(requests.Session())
+        for _ in range(repeat):
+            scraper = EastMoneyFundScraper(
+                fetch_backend="http", request_pause=0, random_pauses=False
+            )
+            server.route(scraper.http_fetcher.session)
+
+            with timings.time("parse_funding_page"):
+                for id in ids:
+                    assert scraper.parse_funding_page(
+                        id, progress_callback=callback, progress_callback_num=callback
+                    )
+            with timings.time("parse_ranking_page"):
+                for id in ids:
+                    assert scraper.parse_ranking_page(id, callback, callback)
+
+            with timings.time("prefetch_pages"):
+                urls = [scraper.funds_url(id) for id in ids]
+                urls += [scraper.ranking_url(id) for id in ids]
+                scraper.prefetch_pages(urls, progress_callback=callback)
+                for id in ids:
+                    assert scraper.parse_funding_page(
+                        id, progress_callback=callback, progress_callback_num=callback
+                    )
+                    assert scraper.parse_ranking_page(id, callback, callback)
+
+            # the top50 pages need the webdriver, only their fetch and parse are timed
+            with timings.time("parse_top"):
+                for url in top_urls(50).values():
+                    page = session.get(url, timeout=30).text
+                    assert page_parser.parse_top(page)
+            scraper.stop_driver()
+
+    return {
+        "params": {"n_pages": n_pages, "latency": latency},
+        "hits": dict(server.hits),
+        "benchmarks": timings.results(),
+        "stages": instruments.stats(),
+    }
+
+
+def _workbook_run(template: str, path: str, n_funds: int, n_rows: int, timings):
+    callback = Callback()
+    ids = fund_ids(n_funds)
+    shutil.copyfile(template, path)
+
+    names = FundNameCache()
+    names.update((id, f"基金{id}") for id in ids + ["999999"])
+    workbook_manager = WorkbookManager(path, name_cache=names)
+
+    with timings.time("read_funds"):
+        assert workbook_manager.read_funds(progress_callback=callback)
+    missing_funds = workbook_manager.missing_funds
+    price_columns = {id: fund["column"] for id, fund in missing_funds.items()}
+    ws = workbook_manager._read_sheet(FUNDS_SHEET)
+    with timings.time("_get_missing_price_funds"):
+        workbook_manager._get_missing_price_funds(ws, price_columns)
+    assert workbook_manager.read_rankings(RANKING_SHEET, progress_callback=callback)
+
+    funds_data = FundPriceStore.from_dict(
+        {
+            id: {date: "1.2345" for _, date in fund["missing-dates"]}
+            for id, fund in missing_funds.items()
+        }
+    )
+    ranking = saved_ranking()
+    top = [(f"{200000 + i:06d}", f"基金{200000 + i}") for i in range(50)]
+    ranking_data = {id: ranking for id in ids + [id for id, _ in top]}
+
+    with timings.time("load_workbook"):
+        workbook_manager.wb
+    with timings.time("write_funds"):
+        assert workbook_manager.write_funds(funds_data, progress_callback=callback)
+    with timings.time("write_rankings"):
+        assert workbook_manager.write_rankings(ranking_data, progress_callback=callback)
+    with timings.time("copy_top_range"):
+        assert workbook_manager.copy_top_range("top50混合", progress_callback=callback)
+    with timings.time("write_rankings_top"):
+        assert workbook_manager.write_rankings(
+            ranking_data, "top50股票", list(top), progress_callback=callback
+        )
+
+    days = dates(n_rows)
+    entries = [
+        (ids[i % n_funds], 100.0, days[i % n_rows].strftime("%Y-%m-%d"))
+        for i in range(N_BUYS)
+    ]
+    entries.append(("999999", 100.0, days[0].strftime("%Y-%m-%d")))
+    with timings.time("buy_funds"):
+        for id, amount, date in entries:
+            assert workbook_manager.buy_funds(
+                id, amount, date, progress_callback=callback
+            )
+
+    with timings.time("close"):
+        workbook_manager.close()
+
+
+def bench_workbook(size: str, repeat: int, directory: str) -> dict:
+    n_funds, n_rows, top_depth = SIZES[size]
+    template = os.path.join(directory, f"{size}.xlsm")
+    t = perf_counter()
+    params = generate_workbook(template, n_funds, n_rows, top_depth)
+    print(
+        f"  generated {size} workbook in {perf_counter() - t:.1f}s,"
+        f" {os.path.getsize(template) / 2**20:.1f} MB"
+    )
+
+    timings = Timings()
+    instruments.reset()
+    for _ in range(repeat):
+        _workbook_run(
+            template, os.path.join(directory, "run.xlsm"), n_funds, n_rows, timings
+        )
+    params["size_mb"] = round(os.path.getsize(template) / 2**20, 2)
+    return {
+        "params": params,
+        "benchmarks": timings.results(),
+        "stages": instruments.stats(),
+    }
+
+
+def version() -> dict:
+    with open(os.path.join(APP, "VERSION"), "r") as f:
+        result = {"version": f.read().strip()}
+    try:
+        result["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        result["commit"] = None
+    return result
+
+
+def flatten(results: dict) -> dict:
+    """<section>.<benchmark>: median seconds"""
+    return {
+        f"{section}.{name}": benchmark["median"]
+        for section, data in results["sections"].items()
+        for name, benchmark in data["benchmarks"].items()
+    }
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    """Prints the medians of both results, returns the benchmarks that got slower."""
+    old_medians, new_medians = flatten(old), flatten(new)
+    regressions = []
+    print(
+        f"\n{old.get('version')} ({old.get('commit')}) -> {new.get('version')} ({new.get('commit')})"
+    )
+    for section, data in new["sections"].items():
+        old_params = old["sections"].get(section, {}).get("params")
+        if old_params is not None and old_params != data["params"]:
+            print(f"note: {section} was run with {old_params}, now {data['params']}")
+    print(f"{'benchmark':<40}{'old':>12}{'new':>12}{'ratio':>9}")
+    for name, seconds in new_medians.items():
+        if name not in old_medians:
+            continue
+        ratio = seconds / old_medians[name] if old_medians[name] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  slower"
+        print(
+            f"{name:<40}{old_medians[name] * 1000:>10.2f}ms{seconds * 1000:>10.2f}ms"
+            f"{ratio:>8.2f}x{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", default="small,medium")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every page"
+    )
+    parser.add_argument("--out", default=RESULTS)
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # the missing data warnings of the workbook manager are expected here
+    logging.disable(logging.WARNING)
+
+    started = datetime.now()
+    results = {
+        **version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": started.isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "sections": {},
+    }
+
+    print(f"replay, {args.pages} pages")
+    results["sections"]["replay"] = bench_replay(args.pages, args.repeat, args.latency)
+    directory = tempfile.mkdtemp()
+    try:
+        for size in args.sizes.split(","):
+            print(f"workbook, {size} {SIZES[size]}")
+            results["sections"][f"workbook.{size}"] = bench_workbook(
+                size, args.repeat, directory
+            )
+    finally:
+        shutil.rmtree(directory)
+
+    for name, seconds in flatten(results).items():
+        print(f"{name:<40}{seconds * 1000:>10.2f}ms")
+
+    path = args.out
+    if not path.endswith(".json"):
+        path = os.path.join(
+            path,
+            f'bench_{results["version"]}_{started.strftime("%Y-%m-%d_%H-%M-%S")}.json',
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"\nsaved {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks are slower: {regressions}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares a full Workbook.save against save_changed_sheets when only the funds
+sheet changed, on a generated workbook. Run from the repo root:
+
+    python tests/app/benchmarks/bench_workbook_save.py [n_sheets] [n_rows]
+"""
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "app"))
+
+from openpyxl import Workbook, load_workbook  # noqa: E402
+from src.workers.workbook_package import save_changed_sheets  # noqa: E402
+
+
+def generate_workbook(path: str, n_sheets: int, n_rows: int):
+    wb = Workbook()
+    wb.active.title = "基金日记"
+    for i in range(1, n_sheets):
+        wb.create_sheet(f"sheet{i}")
+    for ws in wb.worksheets:
+        for r in range(1, n_rows + 1):
+            ws.append([r, f"基金{r}", r * 1.5, f"=A{r}*C{r}"] + [r / 7] * 20)
+    wb.save(path)
+
+
+def main():
+    n_sheets = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "FundsBook.xlsx")
+        generate_workbook(path, n_sheets, n_rows)
+        print(
+            f"{n_sheets} sheets x {n_rows} rows, {os.path.getsize(path) / 2**20:.1f} MB"
+        )
+
+        wb = load_workbook(path)
+        wb["基金日记"]["B2"] = 1.0
+
+        t = perf_counter()
+        wb.save(os.path.join(directory, "full.xlsx"))
+        full = perf_counter() - t
+
+        t = perf_counter()
+        assert save_changed_sheets(
+            wb, path, os.path.join(directory, "changed.xlsx"), {"基金日记"}
+        )
+        changed = perf_counter() - t
+
+        print(f"full save            {full:>8.2f}s")
+        print(f"changed sheets only  {changed:>8.2f}s  ({full / changed:.1f}x)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+A local stand-in for the EastMoneyFund site that replays the saved pages of
+tests/app/fixtures/pages, so the scraper can be timed without the network.
+
+The server is an http proxy: a requests session routed through it (see route)
+asks it for the real urls, and it answers them from the saved pages:
+
+    fundf10.eastmoney.com/jjjz_<id>.html        jjjz_<id>.html
+    fundf10.eastmoney.com/jdzf_<id>.html        jdzf_<id>.html
+    fund.eastmoney.com/data/fundranking.html    fundranking_<hash>.html
+    api.fund.eastmoney.com/f10/lsjz             the price table of jjjz_<id>.html as json
+    fundf10.eastmoney.com/FundArchivesDatas.aspx  an empty snippet (the saved
+                                                jdzf_ pages already have their table)
+
+An id without a saved page gets the first saved page of the same kind, and the
+fragment of a fundranking url is not sent, so every top50 page is the first
+fundranking_ page. latency (seconds) is added to every answer.
+"""
+import glob
+import json
+import os
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from urllib.parse import parse_qs, urlparse
+
+PAGES = os.path.join(os.path.dirname(__file__), "..", "fixtures", "pages")
+
+_page = re.compile(r"/(jjjz|jdzf)_(\w+)\.html$")
+_price_row = re.compile(
+    r"<tr><td>(\d{4}-\d\d-\d\d)</td><td[^>]*>([^<]*)</td><td[^>]*>([^<]*)</td><td[^>]*>([^<]*?)%?</td>"
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        replay = self.server.replay
+        url = urlparse(self.path)
+        answer = replay.answer(url.path, parse_qs(url.query))
+        if replay.latency:
+            sleep(replay.latency)
+
+        if answer is None:
+            self.send_error(404)
+            return
+        kind, content_type, body = answer
+        replay.hit(kind)
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    """
+    Serves the saved pages of pages_dir on a free local port until stopped.
+
+        with ReplayServer() as server:
+            server.route(session)
+            ...
+        server.hits  # Counter of the pages served, by kind
+    """
+
+    def __init__(self, pages_dir: str = PAGES, latency: float = 0.0):
+        self.pages_dir = pages_dir
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.pages = {}  # <file name>: html, read on first use
+        self.httpd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.replay = self
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def proxies(self) -> dict:
+        return {"http": self.url, "https": self.url}
+
+    def route(self, session):
+        """Sends every request of a requests session to the server."""
+        # proxies of the environment would take precedence over the session's
+        session.trust_env = False
+        session.proxies.update(self.proxies)
+        return session
+
+    def hit(self, kind: str):
+        with self.lock:
+            self.hits[kind] += 1
+
+    def saved_page(self, prefix: str, key: str = None) -> str:
+        """The saved page <prefix><key>.html, or the first one of prefix."""
+        name = f"{prefix}{key}.html"
+        if not os.path.exists(os.path.join(self.pages_dir, name)):
+            saved = sorted(glob.glob(os.path.join(self.pages_dir, f"{prefix}*.html")))
+            if not saved:
+                return None
+            name = os.path.basename(saved[0])
+        with self.lock:
+            if name not in self.pages:
+                with open(
+                    os.path.join(self.pages_dir, name), "r", encoding="utf-8"
+                ) as f:
+                    self.pages[name] = f.read()
+            return self.pages[name]
+
+    def prices(self, id: str, start_date: str = None, page_size: int = 20) -> str:
+        """The answer of the price history endpoint, from the saved jjjz_ page."""
+        page = self.saved_page("jjjz_", id) or ""
+        rows = [
+            {"FSRQ": date, "DWJZ": dwjz, "LJJZ": ljjz, "JZZZL": change}
+            for date, dwjz, ljjz, change in _price_row.findall(page)
+            if not start_date or date >= start_date
+        ]
+        return json.dumps(
+            {"Data": {"LSJZList": rows[:page_size]}, "TotalCount": len(rows)}
+        )
+
+    def answer(self, path: str, query: dict):
+        """(<kind>, <content type>, <body>) for a request, None if it is not replayed"""
+        if path.endswith("/f10/lsjz"):
+            return (
+                "lsjz",
+                "application/json",
+                self.prices(
+                    query.get("fundCode", [""])[0],
+                    query.get("startDate", [None])[0],
+                    int(query.get("pageSize", [20])[0]),
+                ),
+            )
+        if path.endswith("/FundArchivesDatas.aspx"):
+            return "archive", "text/javascript", 'var apidata={ content:""};'
+        if path.endswith("/fundranking.html"):
+            page = self.saved_page("fundranking_")
+            return page and ("fundranking", "text/html", page)
+
+        match = _page.search(path)
+        if match:
+            page = self.saved_page(f"{match.group(1)}_", match.group(2))
+            return page and (match.group(1), "text/html", page)
+        return None
@@ -0,0 +1,166 @@
+"""
+Generates a FundsBook workbook of a given size for the benchmarks:
+
+    基金日记     n_funds blocks of 8 columns (amount, formulas and the price under
+                the id in row 1), dates from row 9 down in columns A and K, newest
+                first, and the newest max_gap rows of each fund still without a price
+    基金排队     the n_funds ids from row 3 in column D, to be written
+    top50 x 5   top_depth blocks of 50 funds with their formulas, in the "prepend"
+                layout (newest block on top)
+
+Run from the repo root to write one:
+
+    python tests/app/benchmarks/workbook_generator.py <path.xlsm> [n_funds] [n_rows] [top_depth]
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "app"))
+
+from openpyxl import Workbook  # noqa: E402
+from openpyxl.utils import get_column_letter  # noqa: E402
+from src.workers.controller import TOP50_SHEETS  # noqa: E402
+from src.workers.workbook_manager import (  # noqa: E402
+    TOP_BLOCK_COLUMNS,
+    TOP_BLOCK_ROWS,
+)
+
+FUNDS_SHEET = "基金日记"
+RANKING_SHEET = "基金排队"
+FIRST_BLOCK_COL = 12  # the blocks of the funds start right of the dates in column K
+
+
+def fund_ids(n_funds: int) -> list:
+    return [f"{i + 1:06d}" for i in range(n_funds)]
+
+
+def dates(n_rows: int, today: datetime = None) -> list:
+    """The dates of the funds sheet from row 9 down, newest first, business days only"""
+    day = today or datetime(2022, 12, 30)
+    result = []
+    while len(result) < n_rows:
+        if day.weekday() < 5:
+            result.append(day)
+        day -= timedelta(days=1)
+    return result
+
+
+def _funds_sheet(ws, ids: list, n_rows: int, max_gap: int, rng):
+    days = dates(n_rows)
+    for r, day in enumerate(days, 9):
+        ws.cell(row=r, column=1).value = day
+        ws.cell(row=r, column=11).value = day
+
+    # the last block is the template of a new fund, "000000"
+    for b, id in enumerate(ids + ["000000"]):
+        first = FIRST_BLOCK_COL + 8 * b
+        price = first + 3
+        ws.cell(row=1, column=price).value = id
+        ws.cell(row=3, column=price - 1).value = f"基金{id}"
+        a, p = get_column_letter(first), get_column_letter(price)
+        gap = rng.randrange(0, max_gap + 1) if id != "000000" else n_rows
+        value = rng.uniform(0.5, 5)
+        for r in range(9, 9 + n_rows):
+            if r >= 9 + gap:
+                ws.cell(row=r, column=price).value = round(value, 4)
+                value *= rng.uniform(0.98, 1.02)
+            ws.cell(row=r, column=first + 1).value = f'=IF({a}{r}="","",{a}{r}/{p}{r})'
+            ws.cell(row=r, column=first + 4).value = f'=IFERROR({p}{r}/{p}{r + 1}-1,"")'
+            ws.cell(row=r, column=first + 5).value = f"=SUM({a}{r}:{a}{8 + n_rows})"
+
+
+def _ranking_sheet(ws, ids: list):
+    # column D is only ids, see WorkbookManager.read_rankings
+    ws.cell(row=1, column=3).value = "基金排队"
+    for r, id in enumerate(ids, 3):
+        ws.cell(row=r, column=3).value = r - 2
+        ws.cell(row=r, column=4).value = id
+
+
+def _top_sheet(ws, ids: list, top_depth: int, rng):
+    for c in range(1, 29):
+        ws.cell(row=1, column=c).value = f"列{c}"
+
+    days = dates(top_depth)
+    for k in range(top_depth):
+        first = 2 + k * (TOP_BLOCK_ROWS + 2)
+        if k:
+            for c in range(1, 26):
+                ws.cell(row=first - 1, column=c).value = f"列{c}"
+        rows = {"first": first, "last": first + TOP_BLOCK_ROWS - 1}
+        if k + 1 < top_depth:
+            rows["previous_first"] = first + TOP_BLOCK_ROWS + 2
+            rows["previous_last"] = rows["previous_first"] + TOP_BLOCK_ROWS - 1
+
+        top = rng.sample(ids, min(TOP_BLOCK_ROWS, len(ids)))
+        for idx, row in enumerate(range(first, first + len(top)), 1):
+            id = top[idx - 1]
+            ws.cell(row=row, column=3).value = idx
+            ws.cell(row=row, column=4).value = id
+            ws.cell(row=row, column=5).value = f"基金{id}"
+            ws.cell(row=row, column=6).value = days[k].strftime("%Y-%m-%d")
+            ws.cell(row=row, column=7).value = round(rng.uniform(0.5, 5), 4)
+            for col, formula, _ in TOP_BLOCK_COLUMNS:
+                if formula is None:
+                    continue
+                if col == 2 and "previous_first" not in rows:
+                    ws.cell(row=row, column=col).value = "new"
+                elif k == 0 or col in (2, 28):
+                    # the older blocks only keep their history columns
+                    ws.cell(row=row, column=col).value = formula.fill(row=row, **rows)
+
+
+def generate_workbook(
+    path: str,
+    n_funds: int = 50,
+    n_rows: int = 500,
+    top_depth: int = 10,
+    max_gap: int = 10,
+    n_top_funds: int = 400,
+    seed: int = 0,
+) -> dict:
+    """
+    Writes the workbook to path and returns its parameters. The top50 blocks list
+    funds from a pool of n_top_funds ids (the funds of the site, not the book).
+    """
+    rng = random.Random(seed)
+    ids = fund_ids(n_funds)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = FUNDS_SHEET
+    _funds_sheet(ws, ids, n_rows, max_gap, rng)
+    _ranking_sheet(wb.create_sheet(RANKING_SHEET), ids)
+
+    pool = [f"{100000 + i:06d}" for i in range(max(n_top_funds, TOP_BLOCK_ROWS))]
+    for sheet, _ in TOP50_SHEETS:
+        _top_sheet(wb.create_sheet(sheet), pool, top_depth, rng)
+    wb.create_sheet("历史日记")
+    wb.create_sheet("历史排队")
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    wb.save(path)
+    return {
+        "n_funds": n_funds,
+        "n_rows": n_rows,
+        "top_depth": top_depth,
+        "max_gap": max_gap,
+        "n_top_funds": n_top_funds,
+        "seed": seed,
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    sizes = [int(a) for a in sys.argv[2:5]]
+    params = generate_workbook(sys.argv[1], *sizes)
+    print(f"{sys.argv[1]}: {params}, {os.path.getsize(sys.argv[1]) / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app is run from the repo root with app/ as the script directory,
+# so the src package is importable as "src".
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "app"))
@@ -0,0 +1,60 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from openpyxl import Workbook
+
+from src.workers.name_cache import FundNameCache
+from src.workers.workbook_manager import WorkbookManager
+
+
+class Callback:
+    """Stands in for the progress callbacks, keeps what was emitted"""
+
+    def __init__(self):
+        self.messages = []
+
+    def emit(self, message):
+        self.messages.append(message)
+
+
+@pytest.fixture
+def callback():
+    return Callback()
+
+
+def _funds_sheet(n_funds=12, n_rows=60, seed=0):
+    """A 基金日记 sheet: ids in row 1, newest dates on top from row 9 in column A"""
+    rng = random.Random(seed)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "基金日记"
+    ws.cell(row=1, column=2).value = "000000"
+    for i in range(n_funds):
+        ws.cell(row=1, column=3 + i).value = f"{i + 1:06d}"
+
+    today = datetime(2022, 12, 30)
+    for r in range(9, 9 + n_rows):
+        ws.cell(row=r, column=1).value = today - timedelta(days=r - 9)
+    for i in range(n_funds):
+        # the newest rows of each fund are still empty
+        for r in range(9 + rng.randrange(0, 10), 9 + n_rows):
+            ws.cell(row=r, column=3 + i).value = rng.choice([1.5, "--", 2])
+    return wb
+
+
+@pytest.fixture
+def funds_sheet():
+    return _funds_sheet
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """Makes the workbook manager of a workbook, once it is saved in tmp_path"""
+
+    def make(wb, name: str = "FundsBook.xlsx", **options):
+        path = str(tmp_path / name)
+        wb.save(path)
+        return WorkbookManager(path, name_cache=FundNameCache(), **options)
+
+    return make
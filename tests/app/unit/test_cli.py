@@ -0,0 +1,111 @@
+import io
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import cli
+from src.workers.progress import ConsoleProgress, report
+
+CONFIG = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "app", "fb_config.json"
+)
+
+
+class FakeScraper:
+    started = True
+
+    def __init__(self, **options):
+        self.stopped = False
+
+    def start_driver(self, wait=False):
+        assert wait
+        return self.started
+
+    def stop_driver(self):
+        self.stopped = True
+
+
+def args(*argv):
+    parsed = cli.parse_args(["--config", CONFIG, *argv])
+    for section in ("jobJournal", "nameCache", "pageCache", "historyDatabase"):
+        parsed.settings[section] = None
+    return parsed
+
+
+def test_console_progress_json_lines():
+    stream = io.StringIO()
+    progress = ConsoleProgress(stream, json_lines=True)
+    progress.emit("PROG:FUNDS SHEET")
+    progress.counter.emit(2)
+    progress.counter.emit(-1)
+    report(progress, "funds", "Retrieved 5 prices", fund_id="000001", count=5)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]["kind"] == "label"
+    assert lines[1] == {
+        **lines[1],
+        "kind": "funds",
+        "label": "FUNDS SHEET",
+        "steps": 1,
+        "total": 2,
+        "fund_id": "000001",
+        "count": 5,
+    }
+
+
+def test_next_run_is_tomorrow_once_the_time_passed():
+    assert cli.next_run((21, 0), datetime(2023, 1, 2, 20, 59)) == datetime(
+        2023, 1, 2, 21, 0
+    )
+    assert cli.next_run((21, 0), datetime(2023, 1, 2, 21, 0)) == datetime(
+        2023, 1, 3, 21, 0
+    )
+
+
+def test_run_jobs_exit_codes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(cli, "scraper_options", lambda settings: {})
+    monkeypatch.setattr(cli, "EastMoneyFundScraper", FakeScraper)
+    monkeypatch.setattr(cli, "start", lambda *a, **kw: calls.append(a) or done)
+    progress = ConsoleProgress(io.StringIO())
+    flag = cli.ThreadFlag()
+
+    done = True
+    assert cli.run_jobs(args("--no-top50"), progress, flag) == cli.EXIT_OK
+    assert calls[-1][4:8] == (True, True, False, 50)
+    done = False
+    assert cli.run_jobs(args(), progress, flag) == cli.EXIT_FAILED
+    assert (
+        cli.run_jobs(args(), progress, flag, resume=True) == cli.EXIT_NOTHING_TO_RESUME
+    )
+    monkeypatch.setattr(FakeScraper, "started", False)
+    assert cli.run_jobs(args(), progress, flag) == cli.EXIT_DRIVER
+
+
+def test_run_jobs_exit_code_without_a_browser(monkeypatch):
+    def no_browser(self):
+        raise OSError("chromedriver.exe not found")
+
+    monkeypatch.setattr(cli.EastMoneyFundScraper, "start_chrome_driver", no_browser)
+    monkeypatch.setattr(cli, "scraper_options", lambda settings: {"driver": "chrome"})
+    progress = ConsoleProgress(io.StringIO())
+    assert cli.run_jobs(args(), progress, cli.ThreadFlag()) == cli.EXIT_DRIVER
+
+
+def test_cli_does_not_import_the_gui():
+    app = os.path.join(os.path.dirname(__file__), "..", "..", "..", "app")
+    modules = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, cli; print(' '.join(sorted(sys.modules)))",
+        ],
+        cwd=app,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    assert not [m for m in modules if m.split(".")[0] in ("PyQt5", "qdarkstyle")]
+    assert "src.gui" not in modules
@@ -0,0 +1,122 @@
+from src.workers.controller import TOP50_SHEETS, fetch_plan, pipeline_funds, plan_jobs
+from src.workers.job_journal import JobJournal
+from src.workers.price_store import FundPriceStore
+
+
+class Flag:
+    flag = True
+
+
+class FakeScraper:
+    """Parses the funds pages from a dictionary of {<id>: {<date>: <price>}}"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.parsed = []
+        self.parsed_rankings = []
+        self.data = {"funds": FundPriceStore(), "ranking": {}, "top": []}
+
+    def funds_url(self, id):
+        return id
+
+    def ranking_url(self, id):
+        return id
+
+    def prefetch_pages(self, urls, run_threads=None, progress_callback=None):
+        return 0
+
+    def parse_funding_page(
+        self, id, progress_callback=None, progress_callback_num=None
+    ):
+        self.parsed.append(id)
+        self.data["funds"].merge(id, self.pages[id])
+        return True
+
+    def parse_ranking_page(self, id, progress_callback, progress_callback_num):
+        self.parsed_rankings.append(id)
+        self.data["ranking"][id] = [id]
+        return True
+
+
+def test_pipeline_writes_what_write_funds_writes(callback, funds_sheet, manager):
+    pages = {
+        f"{i + 1:06d}": {
+            f"2022-12-{day:02d}": round(1 + i / 10 + day / 1000, 4)
+            for day in range(1, 31)
+        }
+        for i in range(12)
+    }
+
+    expected = manager(funds_sheet(), "expected.xlsx")
+    expected.read_funds(progress_callback=callback)
+    expected.write_funds(FundPriceStore.from_dict(pages), progress_callback=callback)
+
+    workbook_manager = manager(funds_sheet())
+    workbook_manager.read_funds(progress_callback=callback)
+    scraper = FakeScraper(pages)
+    # one fund is up to date in the history database, it is written without a page
+    scraper.data["funds"].merge("000001", pages["000001"])
+    to_scrape = {
+        id: dates
+        for id, dates in workbook_manager.missing_funds.items()
+        if id != "000001"
+    }
+
+    written = pipeline_funds(
+        scraper,
+        workbook_manager,
+        to_scrape,
+        Flag(),
+        callback,
+        callback,
+        queue_size=2,
+    )
+
+    assert written == 12
+    assert sorted(scraper.parsed) == sorted(to_scrape)
+    # the written funds are not kept
+    assert len(scraper.data["funds"]) == 0
+    assert list(workbook_manager._sheet("基金日记").values) == list(
+        expected._sheet("基金日记").values
+    )
+
+
+def test_fetch_plan_skips_the_journaled_pages(tmp_path, callback):
+    journal = JobJournal(str(tmp_path / "journal.jsonl"))
+    journal.begin("FundsBook.xlsx", {})
+    journal.record_ranking("000002", ["2022-12-30"])
+
+    scraper = FakeScraper({})
+    plan = {
+        "funds": {},
+        "ranking_ids": ["000001", "000002"],
+        "top": {"top50混合": [["000002", "基金二"], ["000003", "基金三"]]},
+    }
+    fetch_plan(scraper, plan, Flag(), callback, callback, journal=journal)
+
+    assert scraper.parsed_rankings == ["000001", "000003"]
+    resumed = JobJournal(journal.path)
+    assert resumed.load()
+    assert sorted(resumed.ranking) == ["000001", "000002", "000003"]
+
+
+class TopScraper(FakeScraper):
+    """Every top50 page lists its hash as a fund, the top50股票 one fails"""
+
+    def parse_top(self, url, progress_callback=None, progress_callback_num=None):
+        if "#tgp;" in url:
+            return False
+        hash = next(hash for _, hash in TOP50_SHEETS if f"#{hash};" in url)
+        self.data["top"].append((hash, f"基金{hash}"))
+        return True
+
+
+def test_failed_top_page_is_not_planned(callback):
+    plan = plan_jobs(
+        TopScraper({}), None, Flag(), False, False, True, 50, callback, callback
+    )
+
+    # write_plan would write an empty list as the 基金排队 sheet
+    assert "top50股票" not in plan["top"]
+    assert plan["top"]["top50混合"] == [("thh", "基金thh")]
+    assert len(plan["top"]) == len(TOP50_SHEETS) - 1
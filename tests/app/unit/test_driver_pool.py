@@ -0,0 +1,72 @@
+import pytest
+
+from src.workers.driver_pool import DriverPool
+
+
+class FakeDriver:
+    started = 0
+
+    def __init__(self):
+        FakeDriver.started += 1
+        self.alive = True
+        self.quit_called = False
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            raise ConnectionError("browser went away")
+        return "about:blank"
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_lease_reuses_sessions():
+    pool = DriverPool(FakeDriver, size=2)
+    pool.warm(background=False)
+
+    with pool.lease() as first:
+        pass
+    with pool.lease() as second:
+        pass
+
+    assert pool.live == 2
+    assert first in (second, *list(pool.idle.queue))
+
+
+def test_crashed_session_is_restarted():
+    pool = DriverPool(FakeDriver, size=1)
+    pool.warm(background=False)
+
+    with pool.lease() as driver:
+        pass
+    driver.alive = False
+
+    with pool.lease() as replacement:
+        assert replacement is not driver
+    assert driver.quit_called
+
+
+def test_error_while_leased_retires_session():
+    pool = DriverPool(FakeDriver, size=1)
+    pool.warm(background=False)
+
+    with pytest.raises(RuntimeError):
+        with pool.lease() as driver:
+            raise RuntimeError("page crashed")
+
+    assert driver.quit_called
+    with pool.lease() as replacement:
+        assert replacement is not driver
+
+
+def test_no_sessions_raises():
+    def factory():
+        raise OSError("no browser")
+
+    pool = DriverPool(factory, size=2)
+    pool.warm(background=False)
+
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pass
@@ -0,0 +1,36 @@
+from openpyxl.formula.translate import Translator
+
+from src.workers.formula_template import FormulaTemplate
+
+FORMULAS = [
+    "=A1+$B$2+Sheet1!C3:D4+'a b'!E5+A:A+$1:$1+SUM(name1)",
+    '=IFERROR(INDEX(基金排队!D$3:AA$200, MATCH(D7,基金排队!D$3:D$200,0),15),"")',
+    '=IF(K10="","",L10*$C$3/M$9)',
+    '=SUM(B2)+TRUE+"A1"+#REF!',
+    "=$D7&a1",
+    "not a formula",
+]
+
+
+def test_translate_matches_translator():
+    for formula in FORMULAS:
+        template = FormulaTemplate(formula, row=20, column=26)
+        for row_delta, col_delta in [(0, 8), (3, 0), (1, 2)]:
+            assert template.translate(row_delta, col_delta) == Translator(
+                formula, "Z20"
+            ).translate_formula(row_delta=row_delta, col_delta=col_delta)
+        assert template.at(21, 34) == template.translate(1, 8)
+
+
+def test_from_format_fills_in_rows():
+    template = FormulaTemplate.from_format(
+        "=IFERROR((INDEX(C{previous_first}:C{previous_last},"
+        'MATCH(D{row},D{previous_first}:D{previous_last},FALSE),1)-C{row}),"new")'
+        "+COUNT($D${first}:$D${last})+$1:$1"
+    )
+    assert template.fill(
+        row=7, previous_first=54, previous_last=103, first=2, last=51
+    ) == (
+        '=IFERROR((INDEX(C54:C103,MATCH(D7,D54:D103,FALSE),1)-C7),"new")'
+        "+COUNT($D$2:$D$51)+$1:$1"
+    )
@@ -0,0 +1,46 @@
+from src.workers.history_db import HistoryDatabase
+from src.workers.web_scraper import EastMoneyFundScraper
+
+
+def test_prices_and_latest_dates(tmp_path):
+    history = HistoryDatabase(str(tmp_path / "history.sqlite3"))
+    history.add_prices("000001", {"2022-12-01": "1.0", "暂无数据": ""})
+    history.add_prices("000001", {"2022-12-02": "1.1", "2022-12-01": "1.05"})
+    history.close()
+
+    # the rows survive a restart
+    history = HistoryDatabase(str(tmp_path / "history.sqlite3"))
+    assert history.prices(["000001", "000002"]) == {
+        "000001": {"2022-12-02": "1.1", "2022-12-01": "1.05"},
+        "000002": {},
+    }
+    assert history.latest_dates(["000001", "000002"]) == {"000001": "2022-12-02"}
+
+
+def test_ranking_snapshots(tmp_path):
+    history = HistoryDatabase(str(tmp_path / "history.sqlite3"))
+    history.add_ranking("000001", ["2022-12-01", "1.0", "1%", "2%"])
+    history.add_ranking("000001", ["2022-12-02", "1.1", "10%", "3%"])
+
+    assert history.ranking("000001") == ["2022-12-02", "1.1", "10%", "3%"]
+    assert history.ranking("000001", "2022-12-01")[2] == "1%"
+    assert history.ranking("000002") is None
+
+
+def test_scraper_only_asks_for_new_dates(tmp_path, callback):
+    history = HistoryDatabase(str(tmp_path / "history.sqlite3"))
+    history.add_prices("000001", {"2022-12-02": "1.1", "2022-12-01": "1.0"})
+    history.add_prices("000002", {"2022-12-02": "2.0"})
+    scraper = EastMoneyFundScraper(history=history)
+
+    missing_funds = {
+        "000001": {"column": 3, "missing-dates": [(9, "2022-12-02")]},
+        "000002": {"column": 4, "missing-dates": [(9, "2022-12-05")]},
+        "000003": {"column": 5, "missing-dates": [(9, "2022-12-05")]},
+    }
+    to_scrape = scraper.load_history(missing_funds, progress_callback=callback)
+
+    assert list(to_scrape) == ["000002", "000003"]
+    assert scraper.data["funds"].get("000001", "2022-12-02") == 1.1
+    assert scraper.funds_url("000002").endswith("jjjz_000002.html?startDate=2022-12-02")
+    assert scraper.funds_url("000003").endswith("jjjz_000003.html")
@@ -0,0 +1,104 @@
+import json
+from bs4 import BeautifulSoup
+
+from src.workers.http_fetcher import EastMoneyHttpFetcher
+from src.workers.page_cache import PageCache
+
+
+def test_supports_only_static_pages():
+    fetcher = EastMoneyHttpFetcher()
+    assert fetcher.supports("http://fundf10.eastmoney.com/jjjz_000001.html")
+    assert fetcher.supports("http://fundf10.eastmoney.com/jdzf_000001.html")
+    assert not fetcher.supports(
+        "http://fund.eastmoney.com/data/fundranking.html#thh;c0;r;sjnzf;pn50"
+    )
+
+
+def test_funds_page_is_rebuilt_as_lsjz_table(monkeypatch):
+    fetcher = EastMoneyHttpFetcher()
+    body = {
+        "Data": {
+            "LSJZList": [
+                {"FSRQ": "2021-07-21", "DWJZ": "1.2345", "LJJZ": "2.0", "JZZZL": "0.5"},
+                {
+                    "FSRQ": "2021-07-20",
+                    "DWJZ": "1.2000",
+                    "LJJZ": "1.9",
+                    "JZZZL": "-0.1",
+                },
+            ]
+        }
+    }
+    monkeypatch.setattr(
+        fetcher, "_get_text", lambda url, params=None, cache_key=None: json.dumps(body)
+    )
+
+    page = fetcher.fetch_page("http://fundf10.eastmoney.com/jjjz_000001.html")
+    rows = (
+        BeautifulSoup(page, "html.parser")
+        .find("table", {"class": "lsjz"})
+        .find("tbody")
+        .find_all("tr")
+    )
+
+    assert [[td.text for td in row.find_all("td")][:2] for row in rows] == [
+        ["2021-07-21", "1.2345"],
+        ["2021-07-20", "1.2000"],
+    ]
+
+
+def test_ranking_page_gets_archive_table(monkeypatch):
+    fetcher = EastMoneyHttpFetcher()
+    page = '<html><div class="bs_jz"></div><div id="jdzftable"></div></html>'
+    archive = (
+        'var apidata={ content:"<div class=\\"jdzfnew\\"><ul><li>a</li></ul></div>"};'
+    )
+    monkeypatch.setattr(
+        fetcher,
+        "_get_text",
+        lambda url, params=None, cache_key=None: archive if params else page,
+    )
+
+    result = fetcher.fetch_page("http://fundf10.eastmoney.com/jdzf_000001.html")
+    soup = BeautifulSoup(result, "html.parser")
+
+    assert soup.find("div", {"id": "jdzftable"}).find("div", {"class": "jdzfnew"})
+
+
+class Response:
+    def __init__(self, text, status_code=200, headers=None):
+        self.content = text.encode("utf-8")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+def test_ranking_page_is_cached_as_its_responses(tmp_path, monkeypatch):
+    cache = PageCache(str(tmp_path), ttls={"ranking": 0})
+    fetcher = EastMoneyHttpFetcher(page_cache=cache)
+    url = "http://fundf10.eastmoney.com/jdzf_000001.html"
+    page = '<html><div class="bs_jz"></div><div id="jdzftable"></div></html>'
+    archive = 'var apidata={ content:"<div class=\\"jdzfnew\\"></div>"};'
+    requests = []
+
+    def get(request_url, headers=None, timeout=None):
+        requests.append((request_url, headers))
+        if not request_url.startswith(url):
+            return Response(archive)
+        if headers:
+            return Response("", 304)
+        return Response(page, headers={"ETag": '"v1"'})
+
+    monkeypatch.setattr(fetcher.session, "get", get)
+    first = fetcher.fetch_page(url)
+    # the stale raw page is revalidated, and only gets its table once
+    second = fetcher.fetch_page(url)
+
+    assert first == second
+    assert second.count('id="jdzftable"') == 1
+    assert requests[2] == (url, {"If-None-Match": '"v1"'})
+
+    fetcher.invalidate(url)
+    assert len(cache) == 0
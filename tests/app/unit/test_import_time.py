@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+APP = os.path.join(os.path.dirname(__file__), "..", "..", "..", "app")
+HEAVY = ["selenium", "openpyxl", "bs4", "numpy", "requests", "lxml"]
+# microseconds, the names the gui imports at startup take a few ms
+BUDGET = 150_000
+
+
+def import_time(code: str) -> dict:
+    """<module>: (<name indented by its depth>, cumulative microseconds), by code"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (name, int(cumulative))
+    return modules
+
+
+def heavy(modules: dict) -> list:
+    return [name for name in modules if name.split(".")[0] in HEAVY]
+
+
+def test_workers_import_within_budget():
+    modules = import_time(
+        "import src.workers as w; w.PageCache, w.HistoryDatabase, w.FundNameCache,"
+        " w.JobJournal, w.ProgressChannel, w.ThreadFlag, w.instruments"
+    )
+    assert heavy(modules) == []
+    # the top level imports of src, the nested ones are in their cumulative time
+    total = sum(
+        cumulative
+        for name, cumulative in modules.values()
+        if name.startswith(" src") and not name.startswith("  ")
+    )
+    assert total < BUDGET, f"src imports took {total / 1000:.1f}ms"
+
+
+def test_heavy_modules_load_on_first_use():
+    modules = import_time("import src.workers as w; w.WorkbookManager")
+    assert "openpyxl" in modules
+    assert "selenium" not in modules
+
+    modules = import_time("import src.workers as w; w.warm_up()")
+    assert {"openpyxl", "bs4", "requests"} <= set(modules)
+    assert "selenium" not in modules
+
+
+def test_gui_import_loads_no_heavy_modules():
+    pytest.importorskip("PyQt5")
+    assert heavy(import_time("import src.gui")) == []
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from src.workers.instrumentation import Instrumentation
+
+
+def test_stages_are_aggregated(tmp_path):
+    instruments = Instrumentation(max_samples=100)
+    for i in range(1, 101):
+        instruments.record("fetch.http", i / 100)
+    instruments.count("pages.cached", 3)
+    instruments.count("pages.cached")
+
+    @instruments.timed("parse.funds")
+    def parse():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        parse()
+
+    stats = instruments.stats()
+    assert stats["fetch.http"] == {
+        "count": 100,
+        "total": 50.5,
+        "p50": 0.5,
+        "p95": 0.95,
+        "max": 1.0,
+    }
+    # a span that raised is still timed
+    assert stats["parse.funds"]["count"] == 1
+
+    path = tmp_path / "logs" / "stats.json"
+    instruments.write_summary(str(path))
+    summary = json.loads(path.read_text(encoding="utf-8"))
+    assert summary["counters"] == {"pages.cached": 4}
+    assert summary["stages"]["fetch.http"]["p95"] == 0.95
+
+    instruments.reset()
+    assert instruments.stats() == {}
@@ -0,0 +1,35 @@
+from src.workers.job_journal import JobJournal
+from src.workers.price_store import FundPriceStore
+
+
+class FakeScraper:
+    def __init__(self):
+        self.data = {"funds": FundPriceStore(), "ranking": {}, "top": []}
+
+
+def test_journal_is_loaded_back_after_a_crash(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = JobJournal(path)
+    journal.begin("FundsBook.xlsx", {"funds": True, "rankings": False, "top": True})
+    journal.record_sheet("top50混合", [("000001", "基金一"), ("000002", "基金二")])
+    journal.record_funds("000003", {"2022-12-30": "1.2340", "2022-12-29": "--"})
+    journal.record_ranking("000001", ["2022-12-30", "1.5", "0.1%"])
+    # the last record was cut off by the crash
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"type": "ranking", "id": "0000')
+
+    resumed = JobJournal(path)
+    assert resumed.resumable() and resumed.load()
+    assert resumed.workbook == "FundsBook.xlsx"
+    assert resumed.options["top"]
+    assert resumed.top == {"top50混合": [["000001", "基金一"], ["000002", "基金二"]]}
+    assert list(resumed.ranking) == ["000001"]
+
+    scraper = FakeScraper()
+    resumed.restore(scraper)
+    assert scraper.data["funds"].get("000003", "2022-12-30") == 1.234
+    assert scraper.data["funds"].get("000003", "2022-12-29") == "--"
+    assert scraper.data["ranking"]["000001"][1] == "1.5"
+
+    resumed.finish()
+    assert not resumed.resumable() and not resumed.load()
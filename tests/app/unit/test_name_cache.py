@@ -0,0 +1,79 @@
+from src.workers.name_cache import FundNameCache
+
+
+def test_names_are_fetched_once_and_saved(tmp_path, monkeypatch):
+    path = str(tmp_path / "names.json")
+    cache = FundNameCache(path)
+    fetched = []
+
+    def fetch(id):
+        fetched.append(id)
+        return cache.not_found if id == "000003" else f"基金{id}"
+
+    monkeypatch.setattr(cache, "fetch", fetch)
+    cache.update([("000001", "已知基金")])
+
+    names = cache.fetch_many(["000001", "000002", "000002", "000003"])
+    assert names == {"000002": "基金000002", "000003": "Not found"}
+    assert sorted(fetched) == ["000002", "000003"]
+
+    # the names survive a restart, the failed lookup is tried again
+    restarted = FundNameCache(path)
+    assert restarted.get("000001") == "已知基金"
+    assert restarted.get(2) is None
+    assert restarted.get("000002") == "基金000002"
+    assert restarted.missing(["000001", "000003"]) == ["000003"]
+
+
+def test_expired_names_are_missing(tmp_path):
+    cache = FundNameCache(str(tmp_path / "names.json"), ttl_days=0)
+    cache.put("000001", "基金")
+
+    assert cache.get("000001") is None
+    assert cache.missing(["000001"]) == ["000001"]
+
+
+class Response:
+    def __init__(self, status_code, title):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = f"<html><head><title>{title}</title></head></html>".encode()
+
+
+class Limiter:
+    def __init__(self):
+        self.acquired = self.penalized = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+    def penalize(self):
+        self.penalized += 1
+
+
+def test_only_fund_pages_give_a_name(monkeypatch):
+    limiter = Limiter()
+    cache = FundNameCache(rate_limiter=limiter)
+    pages = {
+        "000001": Response(200, "华夏成长混合(000001)基金净值"),
+        "000002": Response(429, "Too Many Requests"),
+        "000003": Response(200, "访问受限"),
+    }
+    monkeypatch.setattr(cache, "_session", type("Session", (), {})())
+    cache.session.get = lambda url, timeout: pages[url.split("/")[-1][:6]]
+
+    names = cache.fetch_many(list(pages))
+    assert names == {
+        "000001": "华夏成长混合",
+        "000002": "Not found",
+        "000003": "Not found",
+    }
+    assert limiter.acquired == 3 and limiter.penalized == 1
+    assert cache.missing(pages) == ["000002", "000003"]
+
+
+def test_lookups_have_their_own_rate():
+    cache = FundNameCache.from_settings(
+        {"requestsPerSecond": 5, "requestBurst": 2}, "."
+    )
+    assert (cache.rate_limiter.rate, cache.rate_limiter.burst) == (5, 2)
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+from time import sleep
+
+from openpyxl import Workbook
+
+from src.workers.controller import TOP50_SHEETS
+from src.workers.name_cache import FundNameCache
+from src.workers.orchestrator import JobOrchestrator
+from src.workers.price_store import FundPriceStore
+
+
+class Flag:
+    flag = True
+
+
+class Cell:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeScraper:
+    """Every top50 page lists 000001 and the fund of its hash, ie. tgp"""
+
+    driver_pool_size = 4
+    http_fetcher = None
+
+    def __init__(self):
+        self.data = {"funds": FundPriceStore(), "ranking": {}, "top": []}
+        self.lock = threading.Lock()
+        self.fetched = []
+        self.running = 0
+        self.most_running = 0
+
+    def _fetch(self, url):
+        with self.lock:
+            self.fetched.append(url)
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        sleep(0.01)
+        with self.lock:
+            self.running -= 1
+
+    def load_history(self, missing_funds, progress_callback=None):
+        return missing_funds
+
+    def parse_funding_page(
+        self, id, progress_callback=None, progress_callback_num=None
+    ):
+        self._fetch(f"funds {id}")
+        self.data["funds"].merge(id, {"2022-12-30": "1.5"})
+        return True
+
+    def parse_ranking_page(self, id, progress_callback, progress_callback_num):
+        self._fetch(f"ranking {id}")
+        self.data["ranking"][id] = [id]
+        return True
+
+    def fetch_top(self, url, progress_callback=None, progress_callback_num=None):
+        self._fetch(url)
+        hash = next(hash for _, hash in TOP50_SHEETS if f"#{hash};" in url)
+        return [("000001", "基金一"), (hash, f"基金{hash}")]
+
+
+class FakeWorkbookManager:
+    """Records the calls made to the workbook and the thread they were made in"""
+
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+        self.name_cache = FundNameCache()
+
+    def _call(self, *call):
+        self.calls.append(call)
+        self.threads.add(threading.current_thread().name)
+
+    def read_funds(self, progress_callback=None, progress_callback_num=None):
+        self._call("read_funds")
+        self.missing_funds = {"100001": {}, "100002": {}}
+
+    def write_fund(self, id, funds_data, sheet="基金日记", progress_callback=None):
+        self._call("write_fund", id, funds_data.get(id, "2022-12-30"))
+        return 1
+
+    def read_rankings(self, progress_callback=None, progress_callback_num=None):
+        self._call("read_rankings")
+        self.ranking_ids = [Cell("000001"), Cell("000002")]
+
+    def write_rankings(
+        self,
+        ranking_data,
+        sheet="基金排队",
+        ids_override=None,
+        progress_callback=None,
+        progress_callback_num=None,
+    ):
+        ids = [a[0] for a in ids_override] if ids_override else ["000001", "000002"]
+        # every page of the sheet was fetched before it is written
+        assert all(id in ranking_data for id in ids)
+        self._call("write_rankings", sheet)
+
+
+def test_jobs_share_pages_and_write_from_one_thread(callback):
+    scraper = FakeScraper()
+    workbook_manager = FakeWorkbookManager()
+    orchestrator = JobOrchestrator(
+        scraper, workbook_manager, Flag(), callback, callback
+    )
+
+    assert asyncio.run(orchestrator.run(True, True, True, 50))
+
+    # 2 funds pages, 5 top pages and the 7 different ranking pages, once each
+    assert len(scraper.fetched) == len(set(scraper.fetched)) == 14
+    assert 1 < scraper.most_running <= 4
+    assert len(workbook_manager.threads) == 1
+    assert sorted(
+        call[1:] for call in workbook_manager.calls if call[0] == "write_fund"
+    ) == [
+        ("100001", 1.5),
+        ("100002", 1.5),
+    ]
+    assert sorted(
+        call[1] for call in workbook_manager.calls if call[0] == "write_rankings"
+    ) == sorted(["基金排队"] + [sheet for sheet, _ in TOP50_SHEETS])
+    assert workbook_manager.name_cache.get("tgp") == "基金tgp"
+
+
+class FailingTopScraper(FakeScraper):
+    """The top50股票 page fails, the other pages give full ranking rows"""
+
+    def fetch_top(self, url, progress_callback=None, progress_callback_num=None):
+        if "#tgp;" in url:
+            return None
+        return super().fetch_top(url, progress_callback, progress_callback_num)
+
+    def parse_ranking_page(self, id, progress_callback, progress_callback_num):
+        self._fetch(f"ranking {id}")
+        self.data["ranking"][id] = ["2022-12-02", "1.2340"] + ["0.52%"] * 10
+        return True
+
+
+def test_failed_top_page_leaves_its_sheet_alone(callback, manager):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet, _ in TOP50_SHEETS:
+        ws = wb.create_sheet(sheet)
+        ws["D1"] = "基金代码"
+        # a block written by an earlier run, 000001 is on every top50 page
+        ws["D2"] = "000001"
+        ws["E2"] = "旧名称"
+        ws["F2"] = "2022-11-01"
+    workbook_manager = manager(wb)
+    orchestrator = JobOrchestrator(
+        FailingTopScraper(), workbook_manager, Flag(), callback, callback
+    )
+
+    assert asyncio.run(orchestrator.run(False, False, True, 50))
+    failed = next(sheet for sheet, hash in TOP50_SHEETS if hash == "tgp")
+    assert list(workbook_manager._sheet(failed).values) == list(wb[failed].values)
+    assert "top50股票" not in workbook_manager.modified_sheets
+    assert workbook_manager._sheet("top50混合")["F2"].value == "2022-12-02"
+    assert f"[jobs] Failed to load the top50 page of {failed}, not written" in (
+        callback.messages
+    )
@@ -0,0 +1,59 @@
+import os
+
+from src.workers.page_cache import PageCache
+
+
+def test_put_and_get(tmp_path):
+    cache = PageCache(str(tmp_path))
+    url = "http://fundf10.eastmoney.com/jjjz_000001.html"
+    cache.put(url, "<html>基金</html>", etag='"abc"')
+
+    assert cache.get(url) == "<html>基金</html>"
+    assert cache.validators(url) == {"If-None-Match": '"abc"'}
+    # the index survives a restart once it is saved
+    cache.save()
+    assert PageCache(str(tmp_path)).get(url) == "<html>基金</html>"
+
+
+def test_stale_entries_are_not_returned(tmp_path):
+    cache = PageCache(str(tmp_path), ttls={"funds": 0})
+    url = "http://fundf10.eastmoney.com/jjjz_000001.html"
+    cache.put(url, "<html></html>", last_modified="Wed, 21 Jul 2021 07:28:00 GMT")
+
+    assert cache.get(url) is None
+    assert "If-Modified-Since" in cache.validators(url)
+    assert cache.revalidated(url) == "<html></html>"
+
+
+def test_same_body_is_stored_once(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("http://fundf10.eastmoney.com/jdzf_000001.html", "same")
+    cache.put("http://fundf10.eastmoney.com/jdzf_000002.html", "same")
+
+    assert len(os.listdir(cache.objects_directory)) == 1
+    cache.invalidate("http://fundf10.eastmoney.com/jdzf_000001.html")
+    assert cache.get("http://fundf10.eastmoney.com/jdzf_000002.html") == "same"
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = PageCache(str(tmp_path), max_bytes=25)
+    cache.put("http://a/jdzf_1.html", "a" * 10)
+    cache.put("http://a/jdzf_2.html", "b" * 10)
+    cache.get("http://a/jdzf_1.html")
+    cache.put("http://a/jdzf_3.html", "c" * 10)
+
+    assert cache.get("http://a/jdzf_2.html") is None
+    assert cache.get("http://a/jdzf_1.html") == "a" * 10
+    assert cache.get("http://a/jdzf_3.html") == "c" * 10
+
+
+def test_index_is_written_in_batches(tmp_path):
+    cache = PageCache(str(tmp_path), save_every=3)
+    cache.put("http://a/jdzf_1.html", "a")
+    cache.put("http://a/jdzf_2.html", "b")
+    assert len(PageCache(str(tmp_path))) == 0
+
+    cache.put("http://a/jdzf_3.html", "c")
+    assert len(PageCache(str(tmp_path))) == 3
+    cache.put("http://a/jdzf_3.html", "d")
+    assert cache.total == 3 and len(os.listdir(cache.objects_directory)) == 3
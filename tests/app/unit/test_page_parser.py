@@ -0,0 +1,96 @@
+import os
+import pytest
+from bs4 import BeautifulSoup
+
+from src.workers import page_parser
+
+PAGES = os.path.join(os.path.dirname(__file__), "..", "fixtures", "pages")
+
+
+def read_page(name):
+    with open(os.path.join(PAGES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def soup_prices(html):
+    """The full-tree BeautifulSoup parse the scraper used before"""
+    prices = {}
+    table = BeautifulSoup(html, "html.parser").find("table", {"class": "lsjz"})
+    for row in table.find("tbody").find_all("tr"):
+        attr = row.find_all("td")
+        prices[attr[0].text.strip()] = attr[1].text.strip()
+    return prices
+
+
+def soup_ranking(html):
+    soup = BeautifulSoup(html, "html.parser")
+    label = (
+        soup.find("div", {"class": "bs_jz"})
+        .find("div", {"class": "col-right"})
+        .find("p", {"class": "row1"})
+        .find_all("label")[1]
+    )
+    label_texts = [s.strip() for s in label.text.strip().split("\n")]
+    date = label_texts[0]
+    prices = label_texts[2].split(" ( ")
+    data = [date[date.find("（") + 1 : date.find("）")], prices[0], prices[1].strip(" )")]
+    table = (
+        soup.find("div", {"id": "jdzftable"})
+        .find("div", {"class": "jdzfnew"})
+        .find_all("ul")
+    )
+    return data + [ul.find_all("li")[1].text.strip() for ul in table[1:-1]]
+
+
+def soup_top(html):
+    body = (
+        BeautifulSoup(html, "html.parser")
+        .find("table", {"id": "dbtable"})
+        .find("tbody")
+    )
+    return [
+        [cols[2].find("a").text.strip(), cols[3].find("a").get("title")]
+        for cols in (row.find_all("td") for row in body.find_all("tr"))
+    ]
+
+
+@pytest.fixture(params=["lxml", "html.parser"])
+def parser_backend(request, monkeypatch):
+    if request.param == "html.parser":
+        monkeypatch.setattr(page_parser, "lxml_html", None)
+    elif page_parser.lxml_html is None:
+        pytest.skip("lxml is not installed")
+
+
+def test_parse_prices(parser_backend):
+    html = read_page("jjjz_000001.html")
+    prices = page_parser.parse_prices(html)
+    assert len(prices) == 20
+    assert prices == soup_prices(html)
+
+
+def test_parse_ranking(parser_backend):
+    html = read_page("jdzf_000001.html")
+    ranking = page_parser.parse_ranking(html)
+    assert ranking[:3] == ["2021-07-21", "1.2345", "0.52%"]
+    assert ranking == soup_ranking(html)
+
+
+def test_parse_top(parser_backend):
+    html = read_page("fundranking_thh.html")
+    top = page_parser.parse_top(html)
+    assert len(top) == 50
+    assert top == soup_top(html)
+
+
+def test_missing_table_raises(parser_backend):
+    with pytest.raises(Exception):
+        page_parser.parse_prices("<html><body>blocked</body></html>")
+
+
+def test_extract_nested_element():
+    html = '<div id="jdzftable"><div class="a"><div></div></div></div><div>after</div>'
+    assert (
+        page_parser.extract_element(html, page_parser.jdzf_div, "div")
+        == '<div id="jdzftable"><div class="a"><div></div></div></div>'
+    )
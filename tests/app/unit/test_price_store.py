@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.workers.price_store import FundPriceStore
+
+
+def test_merge_new_prices_win():
+    store = FundPriceStore()
+    store.merge("000001", {"2022-12-02": "1.0000", "2022-12-01": "0.9000"})
+    store.merge("000001", {"2022-12-05": "1.1000", "2022-12-02": "1.0500"})
+
+    assert store.get("000001", "2022-12-02") == 1.05
+    assert store.get("000001", "2022-12-01") == 0.9
+    assert store.latest_date("000001") == "2022-12-05"
+
+
+def test_lookup_many_dates():
+    store = FundPriceStore.from_dict(
+        {"000001": {"2022-12-02": "1.0000", "2022-12-01": "0.9000"}}
+    )
+    prices = store.lookup("000001", ["2022-12-01", "2022-11-30", "2022-12-02"])
+    assert prices[0] == 0.9 and np.isnan(prices[1]) and prices[2] == 1.0
+    assert np.isnan(store.lookup("999999", ["2022-12-01"])).all()
+
+
+def test_text_values_and_invalid_dates():
+    store = FundPriceStore()
+    store.merge("000001", {"2022-12-02": "--", "2022-12-01": "1.2", "暂无数据": ""})
+
+    assert store.get("000001", "2022-12-02") == "--"
+    assert store.get("000001", "2022-12-03", default="missing") == "missing"
+    assert store.to_dict() == {"000001": {"2022-12-02": "--", "2022-12-01": "1.2"}}
+
+
+def test_to_dict_round_trip():
+    data = {
+        "000001": {"2022-12-02": "1.0520", "2022-12-01": "1.0400"},
+        "000002": {"2022-12-02": "2.31"},
+    }
+    assert FundPriceStore.from_dict(data).to_dict() == data
@@ -0,0 +1,36 @@
+from src.workers.progress import ProgressChannel, report
+
+
+def test_channel_coalesces_a_frame():
+    channel = ProgressChannel(max_lines=3, max_length=20)
+    assert channel.drain() is None
+
+    channel.emit("PROG:FUNDS SHEET")
+    channel.counter.emit(10)
+    for i in range(5):
+        report(channel, "funds", f"fund {i}", fund_id=f"{i:06d}", count=30)
+        channel.counter.emit(-1)
+    channel.emit("PROG:RANKINGS")
+    channel.emit("x" * 100)
+
+    batch = channel.drain()
+    assert batch["label"] == "RANKINGS"
+    assert (batch["total"], batch["steps"]) == (10, 5)
+    assert batch["events"] == {"funds": 5}
+    # only the last lines are kept, cut to max_length
+    assert batch["lines"] == [
+        "... 3 messages skipped",
+        "fund 3",
+        "fund 4",
+        "x" * 20 + " ...",
+    ]
+    assert batch["status"] == "x" * 20 + " ..."
+
+    channel.counter.emit(-1)
+    assert channel.drain()["steps"] == 1
+    assert channel.drain() is None
+
+
+def test_report_falls_back_to_emit(callback):
+    report(callback, "page", "[get page] Page a was loaded", duration=1.23456)
+    assert callback.messages == ["[get page] Page a was loaded in 1.235 seconds"]
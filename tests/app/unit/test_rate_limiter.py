@@ -0,0 +1,33 @@
+from time import monotonic
+
+from src.workers.rate_limiter import TokenBucketRateLimiter
+
+
+def test_burst_does_not_wait():
+    limiter = TokenBucketRateLimiter(rate=1, burst=3)
+    t = monotonic()
+    assert [limiter.acquire() for _ in range(3)] == [0, 0, 0]
+    assert monotonic() - t < 0.1
+
+
+def test_waits_when_budget_runs_out():
+    limiter = TokenBucketRateLimiter(rate=20, burst=1)
+    limiter.acquire()
+    assert limiter.acquire() > 0
+
+
+def test_penalize_and_reward():
+    limiter = TokenBucketRateLimiter(rate=1, burst=1, min_rate=0.3)
+    limiter.penalize()
+    assert limiter.rate == 0.5
+    limiter.penalize()
+    limiter.penalize()
+    assert limiter.rate == 0.3
+    for _ in range(50):
+        limiter.reward()
+    assert limiter.rate == 1
+
+
+def test_no_rate_is_unlimited():
+    limiter = TokenBucketRateLimiter(rate=0)
+    assert all(limiter.acquire() == 0 for _ in range(100))
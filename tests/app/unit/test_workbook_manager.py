@@ -0,0 +1,342 @@
+import zipfile
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.formula.translate import Translator
+
+from src.workers.workbook_manager import WorkbookManager
+
+
+def reference_missing_price_funds(ws, price_columns):
+    """The cell by cell scan the vectorized one replaces"""
+    missing_price_funds = {}
+    for id, col in price_columns.items():
+        if id == "000000":
+            continue
+        current, current_row = None, 9
+        while current is None or current == "":
+            current = ws.cell(row=current_row, column=col).value
+            current_row += 1
+        missing_price_funds[id] = {"column": col, "missing-dates": []}
+        current_row -= 1
+        while ws.cell(row=current_row, column=1).value is not None:
+            missing_price_funds[id]["missing-dates"].append(
+                (
+                    current_row,
+                    ws.cell(row=current_row, column=1).value.strftime("%Y-%m-%d"),
+                )
+            )
+            current_row -= 1
+    return missing_price_funds
+
+
+def test_read_funds_matches_cell_by_cell_scan(callback, funds_sheet, manager):
+    for seed in range(5):
+        wb = funds_sheet(seed=seed)
+        workbook_manager = manager(wb)
+        assert workbook_manager.read_funds(progress_callback=callback)
+
+        ws = wb["基金日记"]
+        price_columns = {
+            ws.cell(row=1, column=c).value: c
+            for c in range(1, ws.max_column + 1)
+            if ws.cell(row=1, column=c).value is not None
+        }
+        assert workbook_manager.missing_funds == reference_missing_price_funds(
+            ws, price_columns
+        )
+
+
+def test_fund_without_prices_has_no_missing_dates(callback, funds_sheet, manager):
+    wb = funds_sheet(n_funds=2)
+    ws = wb["基金日记"]
+    ws.cell(row=1, column=10).value = "999999"
+
+    workbook_manager = manager(wb)
+    assert workbook_manager.read_funds(progress_callback=callback)
+    assert workbook_manager.missing_funds["999999"] == {
+        "column": 10,
+        "missing-dates": [],
+    }
+
+
+def test_sheet_without_price_rows_has_no_missing_dates(callback, funds_sheet, manager):
+    wb = funds_sheet(n_funds=2, n_rows=0)
+
+    workbook_manager = manager(wb)
+    assert workbook_manager.read_funds(progress_callback=callback)
+    assert workbook_manager.missing_funds == {
+        "000001": {"column": 3, "missing-dates": []},
+        "000002": {"column": 4, "missing-dates": []},
+    }
+
+
+RANKING = ["2022-12-02", "1.2340", "0.52%", "1.10%", "--", "-3.20%"]
+
+
+def test_write_rankings_converts_each_row_once(callback, manager):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "基金排队"
+    ws.cell(row=3, column=4).value = "000001"
+    ws.cell(row=4, column=4).value = "=D3"
+    ws.cell(row=5, column=4).value = "000002"
+
+    workbook_manager = manager(wb)
+    names, prefetched = [], []
+    workbook_manager._get_name_from_id = lambda id: names.append(id) or "基金"
+    workbook_manager.prefetch_names = lambda ids, _: prefetched.extend(ids)
+    assert workbook_manager.write_rankings(
+        {"000001": RANKING, "000002": RANKING[:2]}, progress_callback=callback
+    )
+
+    assert names == ["000001", "000002"]
+    assert prefetched == ["000001", "000002"]
+    ws = workbook_manager._sheet("基金排队")
+    row = [ws.cell(row=3, column=c) for c in range(6, 12)]
+    assert [cell.value for cell in row] == [
+        "2022-12-02",
+        1.234,
+        0.52 / 100,
+        1.10 / 100,
+        "--",
+        -3.20 / 100,
+    ]
+    assert [cell.style for cell in row[2:4]] == ["Percent", "Percent"]
+    assert {cell.number_format for cell in (row[2], row[3], row[5])} == {"0.00%"}
+    assert row[1].number_format == "General"
+    assert ws.cell(row=3, column=5).value.endswith('"基金")')
+    assert ws.cell(row=5, column=8).value is None
+
+
+def test_write_rankings_top_sheet(callback, manager):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "top50混合"
+    ws.cell(row=1, column=4).value = "基金代码"
+
+    workbook_manager = manager(wb)
+    assert workbook_manager.write_rankings(
+        {"000001": RANKING},
+        "top50混合",
+        [("000001", "基金"), ("000002", "基金2")],
+        progress_callback=callback,
+    )
+
+    ws = workbook_manager._sheet("top50混合")
+    assert ws.cell(row=2, column=4).value == "000001"
+    assert ws.cell(row=2, column=7).value == 1.234
+    assert ws.cell(row=2, column=7).number_format == "0.0000"
+    assert ws.cell(row=2, column=8).number_format == "0.00%"
+    assert ws.cell(row=3, column=4).value == "000002"
+    assert ws.cell(row=3, column=6).value is None
+
+
+def test_read_funds_streams_the_saved_workbook(
+    tmp_path, callback, funds_sheet, manager
+):
+    path = str(tmp_path / "FundsBook.xlsx")
+    wb = funds_sheet()
+    wb.create_sheet("基金排队")["D3"] = "000001"
+    wb.save(path)
+
+    workbook_manager = WorkbookManager(path)
+    assert workbook_manager.read_funds(progress_callback=callback)
+    assert workbook_manager.read_rankings(progress_callback=callback)
+    # only the read_only workbook was needed so far
+    assert workbook_manager._wb is None
+
+    expected = manager(funds_sheet(), "expected.xlsx")
+    expected.read_funds(progress_callback=callback)
+    assert workbook_manager.missing_funds == expected.missing_funds
+    assert [cell.value for cell in workbook_manager.ranking_ids] == ["000001"]
+
+    missing_dates = expected.missing_funds["000001"]["missing-dates"]
+    funds_data = {"000001": {date: 9.5 for _, date in missing_dates}}
+    assert workbook_manager.write_funds(funds_data, progress_callback=callback)
+    workbook_manager.close()
+
+    (row, _) = missing_dates[0]
+    assert load_workbook(path)["基金日记"].cell(row=row, column=3).value == 9.5
+
+
+def test_nothing_missing_skips_loading_and_saving(tmp_path, callback, funds_sheet):
+    path = str(tmp_path / "FundsBook.xlsx")
+    wb = funds_sheet(n_funds=2)
+    for c in (3, 4):
+        wb["基金日记"].cell(row=9, column=c).value = 1.0
+    wb.save(path)
+    with open(path, "rb") as f:
+        before = f.read()
+
+    workbook_manager = WorkbookManager(path)
+    assert workbook_manager.read_funds(progress_callback=callback)
+    # the newest prices are the same as the ones already in the sheet
+    funds_data = {"000001": {"2022-12-30": 1.0}, "000002": {"2022-12-30": 1.0}}
+    assert workbook_manager.write_funds(funds_data, progress_callback=callback)
+    workbook_manager.close()
+
+    assert workbook_manager._wb is None
+    with open(path, "rb") as f:
+        assert f.read() == before
+
+
+def lazy_workbook(path, funds_sheet):
+    wb = funds_sheet()
+    rankings = wb.create_sheet("基金排队")
+    rankings["D3"] = "000001"
+    rankings["E3"] = "基金"
+    wb.create_sheet("历史日记")["B2"] = 3.5
+    wb.save(path)
+    return wb
+
+
+def test_only_the_written_sheet_is_parsed(tmp_path, callback, funds_sheet):
+    path = str(tmp_path / "FundsBook.xlsx")
+    lazy_workbook(path, funds_sheet)
+    with zipfile.ZipFile(path) as archive:
+        before = archive.read("xl/worksheets/sheet2.xml")
+
+    workbook_manager = WorkbookManager(path)
+    assert workbook_manager.read_funds(progress_callback=callback)
+    missing_dates = workbook_manager.missing_funds["000001"]["missing-dates"]
+    funds_data = {"000001": {date: 9.5 for _, date in missing_dates}}
+    assert workbook_manager.write_funds(funds_data, progress_callback=callback)
+    assert set(workbook_manager._lazy.unparsed) == {"基金排队", "历史日记"}
+    assert workbook_manager.wb.sheetnames == ["基金日记", "基金排队", "历史日记"]
+    workbook_manager.close()
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.read("xl/worksheets/sheet2.xml") == before
+    wb = load_workbook(path)
+    assert wb["基金日记"].cell(row=missing_dates[0][0], column=3).value == 9.5
+    assert wb["基金排队"]["E3"].value == "基金"
+
+
+def test_full_save_parses_every_sheet(tmp_path, funds_sheet):
+    path = str(tmp_path / "FundsBook.xlsx")
+    lazy_workbook(path, funds_sheet)
+
+    workbook_manager = WorkbookManager(path, incremental_save=False)
+    workbook_manager._edit_sheet("基金日记")["B3"] = "买入"
+    workbook_manager.close()
+
+    wb = load_workbook(path)
+    assert wb.sheetnames == ["基金日记", "基金排队", "历史日记"]
+    assert wb["基金日记"]["B3"].value == "买入"
+    assert wb["基金排队"]["E3"].value == "基金"
+    assert wb["历史日记"]["B2"].value == 3.5
+
+
+def test_append_layout_never_moves_history(callback, manager):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "top50混合"
+    ws.cell(row=1, column=4).value = "基金代码"
+
+    workbook_manager = manager(wb, top_layout="append")
+    for date in ("2022-12-01", "2022-12-02"):
+        ranking = {"000001": [date] + RANKING[1:], "000002": [date] + RANKING[1:]}
+        assert workbook_manager.write_rankings(
+            ranking,
+            "top50混合",
+            [("000001", "基金"), ("000002", "基金2")],
+            progress_callback=callback,
+        )
+
+    # the first block stayed in place, without its live columns
+    ws = workbook_manager._sheet("top50混合")
+    assert ws.cell(row=2, column=4).value == "000001"
+    assert ws.cell(row=2, column=6).value == "2022-12-01"
+    assert ws.cell(row=2, column=1).value == ""
+    assert ws.cell(row=2, column=2).value == "new"
+
+    # the new block is under it, and compares the rankings with the first block
+    assert ws.cell(row=53, column=4).value == "基金代码"
+    assert ws.cell(row=54, column=4).value == "000001"
+    assert ws.cell(row=54, column=6).value == "2022-12-02"
+    assert ws.cell(row=54, column=3).value == 1
+    assert ws.cell(row=103, column=3).value == 50
+    assert ws.cell(row=55, column=2).value.startswith(
+        "=IFERROR((INDEX(C2:C51,MATCH(D55,D2:D51,FALSE),1)-C55)"
+    )
+    assert ws.cell(row=54, column=1).value.startswith("=IFERROR(IF(MATCH(D54,")
+    assert "$D$54:$D$103" in ws.cell(row=54, column=28).value
+    assert ws.cell(row=54, column=18).number_format == "#,##0.0000￥"
+    assert ws.cell(row=103, column=18).font.size == 9
+
+
+def test_new_funds_column_copies_the_last_block(manager):
+    wb = Workbook()
+    ws = wb.active
+    for col in range(1, 17):
+        ws.cell(row=1, column=col).value = f"h{col}"
+        for row in range(2, 40):
+            if col % 3:
+                ws.cell(row=row, column=col).value = f"=A{row}*$B$1+K{row - 1}"
+            else:
+                ws.cell(row=row, column=col).value = row * 1.5
+    ws.cell(row=20, column=12).value = "=SUM(A1:A19)"
+
+    expected = {}
+    for col in range(9, 17):
+        for row in range(2, 40):
+            value = ws.cell(row=row, column=col).value
+            if isinstance(value, str):
+                value = Translator(value, f"A{row}").translate_formula(col_delta=8)
+            expected[(row, col + 8)] = value
+
+    workbook_manager = manager(wb)
+    workbook_manager._get_name_from_id = lambda id: "基金"
+    ws = workbook_manager._edit_sheet(ws.title)
+    # the new fund takes the place of the template block, which moves right
+    assert workbook_manager._create_new_funds_column("000009", ws) == 12
+
+    for (row, col), value in expected.items():
+        assert ws.cell(row=row, column=col).value == value
+    assert ws.cell(row=1, column=12).value == "000009"
+    assert ws.cell(row=5, column=24).fill.fgColor.rgb == "00FFF2CC"
+
+
+def buy_sheet():
+    """A 基金日记 sheet with a fund block and the blank template block on the right"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "基金日记"
+    ws.cell(row=1, column=12).value = "000001"
+    ws.cell(row=1, column=20).value = "000000"
+    for row in range(9, 30):
+        date = datetime(2022, 12, 30) - timedelta(days=row - 9)
+        ws.cell(row=row, column=11).value = date
+        ws.cell(row=row, column=24).value = f"=X{row + 1}"
+    return wb
+
+
+def test_buy_funds_batch_uses_the_indexes(callback, manager):
+    workbook_manager = manager(buy_sheet())
+    workbook_manager._get_name_from_id = lambda id: "基金"
+
+    assert workbook_manager.buy_funds_batch(
+        [
+            ("000001", "100", "2022-12-30"),
+            ("000001", "50.5", "2022-12-28"),
+            ("000002", "10", "2022-12-29"),
+            ("000002", "20", "2022-12-27"),
+        ],
+        progress_callback=callback,
+    )
+    ws = workbook_manager._sheet("基金日记")
+    assert ws.cell(row=9, column=9).value == 100.0
+    assert ws.cell(row=11, column=9).value == 50.5
+
+    # 000002 took the place of the template, which moved 8 columns right
+    columns = workbook_manager.sheet_indexes["基金日记"]["columns"]
+    assert ws.cell(row=1, column=20).value == "000002"
+    assert ws.cell(row=1, column=28).value == "000000"
+    assert (columns["000002"], columns["000000"]) == (20, 28)
+    assert ws.cell(row=10, column=17).value == 10.0
+    assert ws.cell(row=12, column=17).value == 20.0
+
+    assert not workbook_manager.buy_funds_batch(
+        [("000001", "1", "2021-01-01")], progress_callback=callback
+    )
@@ -0,0 +1,103 @@
+import re
+import zipfile
+from datetime import datetime
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font
+
+from src.workers.workbook_package import save_changed_sheets
+
+
+def with_shared_strings(path):
+    """Rewrites the inline strings of an openpyxl package as shared strings, like Excel"""
+    with zipfile.ZipFile(path) as archive:
+        members = {info.filename: archive.read(info) for info in archive.infolist()}
+
+    strings = []
+
+    def shared(match):
+        strings.append(match.group(3))
+        return f'<c r="{match.group(1)}"{match.group(2) or ""} t="s"><v>{len(strings) - 1}</v></c>'
+
+    inline = re.compile(
+        r'<c r="(\w+)"( s="\d+")? t="inlineStr"><is><t>(.*?)</t></is></c>'
+    )
+    for name in list(members):
+        if name.startswith("xl/worksheets/sheet"):
+            xml = inline.sub(shared, members[name].decode("utf-8"))
+            members[name] = xml.encode("utf-8")
+
+    sst = "".join(f"<si><t>{s}</t></si>" for s in strings)
+    members["xl/sharedStrings.xml"] = (
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        f'uniqueCount="{len(strings)}">{sst}</sst>'
+    ).encode("utf-8")
+    members["[Content_Types].xml"] = members["[Content_Types].xml"].replace(
+        b"</Types>",
+        b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+        b'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>',
+    )
+    members["xl/_rels/workbook.xml.rels"] = members[
+        "xl/_rels/workbook.xml.rels"
+    ].replace(
+        b"</Relationships>",
+        b'<Relationship Id="rId99" Type="http://schemas.openxmlformats.org/'
+        b'officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+        b"</Relationships>",
+    )
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+
+
+def workbook(path):
+    wb = Workbook()
+    funds = wb.active
+    funds.title = "基金日记"
+    funds["A1"] = "日期"
+    funds["A9"] = datetime(2022, 12, 2)
+    funds["C1"] = "000001"
+    rankings = wb.create_sheet("基金排队")
+    rankings["D3"] = "000001"
+    rankings["E3"] = "基金"
+    rankings["E3"].font = Font(bold=True, color="0000ff")
+    rankings["F3"] = "=D3"
+    wb.save(path)
+    with_shared_strings(path)
+
+
+def test_only_the_changed_sheet_is_written(tmp_path):
+    path = str(tmp_path / "FundsBook.xlsx")
+    workbook(path)
+    with zipfile.ZipFile(path) as archive:
+        before = {info.filename: archive.read(info) for info in archive.infolist()}
+
+    wb = load_workbook(path)
+    wb["基金日记"]["C9"] = 1.2345
+    wb["基金日记"]["D9"] = "新的"
+    wb["基金日记"]["C9"].style = "Percent"
+    assert save_changed_sheets(wb, path, path, {"基金日记"})
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        after = {info.filename: archive.read(info) for info in archive.infolist()}
+    assert after["xl/worksheets/sheet2.xml"] == before["xl/worksheets/sheet2.xml"]
+    assert after["xl/worksheets/sheet1.xml"] != before["xl/worksheets/sheet1.xml"]
+
+    wb = load_workbook(path)
+    assert wb["基金日记"]["C9"].value == 1.2345
+    assert wb["基金日记"]["C9"].style == "Percent"
+    assert wb["基金日记"]["D9"].value == "新的"
+    assert wb["基金日记"]["C1"].value == "000001"
+    assert wb["基金排队"]["E3"].value == "基金"
+    assert wb["基金排队"]["E3"].font.bold
+    assert wb["基金排队"]["F3"].value == "=D3"
+
+
+def test_new_sheets_need_a_full_save(tmp_path):
+    path = str(tmp_path / "FundsBook.xlsx")
+    workbook(path)
+    wb = load_workbook(path)
+    wb.create_sheet("new")
+    assert not save_changed_sheets(wb, path, path, {"基金日记"})